@@ -0,0 +1,54 @@
+# Weekly availability as bitmasks: bit n of a day's mask is the hour n:00-(n+1):00.
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# VolunteerProfile column holding the hour mask of every day
+AVAILABILITY_FIELDS = {day: f"availability_{day.lower()}" for day in DAYS}
+
+
+def _parse_time(value):
+    hour, minute = map(int, value.split(":"))
+    if (hour, minute) == (24, 0):
+        return 24 * 60
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(value)
+    return hour * 60 + minute
+
+
+def hour_mask(time_range, whole_hours=False):
+    """
+    Return the mask of the hours a 'HH:MM-HH:MM' range covers, 0 if the range is invalid.
+
+    With `whole_hours` only the hours lying completely inside the range count (what a
+    volunteer can be booked for), otherwise every hour the range touches (what a task needs).
+    An end of '00:00' or '24:00' means midnight at the end of the day.
+    """
+    try:
+        start, end = (_parse_time(part.strip()) for part in time_range.split("-"))
+    except (ValueError, AttributeError):
+        return 0
+    if end == 0:
+        end = 24 * 60
+    if whole_hours:
+        first, last = -(-start // 60), end // 60 - 1
+    else:
+        first, last = start // 60, -(-end // 60) - 1
+    if last < first:
+        return 0
+    return ((1 << (last + 1)) - 1) ^ ((1 << first) - 1)
+
+
+def schedule_masks(schedule):
+    """
+    Compile a schedule ({'Monday': ['14:00-16:00'], ...}) into {day: hour mask} for all seven days.
+    Unknown days and invalid ranges are ignored.
+    """
+    masks = dict.fromkeys(DAYS, 0)
+    if not isinstance(schedule, dict):
+        return masks
+    for day, time_ranges in schedule.items():
+        if day not in masks or not isinstance(time_ranges, list):
+            continue
+        for time_range in time_ranges:
+            masks[day] |= hour_mask(time_range, whole_hours=True)
+    return masks
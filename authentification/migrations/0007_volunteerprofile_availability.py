@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+# Frozen copy of authentification.availability as of this migration, so later changes to it
+# do not change what the migration does
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+AVAILABILITY_FIELDS = {day: f"availability_{day.lower()}" for day in DAYS}
+
+
+def _parse_time(value):
+    hour, minute = map(int, value.split(":"))
+    if (hour, minute) == (24, 0):
+        return 24 * 60
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(value)
+    return hour * 60 + minute
+
+
+def _whole_hours_mask(time_range):
+    # Hours lying completely inside a 'HH:MM-HH:MM' range, 0 if the range is invalid
+    try:
+        start, end = (_parse_time(part.strip()) for part in time_range.split("-"))
+    except (ValueError, AttributeError):
+        return 0
+    if end == 0:
+        end = 24 * 60
+    first, last = -(-start // 60), end // 60 - 1
+    if last < first:
+        return 0
+    return ((1 << (last + 1)) - 1) ^ ((1 << first) - 1)
+
+
+def _schedule_masks(schedule):
+    masks = dict.fromkeys(DAYS, 0)
+    if not isinstance(schedule, dict):
+        return masks
+    for day, time_ranges in schedule.items():
+        if day not in masks or not isinstance(time_ranges, list):
+            continue
+        for time_range in time_ranges:
+            masks[day] |= _whole_hours_mask(time_range)
+    return masks
+
+
+def compile_schedules(apps, schema_editor):
+    VolunteerProfile = apps.get_model('authentification', 'VolunteerProfile')
+    profiles = list(VolunteerProfile.objects.all())
+    for profile in profiles:
+        for day, mask in _schedule_masks(profile.schedule).items():
+            setattr(profile, AVAILABILITY_FIELDS[day], mask)
+    VolunteerProfile.objects.bulk_update(profiles, list(AVAILABILITY_FIELDS.values()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentification', '0006_rename_field_areas_volunteerprofile_competencies_areas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_friday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Friday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_monday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Monday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_saturday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Saturday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_sunday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Sunday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_thursday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Thursday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_tuesday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Tuesday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.AddField(
+            model_name='volunteerprofile',
+            name='availability_wednesday',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Hours free on Wednesday as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.'),
+        ),
+        migrations.RunPython(compile_schedules, migrations.RunPython.noop),
+    ]
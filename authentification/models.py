@@ -3,6 +3,8 @@ from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from taggit.managers import TaggableManager
 
+from authentification.availability import AVAILABILITY_FIELDS, hour_mask, schedule_masks
+
 
 
 class CustomUser(AbstractUser):
@@ -44,6 +46,64 @@ class NPOManagerProfile(models.Model):
 
 
 
+class VolunteerProfileQuerySet(models.QuerySet):
+    """
+    Availability queries on the hour masks compiled from the schedule.
+
+    Every availability column is indexed. A profile free for all hours of a mask has a
+    column value of at least that mask, so the index narrows the rows with a range scan
+    and the bitwise AND only runs on what is left; no schedule JSON is parsed.
+    """
+
+    def _mask(self, day, time_range):
+        if day not in AVAILABILITY_FIELDS:
+            raise ValueError(f"Invalid day: {day}. Must be one of {list(AVAILABILITY_FIELDS)}.")
+        mask = hour_mask(time_range)
+        if not mask:
+            raise ValueError(f"Invalid time range: {time_range}. Must be in 'HH:MM-HH:MM' format.")
+        return AVAILABILITY_FIELDS[day], mask
+
+    def free_during(self, day, time_range):
+        """
+        Profiles free for the whole range, e.g. free_during('Saturday', '10:00-14:00').
+        """
+        field, mask = self._mask(day, time_range)
+        return (
+            self.filter(**{f"{field}__gte": mask})
+            .alias(_free=models.F(field).bitand(mask))
+            .filter(_free=mask)
+        )
+
+    def free_at_some_point(self, day, time_range):
+        """
+        Profiles free for at least one hour of the range.
+        """
+        field, mask = self._mask(day, time_range)
+        lowest_bit = mask & -mask
+        return (
+            self.filter(**{f"{field}__gte": lowest_bit})
+            .alias(_free=models.F(field).bitand(mask))
+            .filter(_free__gt=0)
+        )
+
+    def available_on(self, day):
+        """
+        Profiles with any free hour on a day.
+        """
+        if day not in AVAILABILITY_FIELDS:
+            raise ValueError(f"Invalid day: {day}. Must be one of {list(AVAILABILITY_FIELDS)}.")
+        return self.filter(**{f"{AVAILABILITY_FIELDS[day]}__gt": 0})
+
+
+def _availability_field(day):
+    return models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        help_text=f"Hours free on {day} as a bitmask, bit n being the hour from n:00. Compiled from the schedule on save.",
+    )
+
+
 class VolunteerProfile(models.Model):
     # Predefined FIELD_CHOICES categories
     FIELD_CHOICES = [
@@ -122,6 +182,37 @@ class VolunteerProfile(models.Model):
     )
 
 
+    # Hour masks compiled from the schedule, see VolunteerProfileQuerySet
+    availability_monday = _availability_field("Monday")
+    availability_tuesday = _availability_field("Tuesday")
+    availability_wednesday = _availability_field("Wednesday")
+    availability_thursday = _availability_field("Thursday")
+    availability_friday = _availability_field("Friday")
+    availability_saturday = _availability_field("Saturday")
+    availability_sunday = _availability_field("Sunday")
+
+    objects = VolunteerProfileQuerySet.as_manager()
+
+    def sync_availability(self):
+        """
+        Recompile the availability columns from the schedule.
+        """
+        for day, mask in schedule_masks(self.schedule).items():
+            setattr(self, AVAILABILITY_FIELDS[day], mask)
+
+    def availability_masks(self):
+        """
+        Return the hour mask of every day, Monday first.
+        """
+        return [getattr(self, field) for field in AVAILABILITY_FIELDS.values()]
+
+    def save(self, *args, **kwargs):
+        self.sync_availability()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "schedule" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | set(AVAILABILITY_FIELDS.values())
+        super().save(*args, **kwargs)
+
     def clean(self):
         """
         Validate competencies_areas and schedule for correct format and values.
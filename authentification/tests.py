@@ -1,3 +1,85 @@
-from django.test import TestCase
+from importlib import import_module
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from authentification.availability import DAYS, hour_mask, schedule_masks
+from authentification.models import CustomUser, VolunteerProfile
+
+
+def hours(*numbers):
+    return sum(1 << number for number in numbers)
+
+
+class HourMaskTests(SimpleTestCase):
+    def test_touched_and_whole_hours(self):
+        self.assertEqual(hour_mask("14:00-16:00"), hours(14, 15))
+        self.assertEqual(hour_mask("14:30-16:15"), hours(14, 15, 16))
+        self.assertEqual(hour_mask("14:30-16:15", whole_hours=True), hours(15))
+        self.assertEqual(hour_mask("14:30-15:15", whole_hours=True), 0)
+
+    def test_midnight_ends_the_day(self):
+        self.assertEqual(hour_mask("23:00-00:00"), hours(23))
+        self.assertEqual(hour_mask("22:00-24:00"), hours(22, 23))
+
+    def test_invalid_ranges(self):
+        for time_range in ("", "14:00", "25:00-26:00", "14:00-12:00", "noon-evening", None):
+            self.assertEqual(hour_mask(time_range), 0, time_range)
+
+    def test_schedule_masks(self):
+        masks = schedule_masks({"Monday": ["09:00-11:00", "14:00-15:00"], "Funday": ["09:00-10:00"],
+                                "Tuesday": "09:00-10:00", "Friday": ["bad"]})
+        self.assertEqual(list(masks), DAYS)
+        self.assertEqual(masks["Monday"], hours(9, 10, 14))
+        self.assertEqual(masks["Tuesday"], 0)
+        self.assertEqual(masks["Friday"], 0)
+        self.assertEqual(schedule_masks(None), dict.fromkeys(DAYS, 0))
+
+    def test_migration_compiles_existing_schedules(self):
+        migration = import_module("authentification.migrations.0007_volunteerprofile_availability")
+        masks = migration._schedule_masks({"Monday": ["09:00-11:30", "23:00-00:00"], "Saturday": ["bad"]})
+        self.assertEqual(masks["Monday"], hours(9, 10, 23))
+        self.assertEqual(masks["Saturday"], 0)
+        self.assertEqual(migration._schedule_masks(None), dict.fromkeys(DAYS, 0))
+
+
+class AvailabilityQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def profile(username, schedule):
+            user = CustomUser.objects.create_user(username, f"{username}@example.com", "x", role="VOLUNTEER")
+            return VolunteerProfile.objects.create(user=user, schedule=schedule)
+
+        cls.morning = profile("morning", {"Saturday": ["08:00-12:00"]})
+        cls.afternoon = profile("afternoon", {"Saturday": ["13:00-17:00"], "Monday": ["18:00-20:00"]})
+        cls.nobody = profile("nobody", {})
+
+    def names(self, queryset):
+        return set(queryset.values_list("user__username", flat=True))
+
+    def test_save_compiles_the_schedule(self):
+        self.assertEqual(self.afternoon.availability_saturday, hours(13, 14, 15, 16))
+        self.assertEqual(self.afternoon.availability_masks()[0], hours(18, 19))
+        self.afternoon.schedule = {"Sunday": ["10:00-11:00"]}
+        self.afternoon.save(update_fields=["schedule"])
+        self.afternoon.refresh_from_db()
+        self.assertEqual(self.afternoon.availability_masks(), [0, 0, 0, 0, 0, 0, hours(10)])
+
+    def test_free_during(self):
+        self.assertEqual(self.names(VolunteerProfile.objects.free_during("Saturday", "09:00-11:00")), {"morning"})
+        self.assertEqual(self.names(VolunteerProfile.objects.free_during("Saturday", "11:30-13:30")), set())
+
+    def test_free_at_some_point(self):
+        self.assertEqual(
+            self.names(VolunteerProfile.objects.free_at_some_point("Saturday", "11:30-13:30")),
+            {"morning", "afternoon"},
+        )
+
+    def test_available_on(self):
+        self.assertEqual(self.names(VolunteerProfile.objects.available_on("Saturday")), {"morning", "afternoon"})
+        self.assertEqual(self.names(VolunteerProfile.objects.available_on("Monday")), {"afternoon"})
+
+    def test_invalid_query(self):
+        with self.assertRaises(ValueError):
+            VolunteerProfile.objects.free_during("Funday", "09:00-10:00")
+        with self.assertRaises(ValueError):
+            VolunteerProfile.objects.free_during("Monday", "later")
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Task
+from .models import Conversation, Message, Task
 
 
 class TaskAdmin(admin.ModelAdmin):
@@ -24,4 +24,23 @@ class TaskAdmin(admin.ModelAdmin):
         }),
     )
 
-admin.site.register(Task, TaskAdmin)
\ No newline at end of file
+admin.site.register(Task, TaskAdmin)
+
+
+class MessageInline(admin.TabularInline):
+    model = Message
+    fields = ('role', 'content', 'created_at')
+    readonly_fields = ('role', 'content', 'created_at')
+    can_delete = False
+    extra = 0  # Messages are only appended by the chat views
+
+
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('flow', 'user', 'created_at')
+    list_filter = ('flow',)
+    search_fields = ('user__username',)
+    ordering = ('-created_at',)
+    exclude = ('form_state',)  # Collected form values, only ever written by the chat views
+    inlines = [MessageInline]
+
+admin.site.register(Conversation, ConversationAdmin)
@@ -1,6 +1,33 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from chat.prompts import prompt_registry
+        from chat.sqlite import apply_pragmas
+
+        # Tune every new SQLite connection with settings.SQLITE_PRAGMAS
+        connection_created.connect(apply_pragmas, dispatch_uid="chat.sqlite.pragmas")
+
+        # Build the form schemas and system prompts once instead of on every request
+        prompt_registry.build()
+        post_migrate.connect(prompt_registry.invalidate, dispatch_uid="chat.prompt_registry")
+
+        # Keep the volunteer matching arrays in step with profile changes
+        from authentification.models import VolunteerProfile
+        from chat.matching import profile_deleted, profile_saved
+
+        post_save.connect(profile_saved, sender=VolunteerProfile, dispatch_uid="chat.matching.saved")
+        post_delete.connect(profile_deleted, sender=VolunteerProfile, dispatch_uid="chat.matching.deleted")
+
+        # Keep the interest tag index in step with tag changes
+        from chat import interests
+
+        m2m_changed.connect(interests.interests_changed, sender=VolunteerProfile.interests.through,
+                            dispatch_uid="chat.interests.changed")
+        post_delete.connect(interests.profile_deleted, sender=VolunteerProfile, dispatch_uid="chat.interests.deleted")
@@ -0,0 +1,312 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import redirect, render
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+
+from chat.cache import acached_answer, agenerate_cached_response, cacheable_turn
+from chat.conversations import aappend_messages, aget_conversation, aload_history
+from chat.decorators import role_required, unauthenticated_user
+from chat.extraction import FIELDS_MARKER, astop_at_form, astructured_form
+from chat.form_state import FormState
+from chat.helpers import *
+from chat.metrics import track_metrics
+from chat.prompts import prompt_registry
+from chat.retrieval import aretrieve_context
+from chat.scheduler import BUSY_MESSAGE, SchedulerBusy, schedule_inference
+from chat.views import complete_form, sse_event, wants_stream
+from .ollama_api import agenerate_response
+
+# Async versions of the LLM-backed views. Served over ASGI (chatapp/asgi.py) a pending
+# generation only holds a coroutine on the event loop instead of a whole worker thread.
+# Conversations are read and written with the async ORM; template rendering and the
+# extract_and_create_* helpers still run in the thread pool through sync_to_async.
+
+arender = sync_to_async(render)
+
+
+def scheduled_agenerate(request, conversation):
+    """
+    Async counterpart of views.scheduled_generate.
+    """
+    metrics = request.metrics
+    return request.inference_ticket.aguard(
+        metrics.atimed(partial(agenerate_response, affinity_key=conversation.pk)), on_wait=metrics.queue_wait
+    )
+
+
+def aform_generate(request, conversation, state):
+    """
+    Async counterpart of views.form_generate.
+    """
+    agenerate = scheduled_agenerate(request, conversation)
+    if settings.CHAT_STRUCTURED_OUTPUT:
+        afinalize = request.inference_ticket.aguard(
+            request.metrics.aduration("finalize_seconds", partial(agenerate_response, affinity_key=conversation.pk)),
+            on_wait=request.metrics.queue_wait,
+        )
+        return astructured_form(agenerate, state.json_schema(), marker=FIELDS_MARKER, afinalize=afinalize)
+    return astop_at_form(agenerate, marker=FIELDS_MARKER)
+
+
+# complete_form validates against the database and may create the object, so it runs in the thread pool
+acomplete_form = sync_to_async(complete_form)
+
+
+def alocal_generate(reply):
+    """
+    Async counterpart of views.local_generate.
+    """
+    async def agenerate(prompt_messages):
+        yield reply
+    return agenerate
+
+
+async def aprepare_form_turn(request, conversation, state, chat_history, user_input):
+    """
+    Async counterpart of views.prepare_form_turn.
+    """
+    reply = await sync_to_async(state.local_reply)(user_input)
+    if reply is not None:
+        return [], alocal_generate(reply)
+    with request.metrics.timer("prompt_build_seconds"):
+        prompt_messages = state.build_messages(chat_history, user_input)
+    return prompt_messages, aform_generate(request, conversation, state)
+
+
+async def agenerate_full_response(prompt_messages, error_message, generate):
+    ai_response = ""
+    try:
+        async for chunk in generate(prompt_messages):
+            ai_response += chunk
+    except SchedulerBusy:
+        raise  # Answered with 503 by schedule_inference
+    except Exception as e:
+        ai_response = error_message
+    return ai_response
+
+
+def astream_chat_response(request, conversation, chat_history, prompt_messages, user_input, on_complete=None,
+                          error_message="Sorry, there was an error generating the response.", generate=None):
+    """
+    Async counterpart of views.stream_chat_response.
+
+    Parameters:
+        request: The Django HTTP request object.
+        conversation (Conversation): Conversation the turn is appended to.
+        chat_history (list): Recent chat history of the conversation.
+        prompt_messages (list): Role-tagged messages sent to the model.
+        user_input (str): The message typed by the user in this turn.
+        on_complete (callable): Coroutine function called with the finished AI response and
+            the chat history, may return a URL the page should redirect to.
+        error_message (str): Text stored in the history if generation fails.
+        generate (callable): Produces the reply chunks from the prompt messages,
+            scheduled_agenerate(request, conversation) by default.
+
+    Returns:
+        StreamingHttpResponse: `token` events for every chunk, followed by one `done` event.
+    """
+    generate = generate or scheduled_agenerate(request, conversation)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in generate(prompt_messages):
+                chunks.append(chunk)
+                yield sse_event("token", {"content": chunk})
+            ai_response = "".join(chunks)
+        except SchedulerBusy as e:
+            # The queue was full when the model was reached; nothing happened, so nothing is stored
+            yield sse_event("error", {"message": BUSY_MESSAGE, "retry_after": e.retry_after})
+            yield sse_event("done", {"redirect": None})
+            return
+        except Exception as e:
+            ai_response = error_message
+            yield sse_event("error", {"message": ai_response})
+
+        turn_start = len(chat_history)
+        chat_history.append({"role": "user", "message": user_input})
+        chat_history.append({"role": "ai", "message": ai_response})
+
+        redirect_url = await on_complete(ai_response, chat_history) if on_complete else None
+
+        # Store the turn, including any system messages added by on_complete
+        with request.metrics.timer("history_save_seconds"):
+            await aappend_messages(conversation, chat_history[turn_start:])
+        yield sse_event("done", {"redirect": redirect_url})
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@csrf_exempt
+@track_metrics('chat_async')
+@schedule_inference('low')
+async def chat_view(request):
+    if request.method == "POST":
+        user_input = request.POST.get("user_input")
+        with request.metrics.timer("history_load_seconds"):
+            conversation = await aget_conversation(request, "chat")
+            chat_history = await aload_history(conversation)
+        # A question asked before is answered from the response cache, follow-ups never are
+        cacheable = cacheable_turn(chat_history)
+        answer = await acached_answer(user_input) if cacheable else None
+        if answer is not None:
+            prompt_messages, generate = [], alocal_generate(answer)
+        else:
+            with request.metrics.timer("retrieval_seconds"):
+                context = await aretrieve_context(user_input)
+            with request.metrics.timer("prompt_build_seconds"):
+                prompt_messages = build_messages(prompt_registry.get("chat"), chat_history, user_input, context)
+
+            generate = scheduled_agenerate(request, conversation)
+            if cacheable:
+                generate = partial(agenerate_cached_response, user_input, generate=generate, exact=False)
+        if wants_stream(request):
+            return astream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                         generate=generate)
+
+        ai_response = await agenerate_full_response(
+            prompt_messages, "Sorry, there was an error generating the response.", generate=generate
+        )
+
+        turn_start = len(chat_history)
+        chat_history.append({"role": "user", "message": user_input})
+        chat_history.append({"role": "ai", "message": ai_response})
+        with request.metrics.timer("history_save_seconds"):
+            await aappend_messages(conversation, chat_history[turn_start:])
+
+        return await arender(request, "chat.html", {"chat_history": chat_history})
+    return await arender(request, "chat.html", {"chat_history": []})
+
+
+@role_required('NPO_MANAGER')
+@csrf_exempt
+@track_metrics('form_async')
+@schedule_inference('high')
+async def form_view(request):
+    with request.metrics.timer("history_load_seconds"):
+        conversation = await aget_conversation(request, "task")
+        chat_history = await aload_history(conversation)
+    if request.method == "POST":
+        user_input = request.POST.get("user_input")
+        state = FormState.load(conversation)
+        prompt_messages, generate = await aprepare_form_turn(request, conversation, state, chat_history, user_input)
+
+        if wants_stream(request):
+            async def create_task(ai_response, chat_history):
+                if await acomplete_form(request, conversation, state, ai_response, chat_history, extract_and_create_task):
+                    user = await request.auser()
+                    return reverse('chat:user_tasks', kwargs={'username': user.username})
+                return None
+
+            return astream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                         on_complete=create_task,
+                                         generate=generate)
+
+        ai_response = await agenerate_full_response(
+            prompt_messages, "Sorry, there was an error generating the response.",
+            generate
+        )
+
+        turn_start = len(chat_history)
+        chat_history.append({"role": "user", "message": user_input})
+        chat_history.append({"role": "ai", "message": ai_response})
+
+        created = await acomplete_form(request, conversation, state, ai_response, chat_history, extract_and_create_task)
+        with request.metrics.timer("history_save_seconds"):
+            await aappend_messages(conversation, chat_history[turn_start:])
+
+        if created:
+            user = await request.auser()
+            return redirect('chat:user_tasks', username=user.username)
+
+    return await arender(request, "form-creation.html", {"chat_history": chat_history})
+
+
+@csrf_exempt
+@unauthenticated_user
+@track_metrics('user_async')
+@schedule_inference('normal')
+async def register_view(request):
+    with request.metrics.timer("history_load_seconds"):
+        conversation = await aget_conversation(request, "user")
+        chat_history = await aload_history(conversation)
+    if request.method == "POST":
+        user_input = request.POST.get("user_input")
+        state = FormState.load(conversation)
+        prompt_messages, generate = await aprepare_form_turn(request, conversation, state, chat_history, user_input)
+
+        if wants_stream(request):
+            async def create_user(ai_response, chat_history):
+                if await acomplete_form(request, conversation, state, ai_response, chat_history, extract_and_create_user):
+                    return reverse('authentification:signin')
+                return None
+
+            return astream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                         on_complete=create_user, error_message="Error generating response.",
+                                         generate=generate)
+
+        ai_response = await agenerate_full_response(
+            prompt_messages, "Error generating response.", generate
+        )
+
+        turn_start = len(chat_history)
+        chat_history.append({"role": "user", "message": user_input})
+        chat_history.append({"role": "ai", "message": ai_response})
+
+        success = await acomplete_form(request, conversation, state, ai_response, chat_history, extract_and_create_user)
+        with request.metrics.timer("history_save_seconds"):
+            await aappend_messages(conversation, chat_history[turn_start:])
+
+        if success:
+            return redirect('authentification:signin')
+
+    return await arender(request, "user-registration.html", {"chat_history": chat_history})
+
+
+@role_required('VOLUNTEER')
+@track_metrics('volunteer_onboard_async')
+@schedule_inference('normal')
+async def volunteer_onboard_view(request):
+    with request.metrics.timer("history_load_seconds"):
+        conversation = await aget_conversation(request, "volunteer")
+        chat_history = await aload_history(conversation)
+    if request.method == "POST":
+        user_input = request.POST.get("user_input")
+        state = FormState.load(conversation)
+        prompt_messages, generate = await aprepare_form_turn(request, conversation, state, chat_history, user_input)
+
+        if wants_stream(request):
+            async def create_profile(ai_response, chat_history):
+                if await acomplete_form(request, conversation, state, ai_response, chat_history,
+                                        extract_and_create_volunteer_profile):
+                    return reverse('authentification:index')
+                return None
+
+            return astream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                         on_complete=create_profile, error_message="Error generating response.",
+                                         generate=generate)
+
+        ai_response = await agenerate_full_response(
+            prompt_messages, "Error generating response.", generate
+        )
+
+        turn_start = len(chat_history)
+        chat_history.append({"role": "user", "message": user_input})
+        chat_history.append({"role": "ai", "message": ai_response})
+
+        created = await acomplete_form(request, conversation, state, ai_response, chat_history,
+                                       extract_and_create_volunteer_profile)
+        with request.metrics.timer("history_save_seconds"):
+            await aappend_messages(conversation, chat_history[turn_start:])
+
+        if created:
+            return redirect('authentification:index')  # Redirect to the main page after successful onboarding
+
+    return await arender(request, "vonboard.html", {"chat_history": chat_history})
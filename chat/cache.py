@@ -0,0 +1,349 @@
+import hashlib
+import logging
+import re
+import time
+import uuid
+from array import array
+
+from django.conf import settings
+from django.core.cache import caches
+
+from chat.history import PROMPT_ROLES
+from chat.ollama_api import aembed_text, agenerate_response, embed_text, generate_response
+from chat.prompts import prompt_registry
+from chat.retrieval import vector_index
+
+try:
+    import numpy as np
+except ImportError:  # The semantic tier falls back to array and plain Python
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """
+    Lower-case the question, collapse whitespace and drop trailing punctuation, so
+    "What is an NPO?" and "what is an npo" share a cache entry.
+    """
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+def cacheable_turn(chat_history):
+    """
+    Whether the answer of a /chat/ turn may come from or go to the cache: only for the first
+    question of a conversation. A follow-up such as "yes" or "what about Vienna?" means
+    something different in every conversation, and the cache key does not know it.
+    """
+    return not any(message['role'] in PROMPT_ROLES for message in chat_history)
+
+
+def _normalize_vector(vector):
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+class SemanticEntries:
+    """
+    Entries of the semantic tier: the normalized embedding of every question, the exact key
+    its answer is stored under and the time it expires.
+
+    The embeddings are the bytes of one float32 array, a row per question, so 500 entries of a
+    768-dimension model take 1.5 MB instead of several MB of pickled Python floats. The answers
+    stay in their exact entries and are only read on a hit.
+    """
+
+    def __init__(self, dimensions=0, vectors=b"", keys=(), expires=()):
+        self.dimensions = dimensions
+        self.vectors = vectors
+        self.keys = list(keys)
+        self.expires = list(expires)
+
+    @classmethod
+    def from_entry(cls, entry):
+        # Anything else, e.g. the list an older version stored, starts an empty tier
+        return cls(**entry) if isinstance(entry, dict) else cls()
+
+    def as_entry(self):
+        return {"dimensions": self.dimensions, "vectors": self.vectors, "keys": self.keys, "expires": self.expires}
+
+    def best_match(self, vector):
+        """
+        Return (exact key, cosine similarity) of the live entry closest to the normalized
+        `vector`, or (None, 0.0) if there is none.
+        """
+        now = time.time()
+        live = [index for index, expires in enumerate(self.expires) if expires > now]
+        if not live or len(vector) != self.dimensions:
+            return None, 0.0
+        if np is not None:
+            rows = np.frombuffer(self.vectors, dtype=np.float32).reshape(-1, self.dimensions)
+            scores = rows[live] @ np.asarray(vector, dtype=np.float32)
+            best = int(scores.argmax())
+            return self.keys[live[best]], float(scores[best])
+        rows = array("f")
+        rows.frombytes(self.vectors)
+        scores = {
+            index: sum(a * b for a, b in zip(rows[index * self.dimensions:(index + 1) * self.dimensions], vector))
+            for index in live
+        }
+        best = max(scores, key=scores.__getitem__)
+        return self.keys[best], scores[best]
+
+    def added(self, vector, key, expires, limit):
+        """
+        Return the entries with a new one appended, leaving out the expired ones and the oldest
+        beyond `limit`.
+        """
+        now = time.time()
+        keep = []
+        if len(vector) == self.dimensions and limit > 1:
+            keep = [index for index, old_expires in enumerate(self.expires) if old_expires > now][-(limit - 1):]
+        row_bytes = 4 * len(vector)
+        vectors = b"".join(self.vectors[index * row_bytes:(index + 1) * row_bytes] for index in keep)
+        return SemanticEntries(
+            dimensions=len(vector),
+            vectors=vectors + array("f", vector).tobytes(),
+            keys=[self.keys[index] for index in keep] + [key],
+            expires=[self.expires[index] for index in keep] + [expires],
+        )
+
+
+class ResponseCache:
+    """
+    Two-tier cache of answers to general chat questions, asked without earlier messages
+    (see cacheable_turn). Empty answers are never stored.
+
+    The exact tier is keyed on the normalized question, the id of the system prompt, the
+    model name and the version of the retrieval index (see chat/retrieval.py), so answers
+    grounded in an older index are not served after it is rebuilt. The optional semantic
+    tier (settings.CHAT_CACHE_SEMANTIC) embeds the question with the local embedding model
+    and reuses the answer of the most similar earlier question above
+    settings.CHAT_CACHE_SIMILARITY_THRESHOLD.
+
+    Both tiers live in the shared `chat_responses` cache, which expires entries after its
+    TIMEOUT and culls them past MAX_ENTRIES. The semantic entries (see SemanticEntries) are
+    one cache entry, capped at settings.CHAT_CACHE_SEMANTIC_MAX_ENTRIES with the oldest
+    dropped first, and only rewritten when a question is added. Next to it a small version
+    entry changes on every write, so a process keeps the entries it read in memory and reads
+    them again only after another process added one. Concurrent workers may overwrite each
+    other's additions; that only costs a cache entry.
+    """
+
+    alias = "chat_responses"
+
+    def __init__(self):
+        # semantic key -> (version, SemanticEntries) as last read or written by this process
+        self._semantic = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _scope(self):
+        # Resolved here: the exact lookup runs before anything else has looked at the index
+        return f"{settings.OLLAMA_MODEL}:{prompt_registry.prompt_id('chat')}:{vector_index.current_version() or ''}"
+
+    def exact_key(self, question):
+        digest = hashlib.sha256(f"{self._scope()}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+        return f"chat:exact:{digest}"
+
+    def semantic_key(self):
+        return f"chat:semantic:{self._scope()}"
+
+    def semantic_version_key(self):
+        return f"{self.semantic_key()}:version"
+
+    def _known_entries(self, version):
+        """
+        The semantic entries of this process if they are still those of `version`, else None.
+        """
+        if version is None:
+            return SemanticEntries()
+        known = self._semantic.get(self.semantic_key())
+        if known is not None and known[0] == version:
+            return known[1]
+        return None
+
+    def _remember(self, version, entries):
+        # Only the current scope is kept, the others are outdated
+        self._semantic = {self.semantic_key(): (version, entries)}
+        return entries
+
+    def _semantic_entries(self):
+        version = self.cache.get(self.semantic_version_key())
+        entries = self._known_entries(version)
+        if entries is None:
+            entries = self._remember(version, SemanticEntries.from_entry(self.cache.get(self.semantic_key())))
+        return entries
+
+    async def _asemantic_entries(self):
+        version = await self.cache.aget(self.semantic_version_key())
+        entries = self._known_entries(version)
+        if entries is None:
+            entries = self._remember(version, SemanticEntries.from_entry(await self.cache.aget(self.semantic_key())))
+        return entries
+
+    def _expires(self):
+        timeout = self.cache.default_timeout
+        return time.time() + timeout if timeout is not None else float("inf")
+
+    def _similar_key(self, vector, entries):
+        key, similarity = entries.best_match(vector)
+        if key is None or similarity < settings.CHAT_CACHE_SIMILARITY_THRESHOLD:
+            return None
+        return key
+
+    def _store_entries(self, entries):
+        version = uuid.uuid4().hex
+        self.cache.set(self.semantic_key(), entries.as_entry())
+        self.cache.set(self.semantic_version_key(), version)
+        self._remember(version, entries)
+
+    async def _astore_entries(self, entries):
+        version = uuid.uuid4().hex
+        await self.cache.aset(self.semantic_key(), entries.as_entry())
+        await self.cache.aset(self.semantic_version_key(), version)
+        self._remember(version, entries)
+
+    def get_exact(self, question):
+        """
+        Return the answer cached for this very question, or None. Never calls the embedding model.
+        """
+        return self.cache.get(self.exact_key(question)) or None
+
+    async def aget_exact(self, question):
+        return await self.cache.aget(self.exact_key(question)) or None
+
+    def get(self, question, exact=True):
+        """
+        Return the cached answer to `question`, or None. With `exact` False only the semantic
+        tier is consulted, for callers that looked the question up with get_exact() already.
+        """
+        if exact:
+            answer = self.get_exact(question)
+            if answer is not None:
+                return answer
+        if not settings.CHAT_CACHE_SEMANTIC:
+            return None
+        try:
+            vector = _normalize_vector(embed_text(normalize_question(question)))
+        except Exception as e:
+            logger.warning("Embedding failed, skipping semantic cache: %s", e)
+            return None
+        key = self._similar_key(vector, self._semantic_entries())
+        answer = self.cache.get(key) if key else None
+        if answer:
+            self.cache.set(self.exact_key(question), answer)
+        return answer or None
+
+    def set(self, question, answer):
+        if not answer:
+            return
+        self.cache.set(self.exact_key(question), answer)
+        if not settings.CHAT_CACHE_SEMANTIC:
+            return
+        try:
+            vector = _normalize_vector(embed_text(normalize_question(question)))
+        except Exception as e:
+            logger.warning("Embedding failed, skipping semantic cache: %s", e)
+            return
+        entries = self._semantic_entries().added(
+            vector, self.exact_key(question), self._expires(), settings.CHAT_CACHE_SEMANTIC_MAX_ENTRIES
+        )
+        self._store_entries(entries)
+
+    async def aget(self, question, exact=True):
+        if exact:
+            answer = await self.aget_exact(question)
+            if answer is not None:
+                return answer
+        if not settings.CHAT_CACHE_SEMANTIC:
+            return None
+        try:
+            vector = _normalize_vector(await aembed_text(normalize_question(question)))
+        except Exception as e:
+            logger.warning("Embedding failed, skipping semantic cache: %s", e)
+            return None
+        key = self._similar_key(vector, await self._asemantic_entries())
+        answer = await self.cache.aget(key) if key else None
+        if answer:
+            await self.cache.aset(self.exact_key(question), answer)
+        return answer or None
+
+    async def aset(self, question, answer):
+        if not answer:
+            return
+        await self.cache.aset(self.exact_key(question), answer)
+        if not settings.CHAT_CACHE_SEMANTIC:
+            return
+        try:
+            vector = _normalize_vector(await aembed_text(normalize_question(question)))
+        except Exception as e:
+            logger.warning("Embedding failed, skipping semantic cache: %s", e)
+            return
+        entries = (await self._asemantic_entries()).added(
+            vector, self.exact_key(question), self._expires(), settings.CHAT_CACHE_SEMANTIC_MAX_ENTRIES
+        )
+        await self._astore_entries(entries)
+
+
+response_cache = ResponseCache()
+
+
+def cached_answer(question):
+    """
+    Return the answer cached for exactly this question, or None: the cheap lookup a view
+    makes before it spends anything on the prompt (retrieval embeds the question).
+    """
+    if not settings.CHAT_CACHE_ENABLED:
+        return None
+    return response_cache.get_exact(question)
+
+
+async def acached_answer(question):
+    if not settings.CHAT_CACHE_ENABLED:
+        return None
+    return await response_cache.aget_exact(question)
+
+
+def generate_cached_response(question, prompt_messages, generate=None, exact=True):
+    """
+    Yield the cached answer to `question` as a single chunk, or stream a new one from
+    the model and cache it once it is complete. Failed and empty generations are not cached.
+    Pass `exact` False when the exact tier was already consulted with cached_answer().
+    """
+    generate = generate or generate_response
+    if not settings.CHAT_CACHE_ENABLED:
+        yield from generate(prompt_messages)
+        return
+    answer = response_cache.get(question, exact=exact)
+    if answer is not None:
+        yield answer
+        return
+    chunks = []
+    for chunk in generate(prompt_messages):
+        chunks.append(chunk)
+        yield chunk
+    response_cache.set(question, "".join(chunks))
+
+
+async def agenerate_cached_response(question, prompt_messages, generate=None, exact=True):
+    """
+    Async counterpart of generate_cached_response.
+    """
+    generate = generate or agenerate_response
+    if not settings.CHAT_CACHE_ENABLED:
+        async for chunk in generate(prompt_messages):
+            yield chunk
+        return
+    answer = await response_cache.aget(question, exact=exact)
+    if answer is not None:
+        yield answer
+        return
+    chunks = []
+    async for chunk in generate(prompt_messages):
+        chunks.append(chunk)
+        yield chunk
+    await response_cache.aset(question, "".join(chunks))
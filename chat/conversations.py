@@ -0,0 +1,147 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from chat.models import Conversation, Message
+from chat.write_queue import write_queue
+
+# Session key holding {flow: conversation id}, used to find anonymous visitors' conversations
+SESSION_KEY = "conversations"
+
+
+def _find_conversation(request, flow, user):
+    conversation_ids = request.session.get(SESSION_KEY, {})
+    conversation_id = conversation_ids.get(flow)
+    if conversation_id is None:
+        return None
+    return Conversation.objects.filter(pk=conversation_id, flow=flow, user=user).first()
+
+
+def _remember_conversation(request, flow, conversation):
+    conversation_ids = request.session.get(SESSION_KEY, {})
+    conversation_ids[flow] = conversation.pk
+    request.session[SESSION_KEY] = conversation_ids
+
+
+def get_conversation(request, flow):
+    """
+    Return the conversation of the current visitor in one flow, starting it if needed.
+
+    Signed-in users have one conversation per flow. Anonymous visitors get a new one that is
+    found again through its id in their session; the session only changes when a conversation
+    is started, never per turn.
+    """
+    user = request.user if request.user.is_authenticated else None
+    if user is not None:
+        conversation, _ = Conversation.objects.get_or_create(flow=flow, user=user)
+        return conversation
+
+    conversation = _find_conversation(request, flow, None)
+    if conversation is None:
+        conversation = Conversation.objects.create(flow=flow)
+        _remember_conversation(request, flow, conversation)
+    return conversation
+
+
+def load_history(conversation, limit=None):
+    """
+    Load the last `limit` messages of a conversation (settings.CHAT_HISTORY_LOAD_LIMIT by default)
+    as chat history entries, oldest first.
+    """
+    if limit is None:
+        limit = settings.CHAT_HISTORY_LOAD_LIMIT
+    recent = conversation.messages.order_by('-id')[:limit]
+    return [message.as_history_entry() for message in reversed(recent)]
+
+
+def _insert_messages(conversation, entries):
+    Message.objects.bulk_create([
+        Message(conversation=conversation, role=entry["role"], content=entry["message"])
+        for entry in entries
+    ])
+
+
+def append_messages(conversation, entries):
+    """
+    Store new chat history entries with a single INSERT, whatever the length of the conversation.
+    The INSERT goes through the write queue, committed together with other requests' writes.
+    """
+    write_queue.run(_insert_messages, conversation, entries)
+
+
+def _redact_messages(conversation, secrets, redact):
+    contains = Q()
+    for secret in secrets:
+        contains |= Q(content__contains=secret)
+    messages = list(conversation.messages.filter(contains))
+    for message in messages:
+        message.content = redact(message.content)
+    Message.objects.bulk_update(messages, ["content"])
+
+
+def redact_messages(conversation, secrets, redact):
+    """
+    Rewrite the stored messages of a conversation that contain one of `secrets` with `redact`,
+    e.g. the earlier message a password was first given in. Goes through the write queue.
+    """
+    write_queue.run(_redact_messages, conversation, secrets, redact)
+
+
+async def aget_conversation(request, flow):
+    """
+    Async counterpart of get_conversation.
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        conversation, _ = await Conversation.objects.aget_or_create(flow=flow, user=user)
+        return conversation
+
+    # Loading the session hits the database, which must not happen on the event loop
+    conversation_ids = await sync_to_async(request.session.get)(SESSION_KEY, {})
+    conversation = None
+    if flow in conversation_ids:
+        conversation = await Conversation.objects.filter(
+            pk=conversation_ids[flow], flow=flow, user=None
+        ).afirst()
+    if conversation is None:
+        conversation = await Conversation.objects.acreate(flow=flow)
+        conversation_ids[flow] = conversation.pk
+        request.session[SESSION_KEY] = conversation_ids
+    return conversation
+
+
+async def aload_history(conversation, limit=None):
+    """
+    Async counterpart of load_history.
+    """
+    if limit is None:
+        limit = settings.CHAT_HISTORY_LOAD_LIMIT
+    recent = [message async for message in conversation.messages.order_by('-id')[:limit]]
+    return [message.as_history_entry() for message in reversed(recent)]
+
+
+async def aappend_messages(conversation, entries):
+    """
+    Async counterpart of append_messages.
+    """
+    await write_queue.arun(_insert_messages, conversation, entries)
+
+
+def _update_form_state(conversation, form_state):
+    Conversation.objects.filter(pk=conversation.pk).update(form_state=form_state)
+
+
+def save_form_state(conversation, form_state):
+    """
+    Store the form state of a conversation (a dict, see chat/form_state.py) through the write queue.
+    """
+    conversation.form_state = form_state
+    write_queue.run(_update_form_state, conversation, form_state)
+
+
+async def asave_form_state(conversation, form_state):
+    """
+    Async counterpart of save_form_state.
+    """
+    conversation.form_state = form_state
+    await write_queue.arun(_update_form_state, conversation, form_state)
@@ -3,28 +3,57 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import redirect
 from functools import wraps
 
+from asgiref.sync import iscoroutinefunction
 from django.urls import reverse
 
+def _check_role(request, user, required_role):
+    if not user.is_authenticated:
+        messages.warning(request, "You need to log in to access this page.")
+        return redirect('authentification:signin')  # Redirect to login page
+    if user.role != required_role:
+        messages.error(request, "Access denied. You do not have permission to access this page.")
+        return redirect('authentification:index')  # Redirect to main page
+    return None
+
 def role_required(required_role):
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                # request.user would hit the database synchronously, so resolve it with auser()
+                denied = _check_role(request, await request.auser(), required_role)
+                if denied:
+                    return denied
+                return await view_func(request, *args, **kwargs)
+            return _async_wrapped_view
+
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
-            if not request.user.is_authenticated:
-                messages.warning(request, "You need to log in to access this page.")
-                return redirect('authentification:signin')  # Redirect to login page
-            if request.user.role != required_role:
-                messages.error(request, "Access denied. You do not have permission to access this page.")
-                return redirect('authentification:index')  # Redirect to main page
+            denied = _check_role(request, request.user, required_role)
+            if denied:
+                return denied
             return view_func(request, *args, **kwargs)
         return _wrapped_view
     return decorator
 
+def _deny_authenticated(request):
+    # Redirect authenticated users to a main page
+    messages.error(request, "Access denied. You already have user account.")
+    return redirect('authentification:index')  # Redirect to main page
+
 def unauthenticated_user(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if user.is_authenticated:
+                return _deny_authenticated(request)
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     def wrapper(request, *args, **kwargs):
         if request.user.is_authenticated:
-            # Redirect authenticated users to a main page
-            messages.error(request, "Access denied. You already have user account.")
-            return redirect('authentification:index')  # Redirect to main page
+            return _deny_authenticated(request)
         return view_func(request, *args, **kwargs)
-    
+
     return wrapper
@@ -0,0 +1,240 @@
+import json
+import re
+
+# Line the form prompts ask the model to write right before the finished JSON form
+FINAL_FORM_MARKER = "There is final version of JSON form:"
+
+# Line the form prompts ask the model to write before the field values it collected in a turn
+FIELDS_MARKER = "Collected fields:"
+
+# Asks for the form in structured output mode; the JSON Schema does the rest
+FINALIZE_FORM_PROMPT = "Output the collected values as JSON."
+
+# Characters that can change the nesting state; everything else is skipped in one step
+_STRUCTURAL = re.compile(r'[{}"\\]')
+
+
+class JSONObjectScanner:
+    """
+    Find the top-level {...} objects in text that arrives piece by piece.
+
+    Braces are matched by depth, so nested objects such as `schedule` are kept whole, and
+    braces or quotes inside JSON strings are ignored. The state carries over between calls
+    to feed(), so an object may be split over any number of chunks.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._parts = []
+
+    def feed(self, text, start=0):
+        """
+        Scan text[start:] and yield (end, object_text) for every object that closes in it,
+        `end` being the offset in `text` just past the closing brace.
+        """
+        object_start = start if self._depth else None
+        skip = start if self._escaped else None
+        self._escaped = False
+        for match in _STRUCTURAL.finditer(text, start):
+            index = match.start()
+            if index == skip:
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == "\\":
+                    skip = index + 1
+                    self._escaped = skip == len(text)
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth:
+                    self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    object_start = index
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[object_start:index + 1])
+                    object_text = "".join(self._parts)
+                    self._parts = []
+                    object_start = None
+                    yield index + 1, object_text
+        if self._depth:
+            self._parts.append(text[object_start:])
+
+
+def extract_json_objects(text):
+    """
+    Return the text of every top-level JSON object in `text`, in order.
+    """
+    return [object_text for _, object_text in JSONObjectScanner().feed(text)]
+
+
+def form_json_fragments(ai_response):
+    """
+    Return the candidate JSON forms of a reply, the ones after the final form marker first.
+    """
+    marker = ai_response.rfind(FINAL_FORM_MARKER)
+    if marker == -1:
+        return extract_json_objects(ai_response)
+    after = extract_json_objects(ai_response[marker + len(FINAL_FORM_MARKER):])
+    return after + [fragment for fragment in extract_json_objects(ai_response[:marker]) if fragment not in after]
+
+
+class FormExtractor:
+    """
+    Watch a streamed reply for the final form marker followed by a complete JSON object.
+
+    feed() returns the part of each chunk that belongs to the reply: everything until the
+    form object closes, nothing after it. Once `complete` is set, `form` holds the parsed
+    object and the rest of the generation can be dropped. With `stop_at_marker` the reply
+    already ends with the marker itself, for when the form is generated separately.
+    """
+
+    def __init__(self, marker=FINAL_FORM_MARKER, stop_at_marker=False):
+        self.marker = marker
+        self.stop_at_marker = stop_at_marker
+        self.marker_seen = False
+        self.complete = False
+        self.form = None
+        self._tail = ""
+        self._scanner = JSONObjectScanner()
+
+    def feed(self, chunk):
+        if self.complete or (self.marker_seen and self.stop_at_marker):
+            return ""
+        start = 0
+        if not self.marker_seen:
+            # Keep the end of the text seen so far, the marker may be split over chunks
+            window = self._tail + chunk
+            index = window.find(self.marker)
+            if index == -1:
+                self._tail = window[-(len(self.marker) - 1):]
+                return chunk
+            self.marker_seen = True
+            start = index + len(self.marker) - len(self._tail)
+            if self.stop_at_marker:
+                return chunk[:start]
+        for end, object_text in self._scanner.feed(chunk, start):
+            try:
+                form = json.loads(object_text)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(form, dict):
+                self.form = form
+                self.complete = True
+                return chunk[:end]
+        return chunk
+
+
+def stop_at_form(generate, marker=FINAL_FORM_MARKER):
+    """
+    Wrap a generate function so the generation is cut off as soon as the JSON form after
+    `marker` is complete. Closing the model stream makes Ollama stop decoding the trailing chatter.
+    """
+    def generate_until_form(prompt_messages):
+        extractor = FormExtractor(marker)
+        chunks = generate(prompt_messages)
+        try:
+            for chunk in chunks:
+                kept = extractor.feed(chunk)
+                if kept:
+                    yield kept
+                if extractor.complete:
+                    return
+        finally:
+            chunks.close()
+    return generate_until_form
+
+
+def astop_at_form(agenerate, marker=FINAL_FORM_MARKER):
+    """
+    Async counterpart of stop_at_form.
+    """
+    async def agenerate_until_form(prompt_messages):
+        extractor = FormExtractor(marker)
+        chunks = agenerate(prompt_messages)
+        try:
+            async for chunk in chunks:
+                kept = extractor.feed(chunk)
+                if kept:
+                    yield kept
+                if extractor.complete:
+                    return
+        finally:
+            await chunks.aclose()
+    return agenerate_until_form
+
+
+def _finalize_messages(prompt_messages, reply):
+    return prompt_messages + [
+        {"role": "assistant", "content": reply},
+        {"role": "user", "content": FINALIZE_FORM_PROMPT},
+    ]
+
+
+def structured_form(generate, json_schema, marker=FINAL_FORM_MARKER, finalize=None):
+    """
+    Wrap a generate function so the form is produced with structured output.
+
+    The conversation streams as usual until the model writes `marker`. That
+    stream is closed there, and the form is generated by a second call whose output Ollama
+    constrains to `json_schema`, so it always parses and no turn is lost to malformed JSON.
+    The reply still reads "<marker> {json}" for whoever parses it.
+
+    The second call goes through `finalize` (`generate` by default), so it can be measured
+    apart from the conversation stream.
+    """
+    finalize = finalize or generate
+
+    def generate_structured_form(prompt_messages):
+        extractor = FormExtractor(marker, stop_at_marker=True)
+        reply = []
+        chunks = generate(prompt_messages)
+        try:
+            for chunk in chunks:
+                kept = extractor.feed(chunk)
+                if kept:
+                    reply.append(kept)
+                    yield kept
+                if extractor.marker_seen:
+                    break
+        finally:
+            chunks.close()
+        if not extractor.marker_seen:
+            return
+        yield "\n"
+        yield from finalize(_finalize_messages(prompt_messages, "".join(reply)), format=json_schema)
+    return generate_structured_form
+
+
+def astructured_form(agenerate, json_schema, marker=FINAL_FORM_MARKER, afinalize=None):
+    """
+    Async counterpart of structured_form.
+    """
+    afinalize = afinalize or agenerate
+
+    async def agenerate_structured_form(prompt_messages):
+        extractor = FormExtractor(marker, stop_at_marker=True)
+        reply = []
+        chunks = agenerate(prompt_messages)
+        try:
+            async for chunk in chunks:
+                kept = extractor.feed(chunk)
+                if kept:
+                    reply.append(kept)
+                    yield kept
+                if extractor.marker_seen:
+                    break
+        finally:
+            await chunks.aclose()
+        if not extractor.marker_seen:
+            return
+        yield "\n"
+        async for chunk in afinalize(_finalize_messages(prompt_messages, "".join(reply)), format=json_schema):
+            yield chunk
+    return agenerate_structured_form
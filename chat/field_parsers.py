@@ -0,0 +1,225 @@
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+from authentification.models import VolunteerProfile
+
+# Month names accepted in dates, English and German (Austrian "Jänner" included)
+MONTHS = {
+    "january": 1, "jan": 1, "jänner": 1, "januar": 1,
+    "february": 2, "feb": 2, "februar": 2,
+    "march": 3, "mar": 3, "märz": 3,
+    "april": 4, "apr": 4,
+    "may": 5, "mai": 5,
+    "june": 6, "jun": 6, "juni": 6,
+    "july": 7, "jul": 7, "juli": 7,
+    "august": 8, "aug": 8,
+    "september": 9, "sep": 9, "sept": 9,
+    "october": 10, "oct": 10, "oktober": 10, "okt": 10,
+    "november": 11, "nov": 11,
+    "december": 12, "dec": 12, "dezember": 12, "dez": 12,
+}
+
+# Day names accepted in schedules, mapped to VolunteerProfile.DAYS_OF_WEEK
+DAYS = {
+    "monday": "Monday", "mon": "Monday", "montag": "Monday",
+    "tuesday": "Tuesday", "tue": "Tuesday", "dienstag": "Tuesday",
+    "wednesday": "Wednesday", "wed": "Wednesday", "mittwoch": "Wednesday",
+    "thursday": "Thursday", "thu": "Thursday", "donnerstag": "Thursday",
+    "friday": "Friday", "fri": "Friday", "freitag": "Friday",
+    "saturday": "Saturday", "sat": "Saturday", "samstag": "Saturday",
+    "sunday": "Sunday", "sun": "Sunday", "sonntag": "Sunday",
+}
+
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_DAY = "|".join(sorted(DAYS, key=len, reverse=True))
+
+# 2030-05-01 | 1.5.2030, 1/5/2030 (day first, as in Austria) | 1 May 2030, 1. Mai 2030 | May 1st, 2030
+DATE_RE = re.compile(
+    r"\b(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})\b"
+    r"|\b(?P<num_d>\d{1,2})[./](?P<num_m>\d{1,2})[./](?P<num_y>\d{4})\b"
+    rf"|\b(?P<dm_d>\d{{1,2}})\.?\s+(?P<dm_m>{_MONTH})\.?,?\s+(?P<dm_y>\d{{4}})\b"
+    rf"|\b(?P<md_m>{_MONTH})\.?\s+(?P<md_d>\d{{1,2}})(?:st|nd|rd|th)?,?\s+(?P<md_y>\d{{4}})\b",
+    re.IGNORECASE,
+)
+
+# Anything with an @ in it; EmailField decides whether it is an address
+EMAIL_RE = re.compile(r"[^\s@,;:<>()\[\]]+@[^\s@,;:<>()\[\]]+")
+
+DAY_RE = re.compile(rf"\b(?:{_DAY})\b\.?", re.IGNORECASE)
+
+# 14:00-16:00, 14-16, 9:30 to 11, 9 bis 11
+TIME_RANGE_RE = re.compile(
+    r"\b(\d{1,2})(?::(\d{2}))?\s*(?:-|–|to|until|bis)\s*(\d{1,2})(?::(\d{2}))?\b", re.IGNORECASE
+)
+
+# Username: one token of the characters Django's username validator allows
+USERNAME_RE = re.compile(r"^[\w.@+-]+$")
+
+# A username named as such anywhere in a message: "my username is jane_d", "username: jane_d"
+USERNAME_CUE_RE = re.compile(r"\buser\s?name\s*(?:is\b|:|=)\s*([\w.@+-]+)", re.IGNORECASE)
+
+# Words a message made only of field values may contain besides the values
+FILLER_WORDS = set(
+    "a an and the is are am it its it's i i'm my me on at from to until till by of for "
+    "start starts starting begin begins end ends ending date dates day days "
+    "e mail email address username user name level levels was born birth birthday "
+    "free available every each also please thanks thank you ok okay yes "
+    "von bis und am ab".split()
+)
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+def _area_words():
+    """
+    Map the words naming a competence area (its key and the words of its label) to the key.
+    """
+    words = {}
+    for key, label in VolunteerProfile.FIELD_CHOICES:
+        words[key.lower()] = key
+        for word in _WORD_RE.findall(label.lower()):
+            words.setdefault(word, key)
+    words["art"] = "ARTS"
+    return words
+
+
+AREA_WORDS = _area_words()
+AREA_RE = re.compile(
+    rf"\b({'|'.join(sorted(AREA_WORDS, key=len, reverse=True))})\b[^\d\n,;]{{0,20}}?(\d+)\b", re.IGNORECASE
+)
+
+
+def _date_text(match):
+    """
+    The date of a DATE_RE match as 'YYYY-MM-DD', which DateField either accepts or rejects
+    as an impossible date.
+    """
+    groups = match.groupdict()
+    for prefix in ("iso", "num", "dm", "md"):
+        if groups[f"{prefix}_y"]:
+            month = groups[f"{prefix}_m"]
+            month = MONTHS[month.lower()] if not month.isdigit() else int(month)
+            return f"{int(groups[f'{prefix}_y']):04d}-{month:02d}-{int(groups[f'{prefix}_d']):02d}"
+
+
+def _time_range_text(match):
+    start_hour, start_minute, end_hour, end_minute = match.groups()
+    return f"{int(start_hour):02d}:{start_minute or '00'}-{int(end_hour):02d}:{end_minute or '00'}"
+
+
+def _schedule(text):
+    """
+    Return the {day: [time ranges]} written in `text` and the spans they took.
+    """
+    days = list(DAY_RE.finditer(text))
+    schedule, spans = {}, []
+    for index, day_match in enumerate(days):
+        end = days[index + 1].start() if index + 1 < len(days) else len(text)
+        ranges = list(TIME_RANGE_RE.finditer(text, day_match.end(), end))
+        if not ranges:
+            continue
+        day = DAYS[day_match.group().rstrip(".").lower()]
+        schedule.setdefault(day, []).extend(_time_range_text(match) for match in ranges)
+        spans.append(day_match.span())
+        spans.extend(match.span() for match in ranges)
+    return schedule, spans
+
+
+def parse_field_values(model, needed, text, asked=None):
+    """
+    Find candidate values of the needed fields of a form in a user's message, without the model.
+
+    Recognized are email addresses, dates in several formats (assigned to the needed date
+    fields in the order they appear), weekly time ranges per day, competence levels per area,
+    a username introduced as such ("my username is ..."), and a bare username or gender when
+    that is the field the previous reply asked for. Any other one-word message ("hi", "yes")
+    is left to the model. The values are not validated here; see form_state.clean_field.
+
+    Parameters:
+        model: The model the form creates.
+        needed (list): Names of the fields still needed, in the order they are asked.
+        text (str): The user's message.
+        asked (str): Field the previous reply asked for, if it asked for one.
+
+    Returns:
+        tuple: ({field: value} of the candidates, whether the message says anything besides
+        them). A message with a question in it, or with more dates than date fields needed,
+        always counts as saying more.
+    """
+    values, spans = {}, []
+    email_fields = _fields_of_type(model, needed, models.EmailField)
+    for match in EMAIL_RE.finditer(text):
+        if email_fields:
+            values[email_fields.pop(0)] = match.group().rstrip(".")
+        spans.append(match.span())
+
+    date_fields = _fields_of_type(model, needed, models.DateField)
+    extra_dates = False
+    for match in DATE_RE.finditer(text):
+        if any(start <= match.start() < end for start, end in spans):
+            continue
+        if date_fields:
+            values[date_fields.pop(0)] = _date_text(match)
+        else:
+            # "from 1.5.2030 to 3.5.2030" when only one date is needed is for the model to sort out
+            extra_dates = True
+        spans.append(match.span())
+
+    if "schedule" in needed:
+        schedule, schedule_spans = _schedule(_blank(text, spans))
+        if schedule:
+            values["schedule"] = schedule
+            spans.extend(schedule_spans)
+
+    if "competencies_areas" in needed:
+        levels = {}
+        for match in AREA_RE.finditer(_blank(text, spans)):
+            levels[AREA_WORDS[match.group(1).lower()]] = int(match.group(2))
+            spans.append(match.span())
+        if levels:
+            values["competencies_areas"] = levels
+
+    if "username" in needed:
+        match = USERNAME_CUE_RE.search(_blank(text, spans))
+        if match and match.group(1).lower() not in FILLER_WORDS:
+            values["username"] = match.group(1).rstrip(".")
+            spans.append(match.span())
+
+    if not values and asked in needed:
+        answer = text.strip().rstrip(".!")
+        if asked == "username" and USERNAME_RE.match(answer) and answer.lower() not in FILLER_WORDS:
+            values[asked] = answer
+            spans.append((0, len(text)))
+        elif asked == "gender":
+            for key, label in model._meta.get_field(asked).choices:
+                if answer.lower() in (key.lower(), label.lower()):
+                    values[asked] = key
+                    spans.append((0, len(text)))
+
+    rest = _blank(text, spans)
+    says_more = extra_dates or "?" in text or any(word not in FILLER_WORDS for word in _WORD_RE.findall(rest.lower()))
+    return values, says_more
+
+
+def _fields_of_type(model, names, field_class):
+    fields = []
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if isinstance(field, field_class):
+            fields.append(name)
+    return fields
+
+
+def _blank(text, spans):
+    """
+    `text` with the given spans replaced by spaces, so offsets stay the same.
+    """
+    chars = list(text)
+    for start, end in spans:
+        chars[start:end] = " " * (end - start)
+    return "".join(chars)
@@ -0,0 +1,366 @@
+import json
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+
+from authentification.models import CustomUser, VolunteerProfile
+from chat.extraction import FIELDS_MARKER, FINAL_FORM_MARKER, extract_json_objects
+from chat.field_parsers import parse_field_values
+from chat.helpers import build_messages
+from chat.models import Task
+from chat.prompts import prompt_registry
+from chat.validators import task_date_errors
+
+# Model each form flow creates
+FORM_MODELS = {"task": Task, "user": CustomUser, "volunteer": VolunteerProfile}
+
+# Optional model fields that extract_and_create_* still insist on
+REQUIRED_FIELDS = {"volunteer": {"gender", "date_of_birth"}}
+
+# Values never repeated to the model once collected, nor stored in the conversation's messages
+SECRET_FIELDS = {"password"}
+
+# Stands in for a secret value in stored messages, see FormState.redact
+SECRET_PLACEHOLDER = "[hidden]"
+
+# Key of the password in the final form: the state only keeps its hash, see _clean_password
+PASSWORD_HASH_KEY = "password_hash"
+
+# Longest value shown in the summary of the collected fields
+SUMMARY_VALUE_CHARS = 60
+
+
+def _clean_interests(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+        raise ValidationError("Give the interests as a list of words.")
+    tags = [tag.strip() for tag in value if tag.strip()]
+    if not tags:
+        raise ValidationError("Give at least one interest.")
+    return tags
+
+
+def _clean_competencies(value):
+    areas = dict(VolunteerProfile.FIELD_CHOICES)
+    if not isinstance(value, dict) or not value:
+        raise ValidationError("Give a level from 0 to 3 for one or more areas.")
+    for area, level in value.items():
+        if area not in areas:
+            raise ValidationError(f"Invalid interest: {area}. Must be one of {list(areas)}.")
+        if isinstance(level, bool) or not isinstance(level, int) or not 0 <= level <= 3:
+            raise ValidationError(f"Level of {area} must be a whole number from 0 to 3.")
+    return value
+
+
+def _clean_schedule(value):
+    days = [day for day, _ in VolunteerProfile.DAYS_OF_WEEK]
+    if not isinstance(value, dict) or not value:
+        raise ValidationError("Give at least one day with its time ranges.")
+    profile = VolunteerProfile()
+    schedule = {}
+    for day, time_ranges in value.items():
+        if day not in days:
+            raise ValidationError(f"Invalid day: {day}. Must be one of {days}.")
+        time_ranges = [time_ranges] if isinstance(time_ranges, str) else time_ranges
+        for time_range in time_ranges:
+            if not profile._is_valid_time_range(time_range):
+                raise ValidationError(f"Invalid time range: {time_range}. Must be in 'HH:MM-HH:MM' format.")
+        schedule[day] = list(time_ranges)
+    return schedule
+
+
+def _clean_password(value):
+    # Conversation.form_state is a plain JSON column, so the password itself is never stored
+    if not isinstance(value, str) or not value:
+        raise ValidationError("Enter a password.")
+    validate_password(value)
+    return make_password(value)
+
+
+# Fields that are not a plain model field, or need more than the model field checks
+FIELD_CLEANERS = {
+    "interests": _clean_interests,
+    "competencies_areas": _clean_competencies,
+    "schedule": _clean_schedule,
+    "password": _clean_password,
+}
+
+
+def clean_field(flow, name, value):
+    """
+    Validate one value of a form flow the way the model will when the object is created.
+
+    Parameters:
+        flow (str): 'task', 'user' or 'volunteer'.
+        name (str): Field of the flow's form.
+        value: The value the user gave, as reported by the model.
+
+    Returns:
+        The cleaned value, JSON-serializable (dates as 'YYYY-MM-DD').
+
+    Raises:
+        ValidationError: If the value is not acceptable.
+    """
+    if name in FIELD_CLEANERS:
+        return FIELD_CLEANERS[name](value)
+
+    model = FORM_MODELS[flow]
+    field = model._meta.get_field(name)
+    if isinstance(value, str):
+        value = value.strip()
+        # The model may answer with the label of a choice ("Female") instead of its key
+        for key, label in field.choices or ():
+            if value.lower() == str(label).lower():
+                value = key
+    if value in (None, "") and name in REQUIRED_FIELDS.get(flow, ()):
+        raise ValidationError("This field cannot be blank.")
+    value = field.clean(value, None)
+    if name == "date_of_birth" and value is not None and value > date.today():
+        raise ValidationError(f"Date of birth {value} is in the future.")
+    if field.unique and model._default_manager.filter(**{name: value}).exists():
+        raise ValidationError(f"{str(field.verbose_name).capitalize()} '{value}' is already taken.")
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _labels(names):
+    return ", ".join(name.replace("_", " ") for name in names)
+
+
+class FormState:
+    """
+    Slot-filling state of a form conversation ('task', 'user' or 'volunteer').
+
+    Records which fields of the flow's form (prompt_registry.schema) are filled with validated
+    values. Each turn's prompt then carries only the fields still needed and a one-line summary
+    of the filled ones, along with the last few messages (settings.FORM_PROMPT_HISTORY_MESSAGES),
+    instead of the whole schema and transcript, so it shrinks as the form fills up.
+
+    The model reports the values it collected in a turn after FIELDS_MARKER. They are checked
+    with clean_field, and rejected ones go back to the model with the reason on the next turn.
+    Once every field is filled, the object is created from the state, not from a final form the
+    model writes. Between turns the state lives in Conversation.form_state.
+
+    `asked` is the field a reply made without the model asked for last (see local_reply), so a
+    bare answer to it can be taken without the model too. `secrets` holds the values of
+    SECRET_FIELDS given in this request; they are never stored, see redact.
+    """
+
+    def __init__(self, flow, values=None, errors=None, asked=None):
+        self.flow = flow
+        self.values = dict(values or {})
+        self.errors = dict(errors or {})
+        self.asked = asked
+        self.secrets = set()
+
+    @classmethod
+    def load(cls, conversation):
+        return cls(conversation.flow, **(conversation.form_state or {}))
+
+    def as_dict(self):
+        return {"values": self.values, "errors": self.errors, "asked": self.asked}
+
+    @property
+    def fields(self):
+        return prompt_registry.schema(self.flow)
+
+    @property
+    def outstanding(self):
+        return [name for name in self.fields if name not in self.values]
+
+    @property
+    def complete(self):
+        return not self.outstanding
+
+    @property
+    def needed(self):
+        """
+        Fields the model should ask for: the outstanding ones, or all of them when the form
+        is complete but could not be saved, so the user can correct any value.
+        """
+        if self.complete and NON_FIELD_ERRORS in self.errors:
+            return list(self.fields)
+        return self.outstanding
+
+    def update(self, data):
+        """
+        Take the valid values of `data` ({field: value}) into the state and record why the others
+        were rejected.
+
+        Returns:
+            list: Names of the fields accepted.
+        """
+        accepted = []
+        for name, value in data.items():
+            if name not in self.fields:
+                continue
+            if name in SECRET_FIELDS and isinstance(value, str) and value:
+                self.secrets.add(value)
+            try:
+                self.values[name] = clean_field(self.flow, name, value)
+            except ValidationError as e:
+                self.errors[name] = " ".join(e.messages)
+                continue
+            self.errors.pop(name, None)
+            accepted.append(name)
+        if self.flow == "task":
+            self._check_task_dates(accepted)
+        if accepted:
+            self.errors.pop(NON_FIELD_ERRORS, None)
+        return accepted
+
+    def _check_task_dates(self, accepted):
+        """
+        Apply the task date rules (see task_date_errors) to the dates known so far, dropping new
+        dates that break them.
+        """
+        if "start_date" not in self.values or not {"start_date", "end_date"} & set(accepted):
+            return
+        start = self.values["start_date"]
+        errors = task_date_errors(start, self.values.get("end_date", start))
+        if not errors:
+            return
+        for name in ("start_date", "end_date"):
+            if name in accepted:
+                del self.values[name]
+                accepted.remove(name)
+                self.errors[name] = " ".join(errors)
+
+    def update_from_reply(self, ai_response):
+        """
+        Take the values the model reported after FIELDS_MARKER in its reply. Returns the names
+        of the fields accepted.
+        """
+        index = ai_response.rfind(FIELDS_MARKER)
+        if index == -1:
+            return []
+        for fragment in extract_json_objects(ai_response[index + len(FIELDS_MARKER):]):
+            try:
+                data = json.loads(fragment)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return self.update(data)
+        return []
+
+    def local_reply(self, user_input):
+        """
+        Answer a message made only of field values without the model.
+
+        The values are parsed from the message (see parse_field_values) and checked on a copy
+        of the state, so dates, emails, usernames and time ranges are accepted or rejected
+        right away and the reply asks for the next field or repeats why a value was refused.
+        Like a model reply it ends with the values after FIELDS_MARKER, so complete_form takes
+        them into the state the same way.
+
+        Returns:
+            str: The reply, or None if the message needs the model (a question, other text,
+            or no recognizable value).
+        """
+        # Whatever the model replies, it is not known to ask for a single field
+        asked, self.asked = self.asked, None
+        needed = self.needed
+        candidates, says_more = parse_field_values(FORM_MODELS[self.flow], needed, user_input or "", asked)
+        if not candidates or says_more:
+            return None
+        trial = FormState(self.flow, self.values, self.errors)
+        accepted = trial.update(dict(candidates))
+        rejected = [name for name in candidates if name not in accepted]
+
+        lines = []
+        if accepted:
+            lines.append(f"Thanks, noted: {_labels(accepted)}.")
+        if rejected:
+            lines.extend(trial.errors[name] for name in rejected)
+            lines.append(f"Please give the {_labels(rejected)} again.")
+            if len(rejected) == 1:
+                self.asked = rejected[0]
+        elif trial.complete:
+            lines.append("That was the last field, saving the form.")
+        else:
+            name = self.asked = trial.needed[0]
+            lines.append(f"Next, the {_labels([name])}: {self.fields[name]}")
+        lines.append(f"{FIELDS_MARKER} {json.dumps(candidates, ensure_ascii=False)}")
+        return "\n".join(lines)
+
+    def redact(self, text):
+        """
+        `text` with the secret values given in this request replaced by SECRET_PLACEHOLDER, also
+        where the model wrote them escaped inside JSON.
+        """
+        for secret in self.secrets:
+            for written in {secret, json.dumps(secret, ensure_ascii=False)[1:-1]}:
+                text = text.replace(written, SECRET_PLACEHOLDER)
+        return text
+
+    def fail(self, message):
+        """
+        Record that the complete form could not be saved, for the model to sort out with the user.
+        """
+        self.errors[NON_FIELD_ERRORS] = message
+
+    def reset(self):
+        self.values, self.errors, self.asked = {}, {}, None
+
+    def _summary(self):
+        parts = []
+        for name, value in self.values.items():
+            if name in SECRET_FIELDS:
+                shown = "(given)"
+            else:
+                shown = json.dumps(value, ensure_ascii=False)
+                if len(shown) > SUMMARY_VALUE_CHARS:
+                    shown = shown[:SUMMARY_VALUE_CHARS - 3] + "..."
+            parts.append(f"{name}={shown}")
+        return ", ".join(parts)
+
+    def instructions(self):
+        """
+        System prompt of the next turn: the flow's rules, the fields still needed, the ones
+        already collected and the values that were rejected.
+        """
+        schema = self.fields
+        lines = [prompt_registry.get(self.flow)]
+        if NON_FIELD_ERRORS in self.errors and self.complete:
+            lines.append(
+                f"All fields are collected, but the form could not be saved: {self.errors[NON_FIELD_ERRORS]} "
+                "Ask the user which values to change."
+            )
+        lines.append("Fields still needed:")
+        lines.extend(f"- {name}: {schema[name]}" for name in self.needed)
+        if self.values:
+            lines.append(f"Already collected, do not ask for these again: {self._summary()}")
+        rejected = [name for name in self.errors if name != NON_FIELD_ERRORS]
+        if rejected:
+            lines.append("Rejected values, tell the user why and ask again:")
+            lines.extend(f"- {name}: {self.errors[name]}" for name in rejected)
+        return "\n".join(lines)
+
+    def build_messages(self, chat_history, user_input):
+        keep = settings.FORM_PROMPT_HISTORY_MESSAGES
+        return build_messages(self.instructions(), chat_history[max(len(chat_history) - keep, 0):], user_input)
+
+    def json_schema(self):
+        """
+        JSON Schema of the values the model may report this turn, for structured output: the
+        needed fields of the flow's form, none of them required.
+        """
+        properties = prompt_registry.json_schema(self.flow)["properties"]
+        return {
+            "type": "object",
+            "properties": {name: properties[name] for name in self.needed},
+            "additionalProperties": False,
+        }
+
+    def final_form(self):
+        """
+        The collected form as a reply the extract_and_create_* helpers parse. The password is
+        given as its hash, under PASSWORD_HASH_KEY.
+        """
+        values = dict(self.values)
+        if "password" in values:
+            values[PASSWORD_HASH_KEY] = values.pop("password")
+        return f"{FINAL_FORM_MARKER} {json.dumps(values)}"
@@ -1,16 +1,71 @@
 
 import json
-import re
+from django.conf import settings
 from django.contrib import messages
+from django.db import models
 from datetime import datetime, timedelta
 from django.utils.encoding import force_str
 from authentification.models import CustomUser, VolunteerProfile
+from chat.extraction import form_json_fragments
+from chat.history import estimate_tokens, window_history
 from chat.models import Task
 
 
 def get_current_time():
     return datetime.now().strftime("%d %B %Y")
 
+def build_messages(instructions, chat_history, user_input, context=None):
+    """
+    Build the role-tagged messages for the AI model from the flow instructions and the chat history.
+
+    The instructions go first as a `system` message, followed by the history as `user`/`assistant`
+    messages in their original order, so consecutive turns share a prefix that Ollama can reuse
+    from its KV cache instead of evaluating the whole prompt again.
+
+    The instructions and the new user message are always kept. The rest of
+    settings.CHAT_PROMPT_TOKEN_BUDGET goes to the most recent turns; older turns
+    are folded into a short summary so the prompt size stays flat on long chats.
+
+    `context` (retrieved portal content, see chat/retrieval.py) goes in a `system` message right
+    before the new user message, which keeps the cached prefix of earlier turns intact.
+
+    Without instructions (/chat/) the prompt must not start with a `system` message: Ollama only
+    applies the Modelfile's SYSTEM prompt when it does not, and the model would lose its persona.
+    The summary then follows the first kept message, and notes with no history before them are
+    put in front of the new user message.
+    """
+    budget = (
+        settings.CHAT_PROMPT_TOKEN_BUDGET
+        - settings.CHAT_HISTORY_SUMMARY_TOKENS
+        - estimate_tokens(instructions)
+        - estimate_tokens(user_input)
+        - estimate_tokens(context or "")
+    )
+    summary, recent = window_history(chat_history, max(budget, 0))
+
+    history = []
+    for message in recent:
+        if message['role'] == 'user':
+            history.append({'role': 'user', 'content': message['message']})
+        elif message['role'] == 'ai':
+            history.append({'role': 'assistant', 'content': message['message']})
+    if summary:
+        note = {'role': 'system', 'content': f"Summary of earlier messages from the user: {summary}"}
+        history.insert(0 if instructions else min(1, len(history)), note)
+
+    prompt_messages = []
+    if instructions:
+        prompt_messages.append({'role': 'system', 'content': instructions})
+    prompt_messages.extend(history)
+    if context:
+        prompt_messages.append({'role': 'system', 'content': context})
+
+    if not instructions and all(message['role'] == 'system' for message in prompt_messages):
+        notes = [message['content'] for message in prompt_messages]
+        return [{'role': 'user', 'content': "\n\n".join(notes + [user_input])}]
+    prompt_messages.append({'role': 'user', 'content': user_input})
+    return prompt_messages
+
 def extract_user_schema(model):
     """
     Dynamically extract the schema of a model with field names and descriptions,
@@ -48,9 +103,8 @@ def extract_and_create_user(request, ai_response: str, chat_history: list):
         bool: True if a user was successfully created, False otherwise.
     """
     try:
-        # Regex to extract JSON-like fragments
-        json_pattern = r'({.*?})'
-        json_fragments = re.findall(json_pattern, ai_response, re.DOTALL)
+        # Balanced JSON objects, the ones after the final form marker first
+        json_fragments = form_json_fragments(ai_response)
         
         for fragment in json_fragments:
             try:
@@ -61,8 +115,10 @@ def extract_and_create_user(request, ai_response: str, chat_history: list):
                 username = user_data.get('username')
                 email = user_data.get('email')
                 password = user_data.get('password')
+                # The form state hands over the hash of the password, never the password itself
+                password_hash = user_data.get('password_hash')
 
-                if not username or not email or not password:
+                if not username or not email or not (password or password_hash):
                     messages.error(request, "Missing required fields in the AI response.")
                     chat_history.append({"role": "System error", "message": "Missing required fields in the AI response."})
                     continue  # Move to the next JSON fragment
@@ -82,14 +138,21 @@ def extract_and_create_user(request, ai_response: str, chat_history: list):
                     generate_helpful_ai_response(chat_history, "email")
 
                 # Create the user with fixed role 'VOLUNTEER'
-                new_user = CustomUser.objects.create_user(
-                    username=username,
-                    email=email,
-                    password=password,
-                    first_name=user_data.get('first_name'),
-                    last_name=user_data.get('last_name'),
-                    role="VOLUNTEER",
-                )
+                fields = {
+                    'first_name': user_data.get('first_name'),
+                    'last_name': user_data.get('last_name'),
+                    'role': "VOLUNTEER",
+                }
+                if password_hash and not password:
+                    # Normalized like create_user does, but the password is hashed already
+                    new_user = CustomUser.objects.create(
+                        username=CustomUser.normalize_username(username),
+                        email=CustomUser.objects.normalize_email(email),
+                        password=password_hash,
+                        **fields,
+                    )
+                else:
+                    new_user = CustomUser.objects.create_user(username=username, email=email, password=password, **fields)
                 success_message = f"User '{username}' successfully created!"
                 messages.success(request, success_message)
                 chat_history.append({"role": "System message", "message": success_message})
@@ -151,9 +214,8 @@ def extract_task_schema(model):
 
 def extract_and_create_task(request, ai_response, chat_history):
     try:
-        # Regex to extract JSON-like fragments
-        json_pattern = r'\{.*?\}'
-        json_fragments = re.findall(json_pattern, ai_response, re.DOTALL)
+        # Balanced JSON objects, the ones after the final form marker first
+        json_fragments = form_json_fragments(ai_response)
 
         print(f"Extracted JSON fragments: {json_fragments}")  # Debugging
 
@@ -233,11 +295,82 @@ def extract_volunteer_profile_schema(model):
 
     return ordered_schema
 
+def model_json_schema(model, field_order, overrides=None):
+    """
+    Build a JSON Schema object for the given fields of a model, for Ollama's structured output.
+
+    Parameters:
+        model: The Django model class.
+        field_order (list): Names of the fields the form collects, in order.
+        overrides (dict): JSON Schemas replacing the generated ones, for JSON and tag fields.
+
+    Returns:
+        dict: An object schema requiring every field and allowing no others.
+    """
+    overrides = overrides or {}
+    properties = {}
+    for name in field_order:
+        if name in overrides:
+            properties[name] = overrides[name]
+            continue
+        field = model._meta.get_field(name)
+        field_type = field.get_internal_type()
+        if field_type in ("DateField", "DateTimeField"):
+            prop = {"type": "string", "format": "date"}
+        elif field_type in ("IntegerField", "PositiveIntegerField", "SmallIntegerField"):
+            prop = {"type": "integer"}
+        elif field_type == "ManyToManyField":
+            prop = {"type": "array", "items": {"type": "string"}}
+        else:
+            prop = {"type": "string"}
+            if field.choices:
+                prop["enum"] = [choice[0] for choice in field.choices]
+            if isinstance(field, models.EmailField):
+                prop["format"] = "email"
+            if getattr(field, "max_length", None):
+                prop["maxLength"] = field.max_length
+        if field.help_text:
+            prop["description"] = force_str(field.help_text)
+        properties[name] = prop
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(field_order),
+        "additionalProperties": False,
+    }
+
+def extract_task_json_schema(model):
+    return model_json_schema(model, list(extract_task_schema(model)))
+
+def extract_user_json_schema(model):
+    return model_json_schema(model, list(extract_user_schema(model)))
+
+def extract_volunteer_profile_json_schema(model):
+    """
+    JSON Schema of the volunteer profile form. The JSON fields get the structure their
+    clean() method validates: competence levels 0-3 per FIELD_CHOICES key and
+    'HH:MM-HH:MM' time ranges per day of the week.
+    """
+    level = {"type": "integer", "minimum": 0, "maximum": 3}
+    time_ranges = {"type": "array", "items": {"type": "string", "pattern": r"^\d{2}:\d{2}-\d{2}:\d{2}$"}}
+    overrides = {
+        "competencies_areas": {
+            "type": "object",
+            "properties": {key: level for key, _ in model.FIELD_CHOICES},
+            "additionalProperties": False,
+        },
+        "schedule": {
+            "type": "object",
+            "properties": {day: time_ranges for day, _ in model.DAYS_OF_WEEK},
+            "additionalProperties": False,
+        },
+    }
+    return model_json_schema(model, list(extract_volunteer_profile_schema(model)), overrides)
+
 def extract_and_create_volunteer_profile(request, ai_response, chat_history):
     try:
-        # Regex to extract JSON-like fragments
-        json_pattern = r'\{.*?\}'
-        json_fragments = re.findall(json_pattern, ai_response, re.DOTALL)
+        # Balanced JSON objects, the ones after the final form marker first
+        json_fragments = form_json_fragments(ai_response)
 
         print(f"Extracted JSON fragments: {json_fragments}")  # Debugging
 
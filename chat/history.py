@@ -0,0 +1,99 @@
+from django.conf import settings
+
+# Llama 3's tokenizer averages roughly four characters per token on English and German text.
+# Counting characters is far cheaper than running a tokenizer and close enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+# Longest excerpt of a dropped message that is kept in the summary of older turns
+SUMMARY_SNIPPET_CHARS = 200
+
+PROMPT_ROLES = ('user', 'ai')
+
+# Once history has to be dropped, the window start only moves in steps of this many messages.
+# Between steps consecutive prompts share the same prefix, which keeps Ollama's KV cache warm.
+WINDOW_STEP = 8
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many tokens the model will see for `text`.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def summarize_messages(messages, budget):
+    """
+    Build a compact, extractive summary of turns that no longer fit into the prompt.
+
+    Only user messages are kept because they carry the facts the form flows collect
+    (names, dates, e-mails...). The newest ones win when the summary budget runs out.
+
+    Parameters:
+        messages (iterable): Dropped chat history entries, newest first.
+        budget (int): Maximum number of tokens the summary may use.
+
+    Returns:
+        str: The summary, or an empty string if there is nothing to summarize.
+    """
+    snippets = []
+    used = 0
+    for message in messages:
+        if message['role'] != 'user':
+            continue
+        text = message['message']
+        if len(text) > SUMMARY_SNIPPET_CHARS:
+            text = text[:SUMMARY_SNIPPET_CHARS] + "..."
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            break
+        snippets.append(text)
+        used += cost
+    snippets.reverse()
+    return " | ".join(snippets)
+
+
+def window_history(chat_history, budget, summary_budget=None):
+    """
+    Split the chat history into a summary of older turns and the recent turns kept verbatim.
+
+    The history is walked from the newest message backwards, so the work per turn depends
+    on the budget and not on how long the conversation already is. The window start is
+    aligned to WINDOW_STEP so it stays put for several turns in a row.
+
+    Parameters:
+        chat_history (list): Chat history entries as stored in the session.
+        budget (int): Tokens available for verbatim history.
+        summary_budget (int): Tokens available for the summary of dropped turns.
+
+    Returns:
+        tuple: (summary, recent) where `recent` is the list of kept messages, oldest first.
+    """
+    if summary_budget is None:
+        summary_budget = settings.CHAT_HISTORY_SUMMARY_TOKENS
+
+    recent = []
+    used = 0
+    index = len(chat_history)
+    while index > 0:
+        message = chat_history[index - 1]
+        if message['role'] in PROMPT_ROLES:
+            cost = estimate_tokens(message['message'])
+            if used + cost > budget:
+                break
+            recent.append(message)
+            used += cost
+        index -= 1
+    recent.reverse()
+
+    if index > 0:
+        # Drop a few more messages so the start lands on a WINDOW_STEP boundary
+        aligned = -(-index // WINDOW_STEP) * WINDOW_STEP
+        skipped = sum(1 for message in chat_history[index:aligned] if message['role'] in PROMPT_ROLES)
+        recent = recent[skipped:]
+        index = min(aligned, len(chat_history))
+
+    summary = ""
+    if index > 0:
+        dropped = (chat_history[i] for i in range(index - 1, -1, -1))
+        summary = summarize_messages(dropped, summary_budget)
+    return summary, recent
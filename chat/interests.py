@@ -0,0 +1,217 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from authentification.models import VolunteerProfile
+
+
+# Separates the tags of a profile in InterestIndex._profiles; normalized tags hold no newline
+TAG_SEPARATOR = "\n"
+
+
+def normalize_tag(name):
+    return " ".join(str(name).split()).lower()
+
+
+def bitmap_ids(bits):
+    """
+    Return the ids set in a bitmap, ascending.
+    """
+    digits = bin(bits)[:1:-1]
+    ids = []
+    position = digits.find("1")
+    while position != -1:
+        ids.append(position)
+        position = digits.find("1", position + 1)
+    return ids
+
+
+def ids_bitmap(ids):
+    """
+    Return the bitmap of some ids, built in one buffer: OR-ing the bits into an int one by one
+    would copy the whole int for every id.
+    """
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for profile_id in ids:
+        buffer[profile_id >> 3] |= 1 << (profile_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class InterestIndex:
+    """
+    Inverted index of the volunteers' interest tags, so searching by several interests is a
+    set operation in memory instead of one generic-relation join per tag.
+
+    Every tag (compared case-insensitively) maps to a bitmap of the VolunteerProfile ids
+    carrying it, a Python int with bit n set for profile n. An AND query intersects the
+    bitmaps, an OR query unites them. A sorted list of the tag names answers prefix lookups
+    for autocompletion with a binary search.
+
+    An int cannot be changed in place, so the bitmaps are built once per tag when the index is
+    loaded, and a change of one profile only rebuilds the bitmaps of the tags it gained or lost.
+    The tags of each profile are kept as one string (TAG_SEPARATOR between them) rather than a
+    set: strings are not tracked by the garbage collector, so loading hundreds of thousands of
+    profiles does not set off collection after collection.
+
+    The index is loaded on first use. Tag changes made in this process update it through
+    taggit's m2m_changed signal (see ChatConfig.ready); every
+    settings.INTEREST_INDEX_RELOAD_SECONDS it is reloaded to pick up changes made by other
+    worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._postings = {}
+        self._names = {}
+        self._sorted = []
+        self._profiles = {}
+
+    def load(self):
+        """
+        (Re)load the tags of every volunteer profile from the database.
+        """
+        through = VolunteerProfile.interests.through
+        rows = through.objects.filter(
+            content_type=ContentType.objects.get_for_model(VolunteerProfile),
+            object_id__in=VolunteerProfile.objects.values("pk"),
+        ).values_list("object_id", "tag__name")
+        with self._lock:
+            self.build(rows.iterator(chunk_size=5000))
+
+    def build(self, rows):
+        """
+        Replace the index with the (profile id, tag name) pairs of `rows`.
+        """
+        ids = {}
+        names = {}
+        profiles = {}
+        normalized = {}
+        for profile_id, name in rows:
+            tag = normalized.get(name)
+            if tag is None:
+                tag = normalized[name] = normalize_tag(name)
+                if tag:
+                    names.setdefault(tag, name)
+            if not tag:
+                continue
+            ids.setdefault(tag, []).append(profile_id)
+            known = profiles.get(profile_id)
+            profiles[profile_id] = tag if known is None else known + TAG_SEPARATOR + tag
+        with self._lock:
+            self._postings = {tag: ids_bitmap(tag_ids) for tag, tag_ids in ids.items()}
+            self._names = names
+            self._profiles = profiles
+            self._sorted = sorted(self._postings)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > settings.INTEREST_INDEX_RELOAD_SECONDS:
+            self.load()
+
+    def _set_tags(self, profile_id, names):
+        """
+        Give a profile the tags `names`, changing only the bitmaps of the tags it gains or loses.
+        """
+        tags = {}
+        for name in names:
+            tag = normalize_tag(name)
+            if tag:
+                tags.setdefault(tag, name)
+        known = self._profiles.pop(profile_id, "")
+        old = set(known.split(TAG_SEPARATOR)) if known else set()
+        bit = 1 << profile_id
+        for tag in old - tags.keys():
+            bits = self._postings[tag] & ~bit
+            if bits:
+                self._postings[tag] = bits
+            else:
+                del self._postings[tag]
+                del self._names[tag]
+                del self._sorted[bisect.bisect_left(self._sorted, tag)]
+        for tag in tags.keys() - old:
+            if tag not in self._postings:
+                self._postings[tag] = 0
+                self._names[tag] = tags[tag]
+                bisect.insort(self._sorted, tag)
+            self._postings[tag] |= bit
+        if tags:
+            self._profiles[profile_id] = TAG_SEPARATOR.join(tags)
+
+    def update(self, profile):
+        """
+        Replace the tags of one profile with those in the database. A no-op until the index has been loaded.
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+        names = list(profile.interests.values_list("name", flat=True))
+        with self._lock:
+            if self._loaded_at is not None:
+                self._set_tags(profile.pk, names)
+
+    def remove(self, profile_id):
+        with self._lock:
+            self._set_tags(profile_id, ())
+
+    def search(self, tags, match_all=True):
+        """
+        Return the ids of the volunteer profiles carrying the given tags, ascending.
+
+        Parameters:
+            tags (list): Tag names, compared case-insensitively.
+            match_all (bool): True for profiles with every tag (AND), False for any of them (OR).
+
+        Returns:
+            list: VolunteerProfile ids.
+        """
+        tags = {normalize_tag(tag) for tag in tags} - {""}
+        if not tags:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            postings = [self._postings.get(tag, 0) for tag in tags]
+        if match_all:
+            # Start from the rarest tag so the intermediate bitmaps stay small
+            postings.sort(key=int.bit_count)
+            bits = postings[0]
+            for other in postings[1:]:
+                if not bits:
+                    break
+                bits &= other
+        else:
+            bits = 0
+            for other in postings:
+                bits |= other
+        return bitmap_ids(bits)
+
+    def autocomplete(self, prefix, limit=10):
+        """
+        Return up to `limit` tags starting with `prefix` as [(name, number of volunteers)],
+        the most used first.
+        """
+        prefix = normalize_tag(prefix)
+        with self._lock:
+            self._ensure_loaded()
+            start = bisect.bisect_left(self._sorted, prefix)
+            end = bisect.bisect_left(self._sorted, prefix + "\uffff", lo=start)
+            matches = [(self._names[tag], self._postings[tag].bit_count()) for tag in self._sorted[start:end]]
+        matches.sort(key=lambda match: (-match[1], match[0].lower()))
+        return matches[:limit]
+
+
+interest_index = InterestIndex()
+
+
+def interests_changed(sender, instance, action, reverse, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear") and not reverse and isinstance(instance, VolunteerProfile):
+        interest_index.update(instance)
+
+
+def profile_deleted(sender, instance, **kwargs):
+    interest_index.remove(instance.pk)
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.retrieval import build_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed the current tasks, the NPO profiles and the FAQ into a new version of the retrieval "
+        "index used by /chat/. Running workers pick it up without a restart. Meant to run regularly, "
+        "e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=64,
+                            help="Documents embedded per request to Ollama.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            count = build_index(batch_size=options["batch_size"])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Indexed {count} documents into {settings.RAG_INDEX_DIR} in {time.monotonic() - started:.1f}s."
+        )
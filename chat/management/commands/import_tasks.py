@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentification.models import CustomUser
+from chat.task_import import IMPORT_FORMATS, TaskImporter, import_format, read_rows, text_stream
+
+
+class Command(BaseCommand):
+    help = (
+        "Import tasks for an NPO manager from a CSV or JSONL file with the columns name, description, "
+        "start_date and end_date (YYYY-MM-DD). Rows are checked with the date rules of the task form "
+        "and inserted in batches; every row is reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import.")
+        parser.add_argument("--owner", required=True, help="Username of the NPO manager the tasks belong to.")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="File format, taken from the extension if not given.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT and transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the rows.")
+        parser.add_argument("--report", help="Write the per-row report as JSONL to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            owner = CustomUser.objects.get(username=options["owner"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}.")
+        if owner.role != "NPO_MANAGER":
+            raise CommandError(f"{owner.username} is not an NPO manager.")
+        try:
+            fmt = import_format(options["path"], options["format"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        importer = TaskImporter(owner, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        try:
+            with open(options["path"], "rb") as f:
+                importer.run(read_rows(text_stream(f), fmt))
+        except OSError as e:
+            raise CommandError(str(e))
+        except UnicodeDecodeError:
+            raise CommandError("The file is not UTF-8 encoded.")
+        elapsed = time.monotonic() - started
+
+        for entry in importer.report:
+            if entry["errors"]:
+                self.stderr.write(f"line {entry['line']}: {entry['status']}: {' '.join(entry['errors'])}")
+        if options["report"]:
+            with open(options["report"], "w") as f:
+                for entry in importer.report:
+                    f.write(json.dumps(entry) + "\n")
+
+        summary = importer.summary()
+        self.stdout.write(
+            f"{'Validated' if options['dry_run'] else 'Imported'} {options['path']} in {elapsed:.2f}s: "
+            f"{summary['created']} created, {summary['valid']} valid, {summary['invalid']} invalid, "
+            f"{summary['failed']} failed"
+        )
@@ -0,0 +1,59 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.task_import import IMPORT_FORMATS, import_format, read_rows, text_stream
+from chat.volunteer_import import VOLUNTEER_COLUMNS, VolunteerImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Create volunteer accounts with their profiles from a CSV or JSONL file. Needed columns: username, "
+        "email, first_name; optional: last_name, password, gender, date_of_birth, short_description, "
+        "goal_statement, competencies_areas and schedule (JSON objects, as JSON text in CSV) and interests "
+        "(a list, comma separated in CSV). Passwords are hashed on all cores and rows inserted in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import.")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="File format, taken from the extension if not given.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows per transaction.")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Processes hashing passwords, all cores if not given.")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the rows.")
+        parser.add_argument("--report", help="Write the per-row report as JSONL to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            fmt = import_format(options["path"], options["format"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        importer = VolunteerImporter(
+            batch_size=options["batch_size"], workers=options["workers"], dry_run=options["dry_run"]
+        )
+        try:
+            with open(options["path"], "rb") as f:
+                importer.run(read_rows(text_stream(f), fmt, VOLUNTEER_COLUMNS))
+        except OSError as e:
+            raise CommandError(str(e))
+        except UnicodeDecodeError:
+            raise CommandError("The file is not UTF-8 encoded.")
+        elapsed = time.monotonic() - started
+
+        for entry in importer.report:
+            if entry["errors"]:
+                self.stderr.write(f"line {entry['line']}: {entry['status']}: {' '.join(entry['errors'])}")
+        if options["report"]:
+            with open(options["report"], "w") as f:
+                for entry in importer.report:
+                    f.write(json.dumps(entry) + "\n")
+
+        summary = importer.summary()
+        self.stdout.write(
+            f"{'Validated' if options['dry_run'] else 'Imported'} {options['path']} in {elapsed:.2f}s "
+            f"with {importer.workers} hashing processes: {summary['created']} created, {summary['valid']} valid, "
+            f"{summary['invalid']} invalid, {summary['failed']} failed"
+        )
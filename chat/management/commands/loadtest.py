@@ -0,0 +1,233 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+from authentification.models import CustomUser
+
+# Page of every flow, and who may use it
+ENDPOINTS = {
+    "chat": {"path": "/chat/", "role": None},
+    "form": {"path": "/form-creation/", "role": "NPO_MANAGER"},
+    "user": {"path": "/user-creation/", "role": None},
+    "volunteer": {"path": "/vonboard/", "role": "VOLUNTEER"},
+}
+
+# What a visitor types, turn after turn, in each flow
+SESSION_SCRIPTS = {
+    "chat": [
+        "What is this portal for?",
+        "How can I find volunteering tasks near Vienna?",
+        "Do I need any experience to help?",
+        "Thanks, how do I sign up?",
+    ],
+    "form": [
+        "I want to create a task for a park clean-up.",
+        "It is called Prater Clean-Up, we collect litter along the main alley.",
+        "It starts on the first of next month and ends two weeks later.",
+        "Yes, that is correct, please finalize.",
+    ],
+    "user": [
+        "Hi, I would like to register as a volunteer.",
+        "My username is loadtester and my email is loadtester@example.com.",
+        "My name is Alex Example, the password is Secret123!",
+        "Secret123!",
+    ],
+    "volunteer": [
+        "Let's set up my volunteer profile.",
+        "I'm interested in education and technology, level 2 for both.",
+        "I am available on Mondays 14:00-16:00 and Fridays 10:00-12:00.",
+        "That's all, please finalize.",
+    ],
+}
+
+LOADTEST_PASSWORD = "loadtest-password"
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers, None for an empty list.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the chat pages of a running server with concurrent multi-turn sessions and report "
+        "p50/p95/p99 time to first token, total latency and requests per second per concurrency "
+        "level. Run it against a server backed by `manage.py ollama_stub` for a repeatable baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", default="1,4,16",
+                            help="Comma separated numbers of concurrent sessions, one run per level.")
+        parser.add_argument("--sessions", type=int, default=20, help="Sessions per concurrency level.")
+        parser.add_argument("--turns", type=int, default=3, help="Messages sent per session.")
+        parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                            help=f"Comma separated flows to drive, out of {', '.join(ENDPOINTS)}.")
+        parser.add_argument("--prefix", default="", help="Prefix of the page paths, e.g. /async for the async views.")
+        parser.add_argument("--timeout", type=float, default=300.0)
+        parser.add_argument("--create-users", action="store_true",
+                            help="Create the NPO manager and volunteer accounts the form flows sign in with. "
+                                 "Needs the same database as the server.")
+        parser.add_argument("--output", help="Also write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        try:
+            levels = [int(level) for level in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma separated list of numbers.")
+
+        if options["create_users"]:
+            self._create_users(max(levels), endpoints)
+
+        results = {}
+        for level in levels:
+            self.stdout.write(f"\nConcurrency {level}: {options['sessions']} sessions of {options['turns']} turns")
+            results[level] = self._run_level(level, endpoints, options)
+            self._report(results[level])
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({str(level): summary for level, summary in results.items()}, f, indent=2)
+            self.stdout.write(f"\nResults written to {options['output']}")
+
+    def _create_users(self, count, endpoints):
+        for name in endpoints:
+            role = ENDPOINTS[name]["role"]
+            if role is None:
+                continue
+            for index in range(count):
+                username = f"loadtest_{role.lower()}_{index}"
+                if CustomUser.objects.filter(username=username).exists():
+                    continue
+                CustomUser.objects.create_user(
+                    username=username,
+                    email=f"{username}@example.com",
+                    password=LOADTEST_PASSWORD,
+                    first_name="Load",
+                    last_name="Test",
+                    role=role,
+                )
+
+    def _run_level(self, level, endpoints, options):
+        samples = []
+        samples_lock = threading.Lock()
+
+        def run_session(number):
+            name = endpoints[number % len(endpoints)]
+            for sample in self._run_session(name, number % level, options):
+                with samples_lock:
+                    samples.append(sample)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=level) as executor:
+            list(executor.map(run_session, range(options["sessions"])))
+        elapsed = time.monotonic() - started
+        return self._summarize(samples, elapsed)
+
+    def _run_session(self, name, worker, options):
+        """
+        Play one scripted conversation and return a sample per turn.
+        """
+        endpoint = ENDPOINTS[name]
+        path = options["prefix"] + endpoint["path"]
+        samples = []
+        with httpx.Client(base_url=options["base_url"], timeout=options["timeout"]) as client:
+            if endpoint["role"] is not None and not self._sign_in(client, f"loadtest_{endpoint['role'].lower()}_{worker}"):
+                return [{"endpoint": name, "status": "signin_failed", "ttft": None, "total": None}]
+            client.get(path)
+            script = SESSION_SCRIPTS[name]
+            for turn in range(options["turns"]):
+                samples.append(self._send_turn(client, name, path, script[turn % len(script)]))
+        return samples
+
+    def _sign_in(self, client, username):
+        client.get("/signin/")
+        response = client.post(
+            "/signin/",
+            data={"username": username, "password": LOADTEST_PASSWORD},
+            headers={"X-CSRFToken": client.cookies.get("csrftoken", "")},
+        )
+        return response.status_code == 302 and "sessionid" in client.cookies
+
+    def _send_turn(self, client, name, path, message):
+        started = time.monotonic()
+        ttft = None
+        status = "ok"
+        try:
+            with client.stream(
+                "POST", path,
+                data={"user_input": message, "stream": "1"},
+                headers={"X-CSRFToken": client.cookies.get("csrftoken", ""), "Accept": "text/event-stream"},
+            ) as response:
+                if response.status_code == 503:
+                    status = "busy"
+                elif response.status_code != 200:
+                    status = f"http_{response.status_code}"
+                event = None
+                for line in response.iter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                        if ttft is None and event == "token":
+                            ttft = time.monotonic() - started
+                    elif line.startswith("data: ") and event == "error":
+                        # The queue filled up once the stream had started
+                        status = "busy" if "retry_after" in json.loads(line[len("data: "):]) else "error"
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        return {"endpoint": name, "status": status, "ttft": ttft, "total": time.monotonic() - started}
+
+    def _summarize(self, samples, elapsed):
+        by_endpoint = defaultdict(list)
+        for sample in samples:
+            by_endpoint[sample["endpoint"]].append(sample)
+        by_endpoint["all"] = samples
+
+        summary = {"elapsed": elapsed, "endpoints": {}}
+        for name, group in by_endpoint.items():
+            ok = [sample for sample in group if sample["status"] == "ok"]
+            ttfts = [sample["ttft"] for sample in ok if sample["ttft"] is not None]
+            totals = [sample["total"] for sample in ok]
+            errors = defaultdict(int)
+            for sample in group:
+                if sample["status"] != "ok":
+                    errors[sample["status"]] += 1
+            summary["endpoints"][name] = {
+                "requests": len(group),
+                "ok": len(ok),
+                "errors": dict(errors),
+                "rps": len(ok) / elapsed if elapsed else 0.0,
+                "ttft": {p: percentile(ttfts, fraction) for p, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+                "total": {p: percentile(totals, fraction) for p, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            }
+        return summary
+
+    def _report(self, summary):
+        def seconds(value):
+            return "-" if value is None else f"{value:.3f}"
+
+        header = (f"{'endpoint':<10} {'req':>5} {'ok':>5} {'rps':>7}   "
+                  f"{'ttft p50':>8} {'p95':>7} {'p99':>7}   {'total p50':>9} {'p95':>7} {'p99':>7}   errors")
+        self.stdout.write(header)
+        for name, row in summary["endpoints"].items():
+            errors = ", ".join(f"{status}={count}" for status, count in row["errors"].items()) or "-"
+            self.stdout.write(
+                f"{name:<10} {row['requests']:>5} {row['ok']:>5} {row['rps']:>7.2f}   "
+                f"{seconds(row['ttft']['p50']):>8} {seconds(row['ttft']['p95']):>7} {seconds(row['ttft']['p99']):>7}   "
+                f"{seconds(row['total']['p50']):>9} {seconds(row['total']['p95']):>7} {seconds(row['total']['p99']):>7}   "
+                f"{errors}"
+            )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from chat.stub_ollama import StubOllamaServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run an Ollama-compatible stub server that streams made-up replies with a configurable "
+        "time to first token, decode speed, jitter and error rate. Point OLLAMA_HOST(S) at it "
+        "to load test the app without a model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=11435)
+        parser.add_argument("--ttft", type=float, default=0.3, help="Seconds before the first token.")
+        parser.add_argument("--tokens-per-second", type=float, default=30.0)
+        parser.add_argument("--reply-tokens", type=int, default=60, help="Tokens per reply.")
+        parser.add_argument("--jitter", type=float, default=0.2, help="Relative random variation of the delays.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of chat requests failing with 500.")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = StubOllamaServer(
+            host=options["host"],
+            port=options["port"],
+            ttft=options["ttft"],
+            tokens_per_second=options["tokens_per_second"],
+            reply_tokens=options["reply_tokens"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            seed=options["seed"],
+        )
+        self.stdout.write(f"Stub Ollama listening on {server.url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from chat.models import Conversation
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Delete the rows of a queryset a batch at a time, each batch in its own short transaction so
+    the write lock is never held for long. Returns the number of rows deleted.
+    """
+    deleted = 0
+    model = queryset.model
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def sqlite_size():
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA page_count")
+        pages = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return pages * cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in batches, optionally with the anonymous conversations nobody can "
+        "reach any more, and compact the database. Meant to run regularly, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Rows per DELETE, settings.SESSION_PRUNE_BATCH_SIZE by default.")
+        parser.add_argument("--conversations", action="store_true",
+                            help="Also delete anonymous conversations without a message for longer than "
+                                 "SESSION_COOKIE_AGE; the sessions pointing to them have expired.")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="Compact the SQLite database afterwards. Locks the database while it runs.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or settings.SESSION_PRUNE_BATCH_SIZE
+        now = timezone.now()
+
+        deleted = delete_in_batches(Session.objects.filter(expire_date__lt=now), batch_size)
+        self.stdout.write(f"Deleted {deleted} expired sessions.")
+
+        if options["conversations"]:
+            idle_since = now - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+            abandoned = (
+                Conversation.objects.filter(user__isnull=True, created_at__lt=idle_since)
+                .exclude(messages__created_at__gte=idle_since)
+            )
+            deleted = delete_in_batches(abandoned, batch_size)
+            self.stdout.write(f"Deleted {deleted} abandoned anonymous conversations.")
+
+        if options["vacuum"]:
+            if connection.vendor != "sqlite":
+                self.stdout.write("Skipping VACUUM, the database is not SQLite.")
+                return
+            before = sqlite_size()
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.stdout.write(f"Compacted the database from {before / 1e6:.1f} MB to {sqlite_size() / 1e6:.1f} MB.")
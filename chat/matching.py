@@ -0,0 +1,215 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+
+from authentification.availability import AVAILABILITY_FIELDS, DAYS
+from authentification.models import VolunteerProfile
+
+try:
+    import numpy as np
+except ImportError:  # The matching engine is unavailable without numpy
+    np = None
+
+# Competence areas in column order of the level matrix
+AREAS = [key for key, _ in VolunteerProfile.FIELD_CHOICES]
+
+# Words in a task's name or description that point to a competence area
+AREA_KEYWORDS = {
+    "ENVIRONMENT": ("environment", "nature", "park", "clean", "climate", "tree", "garden", "recycl", "animal"),
+    "EDUCATION": ("education", "teach", "tutor", "school", "student", "learn", "homework", "course", "reading"),
+    "HEALTH": ("health", "care", "hospital", "elderly", "nurs", "wellness", "sport", "medical", "first aid"),
+    "ARTS": ("art", "culture", "music", "museum", "theatre", "theater", "paint", "festival", "concert"),
+    "TECH": ("tech", "computer", "software", "digital", "website", "it support", "coding", "program", "data"),
+    "OTHER": (),
+}
+
+MAX_LEVEL = 3
+
+# Share of the score given by competence match and by availability on the task's days
+COMPETENCE_WEIGHT = 0.7
+AVAILABILITY_WEIGHT = 0.3
+
+
+def competence_levels(competencies_areas):
+    """
+    Turn competencies_areas ({'EDUCATION': 3, ...}) into one level per area, clamped to 0-3.
+    """
+    if not isinstance(competencies_areas, dict):
+        competencies_areas = {}
+    return [min(max(_as_number(competencies_areas.get(area, 0)), 0), MAX_LEVEL) for area in AREAS]
+
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def task_requirements(task):
+    """
+    Weight of every competence area for a task, from the keywords in its name and description.
+    A task matching no keyword weighs all areas equally.
+    """
+    text = f"{task.name} {task.description}".lower()
+    hits = [sum(text.count(keyword) for keyword in AREA_KEYWORDS.get(area, ())) for area in AREAS]
+    total = sum(hits)
+    if not total:
+        return [1 / len(AREAS)] * len(AREAS)
+    return [hit / total for hit in hits]
+
+
+def task_days(task):
+    """
+    Which weekdays the task runs on: every day between its start and end date.
+    """
+    days = [False] * len(DAYS)
+    start, end = task.start_date, task.end_date
+    if not start or not end or end < start:
+        return [True] * len(DAYS)
+    for offset in range(min((end - start).days + 1, len(DAYS))):
+        days[(start + timedelta(days=offset)).weekday()] = True
+    return days
+
+
+class MatchingEngine:
+    """
+    Ranks volunteers for a task with NumPy instead of a loop over ORM objects.
+
+    Every volunteer profile is a row in two dense arrays: the competence levels per area
+    (float32, N x areas) and the available hours per weekday (the profile's availability
+    bitmask columns, uint32, N x 7). A task
+    becomes an area weight vector and a set of weekdays, so scoring all volunteers is one
+    matrix-vector product plus a bitmask test, and the top K come from argpartition.
+
+    The arrays are loaded on first use. Profiles saved or deleted in this process update their
+    row through the VolunteerProfile signals (see ChatConfig.ready); every
+    settings.MATCHING_RELOAD_SECONDS the arrays are reloaded to pick up changes made by other
+    worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._size = 0
+        self._rows = {}
+        self.user_ids = None
+        self.levels = None
+        self.availability = None
+        self.active = None
+
+    def _allocate(self, capacity):
+        self.user_ids = np.zeros(capacity, dtype=np.int64)
+        self.levels = np.zeros((capacity, len(AREAS)), dtype=np.float32)
+        self.availability = np.zeros((capacity, len(DAYS)), dtype=np.uint32)
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        capacity = max(2 * len(self.user_ids), 1024)
+        for name in ("user_ids", "levels", "availability", "active"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def load(self):
+        """
+        (Re)load every volunteer profile from the database.
+        """
+        if np is None:
+            raise RuntimeError("The matching engine needs numpy installed.")
+        rows = VolunteerProfile.objects.values_list("user_id", "competencies_areas", *AVAILABILITY_FIELDS.values())
+        with self._lock:
+            count = VolunteerProfile.objects.count()
+            self._allocate(max(count, 1024))
+            self._rows = {}
+            self._size = 0
+            for user_id, competencies_areas, *masks in rows.iterator(chunk_size=2000):
+                self._set_row(user_id, competencies_areas, masks)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > settings.MATCHING_RELOAD_SECONDS:
+            self.load()
+
+    def _set_row(self, user_id, competencies_areas, masks):
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._size == len(self.user_ids):
+                self._grow()
+            row = self._rows[user_id] = self._size
+            self._size += 1
+        self.user_ids[row] = user_id
+        self.levels[row] = competence_levels(competencies_areas)
+        self.availability[row] = masks
+        self.active[row] = True
+
+    def update(self, profile):
+        """
+        Refresh the row of one profile. A no-op until the arrays have been loaded.
+        """
+        with self._lock:
+            if self._loaded_at is not None:
+                self._set_row(profile.user_id, profile.competencies_areas, profile.availability_masks())
+
+    def remove(self, user_id):
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is not None:
+                self.active[row] = False
+
+    def scores(self, requirements, days, hours=None):
+        """
+        Score every loaded volunteer, 0 to 1.
+
+        Parameters:
+            requirements (list): Weight of every competence area, summing to 1.
+            days (list): Seven booleans, the weekdays the task runs on.
+            hours (int): Optional 24-bit mask of the hours the task needs on those days.
+
+        Returns:
+            tuple: (user ids, scores) of the active rows.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            size = self._size
+            active = self.active[:size]
+            user_ids = self.user_ids[:size][active]
+            levels = self.levels[:size][active]
+            availability = self.availability[:size][active]
+
+        competence = levels @ (np.asarray(requirements, dtype=np.float32) / MAX_LEVEL)
+        day_columns = np.flatnonzero(np.asarray(days, dtype=bool))
+        if len(day_columns) == 0:
+            available = np.ones(len(user_ids), dtype=np.float32)
+        else:
+            slots = availability[:, day_columns]
+            if hours is not None:
+                slots = slots & np.uint32(hours)
+            available = (slots != 0).mean(axis=1, dtype=np.float32)
+        return user_ids, COMPETENCE_WEIGHT * competence + AVAILABILITY_WEIGHT * available
+
+    def top_k(self, task, k=10, hours=None):
+        """
+        Return the k best volunteers for a task as [(user id, score)], best first.
+        """
+        user_ids, scores = self.scores(task_requirements(task), task_days(task), hours)
+        if len(scores) == 0:
+            return []
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(user_ids[i]), float(scores[i])) for i in best]
+
+
+matching_engine = MatchingEngine()
+
+
+def profile_saved(sender, instance, **kwargs):
+    matching_engine.update(instance)
+
+
+def profile_deleted(sender, instance, **kwargs):
+    matching_engine.remove(instance.user_id)
@@ -0,0 +1,249 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from chat.scheduler import call_on_close
+
+# Upper bounds of the histogram buckets, by the unit of the metric
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKENS_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+# Every metric recorded per view, with its buckets and help text
+METRICS = {
+    "request_seconds": (SECONDS_BUCKETS, "Time from the start of the request to the end of the response, POST requests only."),
+    "history_load_seconds": (SECONDS_BUCKETS, "Time finding the conversation and loading its history."),
+    "history_save_seconds": (SECONDS_BUCKETS, "Time storing the new messages of the turn."),
+    "retrieval_seconds": (SECONDS_BUCKETS, "Time embedding the question and searching the retrieval index."),
+    "prompt_build_seconds": (SECONDS_BUCKETS, "Time building the prompt messages."),
+    "queue_wait_seconds": (SECONDS_BUCKETS, "Time a model call waited for an inference slot."),
+    "ttft_seconds": (SECONDS_BUCKETS, "Time from getting an inference slot to the first token of the model."),
+    "finalize_seconds": (SECONDS_BUCKETS, "Time of the structured output call producing the form values."),
+    "extract_seconds": (SECONDS_BUCKETS, "Time in extract_and_create_* turning the final form into objects."),
+    "load_seconds": (SECONDS_BUCKETS, "Time Ollama spent loading the model."),
+    "prompt_eval_seconds": (SECONDS_BUCKETS, "Time Ollama spent evaluating the prompt."),
+    "prompt_eval_tokens": (TOKENS_BUCKETS, "Prompt tokens Ollama evaluated (cached prefix tokens excluded)."),
+    "eval_seconds": (SECONDS_BUCKETS, "Time Ollama spent generating the reply."),
+    "eval_tokens": (TOKENS_BUCKETS, "Tokens Ollama generated."),
+    "tokens_per_second": (RATE_BUCKETS, "Decode speed, eval tokens over eval time."),
+}
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, in the shape Prometheus expects.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """
+    Histograms of the metrics of every view, kept in memory per worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, view, metric, value):
+        buckets, _ = METRICS[metric]
+        with self._lock:
+            histogram = self._histograms.get((view, metric))
+            if histogram is None:
+                histogram = self._histograms[(view, metric)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def snapshot(self):
+        """
+        Return {view: {metric: {"count", "sum", "buckets": {bound: cumulative count}}}}.
+        """
+        with self._lock:
+            data = {}
+            for (view, metric), histogram in sorted(self._histograms.items()):
+                data.setdefault(view, {})[metric] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": {("+Inf" if bound == float("inf") else bound): total
+                                for bound, total in histogram.cumulative()},
+                }
+            return data
+
+    def render_prometheus(self):
+        """
+        Render every histogram in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for metric, (_, help_text) in METRICS.items():
+                series = [(view, h) for (view, name), h in sorted(self._histograms.items()) if name == metric]
+                if not series:
+                    continue
+                name = f"chat_{metric}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for view, histogram in series:
+                    for bound, total in histogram.cumulative():
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f'{name}_bucket{{view="{view}",le="{le}"}} {total}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Metrics of one request, recorded into the registry under the view's name as they happen.
+    """
+
+    def __init__(self, view, registry=None):
+        self.view = view
+        self.registry = registry or metrics_registry
+        self.started = time.perf_counter()
+        self._first_token_seen = False
+
+    def observe(self, metric, value):
+        self.registry.observe(self.view, metric, value)
+
+    @contextmanager
+    def timer(self, metric):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, time.perf_counter() - started)
+
+    def record_model_stats(self, stats):
+        """
+        Record the timings Ollama reports in the last chunk of a stream (durations in nanoseconds).
+        """
+        if stats.get("load_duration"):
+            self.observe("load_seconds", stats["load_duration"] / 1e9)
+        if stats.get("prompt_eval_duration"):
+            self.observe("prompt_eval_seconds", stats["prompt_eval_duration"] / 1e9)
+        if stats.get("prompt_eval_count") is not None:
+            self.observe("prompt_eval_tokens", stats["prompt_eval_count"])
+        if stats.get("eval_count") is not None:
+            self.observe("eval_tokens", stats["eval_count"])
+        if stats.get("eval_duration"):
+            self.observe("eval_seconds", stats["eval_duration"] / 1e9)
+            if stats.get("eval_count"):
+                self.observe("tokens_per_second", stats["eval_count"] / (stats["eval_duration"] / 1e9))
+
+    def queue_wait(self, seconds):
+        """
+        Record the time a model call waited for its inference slot, as `on_wait` of Ticket.guard().
+        """
+        self.observe("queue_wait_seconds", seconds)
+
+    def _first_token(self, started):
+        # Once per request, also when the view calls the model more than once
+        if not self._first_token_seen:
+            self._first_token_seen = True
+            self.observe("ttft_seconds", time.perf_counter() - started)
+
+    def timed(self, generate):
+        """
+        Wrap a generate function to record the time to first token and Ollama's own timings.
+        The time to first token counts from the call of the wrapped function, so wrap it inside
+        the scheduler's guard to leave the wait for a slot out (see queue_wait()).
+        A stream closed early (see stop_at_form) never gets Ollama's final chunk and its timings.
+        Wrap only the main generation of a request with it; see duration() for follow-up calls.
+        """
+        def timed_generate(prompt_messages, **kwargs):
+            started = time.perf_counter()
+            first = True
+            for chunk in generate(prompt_messages, on_done=self.record_model_stats, **kwargs):
+                if first:
+                    self._first_token(started)
+                    first = False
+                yield chunk
+        return timed_generate
+
+    def atimed(self, agenerate):
+        """
+        Async counterpart of timed().
+        """
+        async def timed_agenerate(prompt_messages, **kwargs):
+            started = time.perf_counter()
+            first = True
+            async for chunk in agenerate(prompt_messages, on_done=self.record_model_stats, **kwargs):
+                if first:
+                    self._first_token(started)
+                    first = False
+                yield chunk
+        return timed_agenerate
+
+    def duration(self, metric, generate):
+        """
+        Wrap a generate function to record only how long its stream takes, as `metric`. For
+        follow-up calls of a request (see extraction.structured_form) that would otherwise count
+        as a second request in the time to first token and Ollama's timings.
+        """
+        def duration_generate(prompt_messages, **kwargs):
+            with self.timer(metric):
+                yield from generate(prompt_messages, **kwargs)
+        return duration_generate
+
+    def aduration(self, metric, agenerate):
+        """
+        Async counterpart of duration().
+        """
+        async def duration_agenerate(prompt_messages, **kwargs):
+            with self.timer(metric):
+                async for chunk in agenerate(prompt_messages, **kwargs):
+                    yield chunk
+        return duration_agenerate
+
+
+def track_metrics(view_name):
+    """
+    View decorator: give the request a RequestMetrics as `request.metrics`, and record the
+    duration of POST requests once their (possibly streamed) response is complete.
+    """
+    def decorator(view_func):
+        def finish(request, metrics):
+            if request.method == "POST":
+                metrics.observe("request_seconds", time.perf_counter() - metrics.started)
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                request.metrics = metrics = RequestMetrics(view_name)
+                response = await view_func(request, *args, **kwargs)
+                return call_on_close(response, lambda: finish(request, metrics))
+            return _async_wrapped_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            request.metrics = metrics = RequestMetrics(view_name)
+            response = view_func(request, *args, **kwargs)
+            return call_on_close(response, lambda: finish(request, metrics))
+        return _wrapped_view
+    return decorator
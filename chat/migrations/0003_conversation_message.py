@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_alter_task_end_date_alter_task_start_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flow', models.CharField(choices=[('chat', 'General chat'), ('task', 'Task creation'), ('user', 'User registration'), ('volunteer', 'Volunteer onboarding')], help_text='Chat flow the conversation belongs to', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When the conversation was started')),
+                ('user', models.ForeignKey(blank=True, help_text='Owner of the conversation, empty for anonymous visitors', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(help_text='Author of the message', max_length=30)),
+                ('content', models.TextField(help_text='Text of the message')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When the message was sent')),
+                ('conversation', models.ForeignKey(help_text='Conversation the message belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.conversation')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('flow', 'user'), name='unique_conversation_per_user_and_flow'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-id'], name='chat_message_recent_idx'),
+        ),
+    ]
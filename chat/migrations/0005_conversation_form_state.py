@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_task_owner_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='form_state',
+            field=models.JSONField(blank=True, default=dict, help_text='Fields of the form filled so far in a form flow, see chat/form_state.py'),
+        ),
+    ]
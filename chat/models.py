@@ -16,6 +16,69 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, help_text="When the task was created")
     updated_at = models.DateTimeField(auto_now=True, help_text="When the task was last updated")
 
+    class Meta:
+        indexes = [
+            # A manager's task listing, keyset-paginated on (start_date, id), is a range scan of this index
+            models.Index(fields=['created_by', 'start_date', 'id'], name='chat_task_owner_start_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} (Owner: {self.created_by.username})"
 
+
+
+class Conversation(models.Model):
+    FLOW_CHOICES = [
+        ('chat', 'General chat'),
+        ('task', 'Task creation'),
+        ('user', 'User registration'),
+        ('volunteer', 'Volunteer onboarding'),
+    ]
+
+    flow = models.CharField(max_length=20, choices=FLOW_CHOICES, help_text="Chat flow the conversation belongs to")
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="conversations", null=True, blank=True,
+        help_text="Owner of the conversation, empty for anonymous visitors"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the conversation was started")
+    form_state = models.JSONField(
+        default=dict, blank=True,
+        help_text="Fields of the form filled so far in a form flow, see chat/form_state.py"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['flow', 'user'],
+                condition=models.Q(user__isnull=False),
+                name='unique_conversation_per_user_and_flow',
+            ),
+        ]
+
+    def __str__(self):
+        owner = self.user.username if self.user_id else "anonymous"
+        return f"{self.get_flow_display()} ({owner})"
+
+
+class Message(models.Model):
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="messages",
+        help_text="Conversation the message belongs to"
+    )
+    # 'user', 'ai', 'System error' or 'System message', as in the chat history entries
+    role = models.CharField(max_length=30, help_text="Author of the message")
+    content = models.TextField(help_text="Text of the message")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the message was sent")
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Loading the last N messages of a conversation is a backwards scan of this index
+            models.Index(fields=['conversation', '-id'], name='chat_message_recent_idx'),
+        ]
+
+    def as_history_entry(self):
+        return {"role": self.role, "message": self.content}
+
+    def __str__(self):
+        return f"{self.role}: {self.content[:50]}"
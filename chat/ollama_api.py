@@ -1,11 +1,381 @@
+import asyncio
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+import httpx
 import ollama
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Fields of the last chunk of a stream describing the generation, durations in nanoseconds
+DONE_STATS = (
+    'total_duration', 'load_duration', 'prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration',
+)
+
+
+def _done_stats(chunk):
+    return {field: chunk.get(field) for field in DONE_STATS}
+
+
+class OllamaClient:
+    """
+    Long-lived connection to the Ollama server, configured from settings.
+
+    The underlying HTTP clients keep a keep-alive pool of settings.OLLAMA_POOL_SIZE connections,
+    so turns reuse open connections instead of connecting again. Connecting gives up after
+    settings.OLLAMA_CONNECT_TIMEOUT seconds, and a stream that stays silent for
+    settings.OLLAMA_READ_TIMEOUT seconds raises instead of pinning the worker forever.
+
+    The sync client is shared by all threads of the process. An async client belongs to one
+    event loop, so one is kept per running loop.
+    """
+
+    def __init__(self, host=None, model=None):
+        self._host = host
+        self._model = model
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = {}
+
+    @property
+    def host(self):
+        return self._host or settings.OLLAMA_HOST
+
+    @property
+    def model(self):
+        return self._model or settings.OLLAMA_MODEL
+
+    def _http_options(self):
+        return {
+            "timeout": httpx.Timeout(settings.OLLAMA_READ_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT),
+            "limits": httpx.Limits(
+                max_connections=settings.OLLAMA_POOL_SIZE,
+                max_keepalive_connections=settings.OLLAMA_POOL_SIZE,
+                keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY,
+            ),
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = ollama.Client(host=self.host, **self._http_options())
+        return self._client
+
+    @property
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Drop clients of loops that are gone (e.g. one asyncio.run() per test)
+            self._async_clients = {
+                other: other_client for other, other_client in self._async_clients.items() if not other.is_closed()
+            }
+            client = ollama.AsyncClient(host=self.host, **self._http_options())
+            self._async_clients[loop] = client
+        return client
+
+    def chat(self, messages, on_done=None, **kwargs):
+        """
+        Stream the reply of the model to a list of role-tagged messages
+        ({'role': 'system' | 'user' | 'assistant', 'content': ...}).
+
+        `on_done` is called with the timings and token counts of the last chunk (see DONE_STATS).
+        """
+        stream = self.client.chat(model=self.model, messages=messages, stream=True, **kwargs)
+        try:
+            for chunk in stream:
+                if on_done is not None and chunk.get('done'):
+                    on_done(_done_stats(chunk))
+                yield chunk['message']['content']
+        finally:
+            # A stream closed early (see stop_at_form) gives its connection back right away
+            stream.close()
+
+    async def achat(self, messages, on_done=None, **kwargs):
+        stream = await self.async_client.chat(model=self.model, messages=messages, stream=True, **kwargs)
+        try:
+            async for chunk in stream:
+                if on_done is not None and chunk.get('done'):
+                    on_done(_done_stats(chunk))
+                yield chunk['message']['content']
+        finally:
+            # Unlike generators, async generators are not closed when their consumer stops
+            await stream.aclose()
+
+    def embed(self, text):
+        response = self.client.embed(model=settings.OLLAMA_EMBED_MODEL, input=text)
+        return response['embeddings'][0]
+
+    async def aembed(self, text):
+        response = await self.async_client.embed(model=settings.OLLAMA_EMBED_MODEL, input=text)
+        return response['embeddings'][0]
+
+    def embed_batch(self, texts):
+        """
+        Embed several texts with one request, returning their vectors in order.
+        """
+        response = self.client.embed(model=settings.OLLAMA_EMBED_MODEL, input=list(texts))
+        return response['embeddings']
+
+    def close(self):
+        """
+        Close the pooled connections of the sync client. Runs at interpreter exit.
+        """
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        """
+        Close the async client of the running event loop.
+        """
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+
+class Backend:
+    """
+    One Ollama node of the pool and its bookkeeping.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.client = OllamaClient(host=host)
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+
+    def __repr__(self):
+        state = "healthy" if self.healthy else "ejected"
+        return f"<Backend {self.host} {state} outstanding={self.outstanding}>"
+
+
+class BackendPool:
+    """
+    Spreads generations over several Ollama nodes (settings.OLLAMA_HOSTS).
+
+    A conversation sticks to the node that served its previous turn while that node is
+    healthy, so the node's KV cache for the conversation stays warm. New conversations go
+    to the healthy node with the fewest requests in flight.
+
+    A node is ejected after settings.OLLAMA_MAX_FAILURES consecutive failed requests or
+    health probes, and re-admitted by the first successful probe. Probes (GET /api/version)
+    run every settings.OLLAMA_HEALTH_INTERVAL seconds in a daemon thread started on first
+    use. A request that fails before its first chunk is retried once on another node.
+    """
+
+    # Conversations remembered for affinity, least recently used are forgotten first
+    MAX_AFFINITY_ENTRIES = 10000
+
+    def __init__(self, hosts=None, health_interval=None):
+        self._hosts = hosts
+        self._health_interval = health_interval
+        self._lock = threading.Lock()
+        self._backends = None
+        self._affinity = OrderedDict()
+        self._turn = 0
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    @property
+    def backends(self):
+        if self._backends is None:
+            with self._lock:
+                if self._backends is None:
+                    self._backends = [Backend(host) for host in (self._hosts or settings.OLLAMA_HOSTS)]
+        return self._backends
+
+    @property
+    def model(self):
+        return settings.OLLAMA_MODEL
+
+    def _start_health_checks(self):
+        interval = self._health_interval if self._health_interval is not None else settings.OLLAMA_HEALTH_INTERVAL
+        if self._health_thread is not None or not interval:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(
+                    target=self._health_loop, args=(interval,), name="ollama-health", daemon=True
+                )
+                self._health_thread.start()
+
+    def _health_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    def check_health(self):
+        """
+        Probe every node once and eject or re-admit it. Called by the health thread.
+        """
+        for backend in self.backends:
+            try:
+                response = httpx.get(f"{backend.host.rstrip('/')}/api/version", timeout=settings.OLLAMA_CONNECT_TIMEOUT)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                self._record_failure(backend)
+            else:
+                self._record_success(backend)
+
+    def stop(self):
+        self._stop.set()
+        for backend in self._backends or []:
+            backend.client.close()
+
+    def _record_failure(self, backend):
+        with self._lock:
+            backend.failures += 1
+            if backend.failures >= settings.OLLAMA_MAX_FAILURES and backend.healthy:
+                backend.healthy = False
+                logger.warning("Ollama backend %s ejected after %d failures", backend.host, backend.failures)
+
+    def _record_success(self, backend):
+        with self._lock:
+            backend.failures = 0
+            if not backend.healthy:
+                backend.healthy = True
+                logger.info("Ollama backend %s re-admitted", backend.host)
+
+    def choose(self, affinity_key=None, exclude=()):
+        """
+        Pick the node for a request and count it as outstanding there.
+        """
+        self._start_health_checks()
+        backends = self.backends  # Created under the same lock on first use
+        with self._lock:
+            candidates = [b for b in backends if b.healthy and b not in exclude]
+            if not candidates:
+                # Every node is ejected: keep trying the least failing one rather than refusing
+                candidates = [b for b in backends if b not in exclude] or backends
+                candidates = [min(candidates, key=lambda b: b.failures)]
+            backend = None
+            if affinity_key is not None:
+                preferred = self._affinity.get(affinity_key)
+                if preferred in candidates:
+                    backend = preferred
+                    self._affinity.move_to_end(affinity_key)
+            if backend is None:
+                # Ties go round-robin, so idle nodes share sequential requests
+                self._turn += 1
+                start = self._turn % len(candidates)
+                backend = min(candidates[start:] + candidates[:start], key=lambda b: b.outstanding)
+                if affinity_key is not None:
+                    self._affinity[affinity_key] = backend
+                    if len(self._affinity) > self.MAX_AFFINITY_ENTRIES:
+                        self._affinity.popitem(last=False)
+            backend.outstanding += 1
+            return backend
+
+    def _done(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def _attempts(self):
+        return 2 if len(self.backends) > 1 else 1
+
+    def chat(self, messages, affinity_key=None, **kwargs):
+        tried = []
+        for attempt in range(self._attempts()):
+            backend = self.choose(affinity_key, exclude=tried)
+            started = False
+            try:
+                for chunk in backend.client.chat(messages, **kwargs):
+                    started = True
+                    yield chunk
+                self._record_success(backend)
+                return
+            except (httpx.HTTPError, ollama.ResponseError, ConnectionError):
+                self._record_failure(backend)
+                tried.append(backend)
+                if started or attempt == self._attempts() - 1:
+                    raise
+            finally:
+                self._done(backend)
+
+    async def achat(self, messages, affinity_key=None, **kwargs):
+        tried = []
+        for attempt in range(self._attempts()):
+            backend = self.choose(affinity_key, exclude=tried)
+            started = False
+            stream = backend.client.achat(messages, **kwargs)
+            try:
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                self._record_success(backend)
+                return
+            except (httpx.HTTPError, ollama.ResponseError, ConnectionError):
+                self._record_failure(backend)
+                tried.append(backend)
+                if started or attempt == self._attempts() - 1:
+                    raise
+            finally:
+                await stream.aclose()
+                self._done(backend)
+
+    def embed(self, text):
+        backend = self.choose()
+        try:
+            return backend.client.embed(text)
+        finally:
+            self._done(backend)
+
+    async def aembed(self, text):
+        backend = self.choose()
+        try:
+            return await backend.client.aembed(text)
+        finally:
+            self._done(backend)
+
+    def embed_batch(self, texts):
+        backend = self.choose()
+        try:
+            return backend.client.embed_batch(texts)
+        finally:
+            self._done(backend)
+
+
+backend_pool = BackendPool()
+atexit.register(backend_pool.stop)
+
+
+def generate_response(messages, affinity_key=None, format=None, on_done=None):
+    """
+    Stream the reply of the model to a list of role-tagged messages
+    ({'role': 'system' | 'user' | 'assistant', 'content': ...}).
+
+    Turns with the same `affinity_key` (e.g. a conversation id) are sent to the same node when possible.
+    A JSON Schema passed as `format` constrains the reply to JSON matching it. `on_done` receives
+    Ollama's timings and token counts once the reply is complete.
+    """
+    yield from backend_pool.chat(messages, affinity_key=affinity_key, format=format, on_done=on_done)
+
+async def agenerate_response(messages, affinity_key=None, format=None, on_done=None):
+    """
+    Non-blocking counterpart of generate_response for the async views.
+    """
+    async for chunk in backend_pool.achat(messages, affinity_key=affinity_key, format=format, on_done=on_done):
+        yield chunk
+
+def embed_text(text):
+    """
+    Return the embedding vector of `text` from the local embedding model.
+    """
+    return backend_pool.embed(text)
+
+async def aembed_text(text):
+    return await backend_pool.aembed(text)
 
-def generate_response(prompt):
-    stream = ollama.chat(
-        model='test-npo',
-        messages=[{'role': 'user', 'content': prompt}],
-        stream=True,
-    )
-    for chunk in stream:
-      
-        yield chunk['message']['content']
+def embed_texts(texts):
+    """
+    Return the embedding vectors of several texts, computed in one request.
+    """
+    return backend_pool.embed_batch(texts)
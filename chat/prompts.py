@@ -0,0 +1,144 @@
+import hashlib
+
+from authentification.models import CustomUser, VolunteerProfile
+from chat.extraction import FIELDS_MARKER
+from chat.helpers import (
+    extract_task_json_schema,
+    extract_task_schema,
+    extract_user_json_schema,
+    extract_user_schema,
+    extract_volunteer_profile_json_schema,
+    extract_volunteer_profile_schema,
+    get_current_time,
+)
+from chat.models import Task
+
+# Stands in for today's date in rule 2 of the task prompt until a request fills it in
+DATE_PLACEHOLDER = "\x00today\x00"
+
+
+# Last rule of every form prompt: how the model reports what the user gave (see chat/form_state.py)
+FIELDS_RULE = (
+    f"Whenever the user's message gives values for needed fields, end your reply with '{FIELDS_MARKER}' "
+    "followed by a JSON object of only those values."
+)
+
+
+def task_form_instructions(today):
+    return f'''In this chat your goal is help User to create task in Austrian voluntering portal. 
+        Your role is to assist the user in providing and validating the fields still needed, listed below.
+        Note:
+        1. Name and description should be correlated.
+        2. Today is {today}. The portal checks the dates itself and lists rejected values below.
+        3. Convert dates to YYYY-MM-DD yourself if user send it other order
+        4. {FIELDS_RULE}
+        '''
+
+def user_form_instructions():
+    return f'''In this chat, your goal is to help the visitor create a user profile in the Austrian volunteering portal.
+        Your role is to assist the user in providing and validating the fields still needed, listed below.
+        Note:
+        1. The user's role is fixed as 'Volunteer' and cannot be changed.
+        2. Validate the user's input for each field, and request corrections if needed. 
+        The user needs to confirm their password twice (in two separate messages); report it once confirmed.
+        3. {FIELDS_RULE}
+        4. If the system returns an error (e.g., duplicate username or email), provide suggestions to the user for resolving the issue.
+        '''
+
+def volunteer_form_instructions():
+    return f'''In this chat, your goal is to assist the user in creating their volunteer profile for the Austrian volunteering portal.
+        Your role is to help the user provide and validate the fields still needed, listed below.
+        Note:
+        1. The volunteer's user account is already linked, so you don't need to request user information. 
+        You need to help to create Volunteer Profile for existing user
+        2. Validate the user's input for each field, and request corrections if needed. 
+        Field of interests (also called competences) is restricted by provided schema choices. Ask user to select one or more options from them 
+        and indicate level of competence(interest) from 0 to 3.
+        3. {FIELDS_RULE}
+        4. If the system encounters an error (e.g., invalid data), provide actionable suggestions for resolving the issue.
+        '''
+
+
+class PromptRegistry:
+    """
+    Holds the finished system prompt of every chat flow.
+
+    The schemas, prompts and JSON Schemas of the forms (for structured output) are built
+    once from the model metadata (see ChatConfig.ready), so requests only look them up. The form
+    prompts hold the fixed rules of a flow; the fields still needed are added per turn by
+    FormState (see chat/form_state.py). The task prompt is stored split around its date, which
+    is the only part filled in per request. Every prompt also gets a stable id
+    (a hash of its text) that caches can use as part of their key.
+
+    The runserver autoreloader restarts the process whenever a models.py changes, which
+    rebuilds the registry; `post_migrate` rebuilds it as well so a migrated test database
+    or shell session never sees stale help texts.
+    """
+
+    def __init__(self):
+        self._schemas = {}
+        self._json_schemas = {}
+        self._prompts = {}
+        self._task_parts = ("", "")
+        self._task_rendered = (None, "")
+
+    def build(self):
+        schemas = {
+            "user": extract_user_schema(CustomUser),
+            "task": extract_task_schema(Task),
+            "volunteer": extract_volunteer_profile_schema(VolunteerProfile),
+        }
+        self._task_parts = tuple(task_form_instructions(DATE_PLACEHOLDER).split(DATE_PLACEHOLDER))
+        self._task_rendered = (None, "")
+        self._prompts = {
+            "chat": "",
+            "user": user_form_instructions(),
+            "volunteer": volunteer_form_instructions(),
+        }
+        self._json_schemas = {
+            "user": extract_user_json_schema(CustomUser),
+            "task": extract_task_json_schema(Task),
+            "volunteer": extract_volunteer_profile_json_schema(VolunteerProfile),
+        }
+        self._schemas = schemas
+
+    def invalidate(self, **kwargs):
+        """
+        Rebuild everything. Has a signal receiver signature so it can be connected to post_migrate.
+        """
+        self.build()
+
+    def _ensure_built(self):
+        if not self._schemas:
+            self.build()
+
+    def schema(self, flow):
+        self._ensure_built()
+        return self._schemas[flow]
+
+    def json_schema(self, flow):
+        """
+        Return the JSON Schema of a form flow's finished form ('task', 'user' or 'volunteer').
+        """
+        self._ensure_built()
+        return self._json_schemas[flow]
+
+    def get(self, flow):
+        """
+        Return the system prompt of a flow ('chat', 'task', 'user' or 'volunteer').
+        """
+        self._ensure_built()
+        if flow != "task":
+            return self._prompts[flow]
+        today = get_current_time()
+        rendered_for, prompt = self._task_rendered
+        if rendered_for != today:
+            prompt = today.join(self._task_parts)
+            self._task_rendered = (today, prompt)
+        return prompt
+
+    def prompt_id(self, flow):
+        return hashlib.sha256(self.get(flow).encode("utf-8")).hexdigest()[:16]
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+
+from authentification.models import NPOManagerProfile
+from chat.history import estimate_tokens
+from chat.models import Task
+from chat.ollama_api import aembed_text, embed_text, embed_texts
+
+try:
+    import numpy as np
+except ImportError:  # Retrieval is skipped without numpy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# File in the index directory naming the version the readers use
+CURRENT_FILE = "CURRENT"
+
+# Most task names listed in the document of an NPO
+NPO_TASK_NAMES = 10
+
+CONTEXT_HEADER = (
+    "Portal content related to the user's question. Answer briefly from it when it is relevant; "
+    "if it does not cover the question, say so instead of guessing."
+)
+
+
+def portal_documents(today=None):
+    """
+    Yield (source, id, text) for every document of the index: current tasks, NPO profiles and the FAQ.
+    """
+    today = today or date.today()
+    npo_names = dict(NPOManagerProfile.objects.values_list("user_id", "npo_name"))
+    current_tasks = Task.objects.filter(end_date__gte=today).select_related("created_by").order_by("start_date", "id")
+
+    task_names = {}
+    for task in current_tasks.iterator(chunk_size=2000):
+        organiser = npo_names.get(task.created_by_id) or task.created_by.get_full_name() or task.created_by.username
+        task_names.setdefault(task.created_by_id, []).append(task.name)
+        yield "task", task.pk, (
+            f'Task "{task.name}" by {organiser}, from {task.start_date} to {task.end_date}: {task.description}'
+        )
+
+    for profile in NPOManagerProfile.objects.select_related("user"):
+        names = task_names.get(profile.user_id, [])
+        listed = "; ".join(names[:NPO_TASK_NAMES]) if names else "none at the moment"
+        yield "npo", profile.pk, (
+            f'NPO "{profile.npo_name}", managed by {profile.user.get_full_name() or profile.user.username}. '
+            f"Current tasks: {listed}."
+        )
+
+    if settings.RAG_FAQ_PATH and os.path.exists(settings.RAG_FAQ_PATH):
+        with open(settings.RAG_FAQ_PATH, encoding="utf-8") as f:
+            for number, entry in enumerate(json.load(f)):
+                yield "faq", number, f"Q: {entry['question']}\nA: {entry['answer']}"
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def build_index(directory=None, batch_size=64):
+    """
+    Embed every portal document and write a new version of the index, then point CURRENT to it.
+
+    The vectors go to index-<version>.npy (float32, one L2-normalized row per document) and the
+    documents to index-<version>.json. Readers notice the new CURRENT and switch over; the
+    previous version is kept for readers still mapping it, older ones are deleted.
+
+    Returns:
+        int: Number of documents indexed.
+    """
+    if np is None:
+        raise RuntimeError("The retrieval index needs numpy installed.")
+    directory = str(directory or settings.RAG_INDEX_DIR)
+    os.makedirs(directory, exist_ok=True)
+
+    documents = [{"source": source, "id": pk, "text": text} for source, pk, text in portal_documents()]
+    rows = []
+    for start in range(0, len(documents), batch_size):
+        rows.extend(embed_texts([document["text"] for document in documents[start:start + batch_size]]))
+    if documents:
+        vectors = _normalize_rows(np.asarray(rows, dtype=np.float32).reshape(len(documents), -1))
+    else:
+        # Still written, so readers stop serving the documents of the previous version
+        vectors = np.zeros((0, 0), dtype=np.float32)
+
+    # Never reuse a name: a reader may still have the file of a version mapped
+    version = time.strftime("%Y%m%d%H%M%S") + f"-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, f"index-{version}")
+    with open(path + ".npy.tmp", "wb") as f:
+        np.save(f, vectors)
+    with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump({"model": settings.OLLAMA_EMBED_MODEL, "documents": documents}, f)
+    os.replace(path + ".npy.tmp", path + ".npy")
+    os.replace(path + ".json.tmp", path + ".json")
+
+    current = os.path.join(directory, CURRENT_FILE)
+    previous = None
+    if os.path.exists(current):
+        with open(current) as f:
+            previous = f.read().strip()
+    with open(current + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(current + ".tmp", current)
+
+    for name in os.listdir(directory):
+        if name.startswith("index-") and not name.startswith((f"index-{version}.", f"index-{previous}.")):
+            os.remove(os.path.join(directory, name))
+    return len(documents)
+
+
+class VectorIndex:
+    """
+    Read side of the retrieval index: the vectors memory-mapped from disk, searched with NumPy.
+
+    np.load(mmap_mode="r") maps the .npy file instead of reading it, so the pages live once in
+    the operating system's page cache and every worker process shares them. A query is one
+    matrix-vector product over the normalized rows (cosine similarity) and an argpartition
+    for the top K.
+
+    The CURRENT file is checked at most every settings.RAG_RELOAD_SECONDS, so a rebuilt index
+    is picked up without a restart. Without an index (or without numpy) retrieval returns nothing
+    and never calls the embedding model.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self.version = None
+        self.vectors = None
+        self.documents = []
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < settings.RAG_RELOAD_SECONDS:
+            return
+        with self._lock:
+            self._checked_at = now
+            directory = str(self.directory or settings.RAG_INDEX_DIR)
+            try:
+                with open(os.path.join(directory, CURRENT_FILE)) as f:
+                    version = f.read().strip()
+            except OSError:
+                self.version, self.vectors, self.documents = None, None, []
+                return
+            if version == self.version:
+                return
+            try:
+                with open(os.path.join(directory, f"index-{version}.json"), encoding="utf-8") as f:
+                    meta = json.load(f)
+                vectors = np.load(os.path.join(directory, f"index-{version}.npy"), mmap_mode="r")
+            except (OSError, ValueError) as e:
+                logger.error("Could not load retrieval index %s: %s", version, e)
+                return
+            if meta.get("model") != settings.OLLAMA_EMBED_MODEL:
+                logger.error(
+                    "Retrieval index %s was built with %s, not %s", version, meta.get("model"), settings.OLLAMA_EMBED_MODEL
+                )
+                self.version, self.vectors, self.documents = None, None, []
+                return
+            self.version, self.vectors, self.documents = version, vectors, meta["documents"]
+
+    def current_version(self):
+        """
+        Version of the index retrieval uses right now, None without one. Checks CURRENT like
+        retrieval does, so callers keying on it agree with the context retrieval returns.
+        """
+        if np is None or not settings.RAG_ENABLED:
+            return None
+        self._refresh()
+        return self.version
+
+    @property
+    def ready(self):
+        if np is None or not settings.RAG_ENABLED:
+            return False
+        self._refresh()
+        return self.vectors is not None and len(self.documents) > 0
+
+    def search(self, vector, k=None, min_similarity=None):
+        """
+        Return the documents closest to an embedding vector as [(similarity, document)], best first.
+        """
+        k = k or settings.RAG_TOP_K
+        min_similarity = settings.RAG_MIN_SIMILARITY if min_similarity is None else min_similarity
+        vectors, documents = self.vectors, self.documents
+        query = np.asarray(vector, dtype=np.float32)
+        if vectors is None or query.shape[0] != vectors.shape[1]:
+            return []
+        query /= np.linalg.norm(query) or 1.0
+        scores = vectors @ query
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[i]), documents[i]) for i in best if scores[i] >= min_similarity]
+
+    def retrieve(self, question):
+        if not self.ready:
+            return []
+        try:
+            return self.search(embed_text(question))
+        except Exception as e:
+            logger.warning("Embedding failed, answering without retrieval: %s", e)
+            return []
+
+    async def aretrieve(self, question):
+        if not self.ready:
+            return []
+        try:
+            return self.search(await aembed_text(question))
+        except Exception as e:
+            logger.warning("Embedding failed, answering without retrieval: %s", e)
+            return []
+
+
+vector_index = VectorIndex()
+
+
+def format_context(hits, budget=None):
+    """
+    Turn retrieval hits into the text of a system message, best first, within `budget` tokens
+    (settings.RAG_CONTEXT_TOKENS by default). Returns an empty string without hits.
+    """
+    budget = settings.RAG_CONTEXT_TOKENS if budget is None else budget
+    lines = []
+    used = estimate_tokens(CONTEXT_HEADER)
+    for _, document in hits:
+        line = f"- {document['text']}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return CONTEXT_HEADER + "\n" + "\n".join(lines)
+
+
+def retrieve_context(question):
+    """
+    Return the portal content relevant to a question, formatted for the prompt, or "".
+    """
+    return format_context(vector_index.retrieve(question))
+
+
+async def aretrieve_context(question):
+    return format_context(await vector_index.aretrieve(question))
@@ -0,0 +1,366 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+# Priority lanes, highest first. A lane is only served when every lane before it is empty.
+LANES = ('high', 'normal', 'low')
+
+# Assumed generation time until the first generations have been measured
+DEFAULT_HOLD_SECONDS = 10.0
+
+
+class SchedulerBusy(Exception):
+    """
+    Raised when the wait queue is full or a request waited too long for an inference slot.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Inference queue is full, retry after {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    A request's place in the inference scheduler.
+
+    The ticket is admitted on the first model call of the request (see guard()), holds a slot
+    or waits for one while the model is called, and is released as soon as that call is done.
+    A request calling the model twice (see extraction.structured_form) is admitted twice, and
+    one that never calls it (a cached or local reply) never takes a slot or a place in the queue.
+    """
+
+    def __init__(self, scheduler, key, lane):
+        self.scheduler = scheduler
+        self.key = key
+        self.lane = lane
+        self.admitted = False
+        self.granted = False
+        self.started_at = None
+        self._event = threading.Event()
+        self._futures = []
+
+    def _admit(self):
+        # Called with the scheduler lock held
+        self.admitted = True
+        self.granted = False
+        self.started_at = None
+        self._event = threading.Event()
+        self._futures = []
+
+    def _grant(self):
+        # Called with the scheduler lock held
+        self.granted = True
+        self.started_at = time.monotonic()
+        self._event.set()
+        for loop, future in self._futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def acquire(self):
+        """
+        Admit the ticket and block until it holds a slot.
+
+        Returns:
+            float: Seconds spent waiting for the slot.
+
+        Raises:
+            SchedulerBusy: The wait queue is full, or no slot came free within
+                settings.INFERENCE_QUEUE_TIMEOUT.
+        """
+        started = time.monotonic()
+        self.scheduler._admit(self)
+        if not self._event.wait(settings.INFERENCE_QUEUE_TIMEOUT):
+            self.release()
+            raise SchedulerBusy(self.scheduler.retry_after())
+        return time.monotonic() - started
+
+    async def aacquire(self):
+        """
+        Async counterpart of acquire().
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        self.scheduler._admit(self)
+        with self.scheduler._lock:
+            if self.granted:
+                return time.monotonic() - started
+            future = loop.create_future()
+            self._futures.append((loop, future))
+        try:
+            await asyncio.wait_for(future, settings.INFERENCE_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.release()
+            raise SchedulerBusy(self.scheduler.retry_after())
+        return time.monotonic() - started
+
+    def release(self):
+        """
+        Give the slot (or the place in the queue) back. Safe to call more than once, and on a
+        ticket that was never admitted.
+        """
+        self.scheduler._release(self)
+
+    def guard(self, generate, on_wait=None):
+        """
+        Wrap a generate function so the model is only called once the ticket holds a slot,
+        and the slot is given back when the generation ends. `on_wait`, if given, is called
+        with the seconds spent waiting for the slot.
+        """
+        def scheduled_generate(prompt_messages, **kwargs):
+            waited = self.acquire()
+            if on_wait is not None:
+                on_wait(waited)
+            try:
+                yield from generate(prompt_messages, **kwargs)
+            finally:
+                self.release()
+        return scheduled_generate
+
+    def aguard(self, agenerate, on_wait=None):
+        """
+        Async counterpart of guard().
+        """
+        async def scheduled_agenerate(prompt_messages, **kwargs):
+            waited = await self.aacquire()
+            if on_wait is not None:
+                on_wait(waited)
+            try:
+                async for chunk in agenerate(prompt_messages, **kwargs):
+                    yield chunk
+            finally:
+                self.release()
+        return scheduled_agenerate
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class InferenceScheduler:
+    """
+    Admission control and fair scheduling in front of the model.
+
+    At most settings.INFERENCE_MAX_CONCURRENCY generations run at once per worker process
+    (set it to Ollama's OLLAMA_NUM_PARALLEL divided by the number of worker processes).
+    Up to settings.INFERENCE_MAX_QUEUE more requests wait; beyond that admission raises
+    SchedulerBusy right away, so the view can answer 503 instead of piling up work.
+
+    Waiting requests are kept per lane and per client (user or session). Free slots go to
+    the highest non-empty lane, and within a lane clients take turns, so one client sending
+    many requests cannot starve the others.
+
+    Sync views wait on a threading.Event and async views on a future of their event loop,
+    so both kinds of views share the same slots.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._queues = {lane: OrderedDict() for lane in LANES}
+        self._average_hold = DEFAULT_HOLD_SECONDS
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def waiting(self):
+        return self._waiting
+
+    def ticket(self, key, lane='normal'):
+        """
+        Return a ticket for a client, admitted on its first model call (see Ticket.guard()).
+        """
+        return Ticket(self, key, lane)
+
+    def admit(self, key, lane='normal'):
+        """
+        Reserve a slot or a place in the queue for a client right away.
+
+        Raises:
+            SchedulerBusy: The wait queue is full.
+        """
+        ticket = Ticket(self, key, lane)
+        self._admit(ticket)
+        return ticket
+
+    def _admit(self, ticket):
+        with self._lock:
+            if ticket.admitted:
+                return
+            if self._active < settings.INFERENCE_MAX_CONCURRENCY and self._waiting == 0:
+                ticket._admit()
+                self._active += 1
+                ticket._grant()
+                return
+            if self._waiting >= settings.INFERENCE_MAX_QUEUE:
+                raise SchedulerBusy(self._retry_after_locked())
+            ticket._admit()
+            self._queues[ticket.lane].setdefault(ticket.key, deque()).append(ticket)
+            self._waiting += 1
+
+    def retry_after(self):
+        with self._lock:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self):
+        # Time for the queue ahead to drain through the available slots
+        rounds = self._waiting / settings.INFERENCE_MAX_CONCURRENCY + 1
+        return max(1, math.ceil(rounds * self._average_hold))
+
+    def _release(self, ticket):
+        with self._lock:
+            if not ticket.admitted:
+                return
+            ticket.admitted = False
+            if ticket.granted:
+                self._active -= 1
+                held = time.monotonic() - ticket.started_at
+                self._average_hold = 0.8 * self._average_hold + 0.2 * held
+            else:
+                queues = self._queues[ticket.lane]
+                queue = queues.get(ticket.key)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    self._waiting -= 1
+                    if not queue:
+                        del queues[ticket.key]
+            self._dispatch_locked()
+
+    def _dispatch_locked(self):
+        while self._active < settings.INFERENCE_MAX_CONCURRENCY:
+            ticket = self._next_locked()
+            if ticket is None:
+                return
+            self._active += 1
+            ticket._grant()
+
+    def _next_locked(self):
+        for lane in LANES:
+            queues = self._queues[lane]
+            if not queues:
+                continue
+            key, queue = next(iter(queues.items()))
+            ticket = queue.popleft()
+            # Round-robin: the client goes to the back of its lane
+            if queue:
+                queues.move_to_end(key)
+            else:
+                del queues[key]
+            self._waiting -= 1
+            return ticket
+        return None
+
+
+inference_scheduler = InferenceScheduler()
+
+
+def client_key(request, user):
+    """
+    Identify who a request belongs to for fair scheduling: the user, the session or the address.
+    """
+    if user.is_authenticated:
+        return f"user:{user.pk}"
+    if request.session.session_key:
+        return f"session:{request.session.session_key}"
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
+
+
+BUSY_MESSAGE = "The assistant is busy right now, please try again shortly."
+
+
+def busy_response(retry_after):
+    response = HttpResponse(BUSY_MESSAGE, status=503)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+class _CallOnClose:
+    # Django closes the streaming content once the response is sent, even if it was never iterated
+    def __init__(self, content, callback):
+        self._content = content
+        self._callback = callback
+
+    def __iter__(self):
+        return iter(self._content)
+
+    def close(self):
+        self._callback()
+
+
+class _AsyncCallOnClose(_CallOnClose):
+    def __iter__(self):
+        raise TypeError("Async streaming content cannot be iterated synchronously.")
+
+    def __aiter__(self):
+        return self._content.__aiter__()
+
+
+def call_on_close(response, callback):
+    """
+    Call `callback` once the response is complete: right away for a regular response,
+    after the last chunk has been sent for a streaming one.
+    """
+    if response.streaming:
+        wrapper = _AsyncCallOnClose if response.is_async else _CallOnClose
+        response.streaming_content = wrapper(response.streaming_content, callback)
+    else:
+        callback()
+    return response
+
+
+def schedule_inference(lane):
+    """
+    View decorator: give POST requests a ticket of the inference scheduler in the given lane.
+
+    The ticket is stored as `request.inference_ticket`; generate functions wrapped with
+    `ticket.guard()` / `ticket.aguard()` are admitted on their first model call and wait for a
+    slot there, so requests answered without the model never queue. A full queue raises
+    SchedulerBusy from the generation: views let it through and it is answered here with 503
+    and a Retry-After header (streamed responses report it in their `error` event). Whatever
+    the ticket still holds is released once the response is complete.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                if request.method != "POST":
+                    return await view_func(request, *args, **kwargs)
+                ticket = inference_scheduler.ticket(client_key(request, await request.auser()), lane)
+                request.inference_ticket = ticket
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                except SchedulerBusy as e:
+                    ticket.release()
+                    return busy_response(e.retry_after)
+                except BaseException:
+                    ticket.release()
+                    raise
+                return call_on_close(response, ticket.release)
+            return _async_wrapped_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method != "POST":
+                return view_func(request, *args, **kwargs)
+            ticket = inference_scheduler.ticket(client_key(request, request.user), lane)
+            request.inference_ticket = ticket
+            try:
+                response = view_func(request, *args, **kwargs)
+            except SchedulerBusy as e:
+                ticket.release()
+                return busy_response(e.retry_after)
+            except BaseException:
+                ticket.release()
+                raise
+            return call_on_close(response, ticket.release)
+        return _wrapped_view
+    return decorator
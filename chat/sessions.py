@@ -0,0 +1,68 @@
+import json
+import zlib
+
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+
+from chat.conversations import SESSION_KEY as CONVERSATIONS_KEY
+from chat.write_queue import write_queue
+
+# Strings most sessions contain. zlib gains next to nothing on a payload of a few hundred
+# bytes by itself; primed with these it can encode them as back-references from the first byte.
+SESSION_ZDICT = json.dumps({
+    "_auth_user_backend": "django.contrib.auth.backends.ModelBackend",
+    "_auth_user_id": "",
+    "_auth_user_hash": "",
+    "_messages": "",
+    CONVERSATIONS_KEY: {"chat": 0, "task": 0, "user": 0, "volunteer": 0},
+}, separators=(",", ":")).encode()
+
+# First byte of a serialized session: how the rest is encoded
+PLAIN = b"\x00"
+DEFLATED = b"\x01"
+
+# Largest session a deflated payload may inflate to. Sessions only hold the signed-in user,
+# flash messages and the ids of the visitor's conversations; the chat turns are in the
+# Conversation store (see chat/conversations.py).
+MAX_INFLATED_BYTES = 256 * 1024
+
+
+class CompactSessionSerializer:
+    """
+    Session serializer: compact JSON, deflated with a preset dictionary of common session keys
+    when that is smaller.
+
+    Sessions written by Django's JSONSerializer (plain JSON, no marker byte) still load.
+    """
+
+    def dumps(self, obj):
+        data = json.dumps(obj, separators=(",", ":")).encode()
+        compressor = zlib.compressobj(level=9, zdict=SESSION_ZDICT)
+        deflated = compressor.compress(data) + compressor.flush()
+        if len(deflated) < len(data):
+            return DEFLATED + deflated
+        return PLAIN + data
+
+    def loads(self, data):
+        marker, body = data[:1], data[1:]
+        if marker == DEFLATED:
+            decompressor = zlib.decompressobj(zdict=SESSION_ZDICT)
+            # Refuse anything inflating that far, as a signed payload never should
+            body = decompressor.decompress(body, MAX_INFLATED_BYTES)
+            if decompressor.unconsumed_tail:
+                raise ValueError("Session payload inflates too far.")
+        elif marker != PLAIN:
+            body = data
+        return json.loads(body.decode())
+
+
+class SessionStore(DBSessionStore):
+    """
+    Database sessions, stored with CompactSessionSerializer (see SESSION_SERIALIZER) and
+    written through the write queue (see chat/write_queue.py).
+    """
+
+    def save(self, must_create=False):
+        write_queue.run(super().save, must_create)
+
+    def delete(self, session_key=None):
+        write_queue.run(super().delete, session_key)
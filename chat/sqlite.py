@@ -0,0 +1,16 @@
+from django.conf import settings
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    connection_created receiver: run settings.SQLITE_PRAGMAS on every new SQLite connection.
+
+    Most PRAGMAs (synchronous, cache_size, mmap_size) only last as long as the connection, so
+    they are set each time one is opened; with CONN_MAX_AGE that is once per thread rather
+    than once per request. journal_mode=WAL is stored in the database file itself.
+    """
+    if connection.vendor != "sqlite" or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
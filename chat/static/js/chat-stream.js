@@ -0,0 +1,95 @@
+// Sends chat forms with `stream=1` and renders the AI reply while it is generated.
+// Without JavaScript the forms keep working as plain POSTs that render the whole page.
+document.addEventListener("DOMContentLoaded", function () {
+    var form = document.querySelector("form[data-stream]");
+    var history = document.getElementById("chat-history");
+    if (!form || !history || !window.fetch || !window.TextDecoder) {
+        return;
+    }
+
+    function appendMessage(role, text) {
+        var p = document.createElement("p");
+        var strong = document.createElement("strong");
+        strong.textContent = role + ": ";
+        var span = document.createElement("span");
+        span.textContent = text;
+        p.appendChild(strong);
+        p.appendChild(span);
+        history.appendChild(p);
+        return span;
+    }
+
+    function handleEvent(raw, target) {
+        var event = "message";
+        var data = "";
+        raw.split("\n").forEach(function (line) {
+            if (line.indexOf("event:") === 0) {
+                event = line.slice(6).trim();
+            } else if (line.indexOf("data:") === 0) {
+                data += line.slice(5).trim();
+            }
+        });
+        if (!data) {
+            return;
+        }
+        var payload = JSON.parse(data);
+        if (event === "token") {
+            target.textContent += payload.content;
+        } else if (event === "error") {
+            target.textContent = payload.message;
+        } else if (event === "done" && payload.redirect) {
+            window.location.href = payload.redirect;
+        }
+    }
+
+    form.addEventListener("submit", function (e) {
+        e.preventDefault();
+        var input = form.querySelector("input[name=user_input]");
+        var button = form.querySelector("button[type=submit]");
+        var body = new FormData(form);
+        body.append("stream", "1");
+
+        appendMessage("User", input.value);
+        var target = appendMessage("Ai", "");
+        input.value = "";
+        button.disabled = true;
+
+        fetch(form.action, {
+            method: "POST",
+            body: body,
+            credentials: "same-origin",
+            headers: {"Accept": "text/event-stream"},
+        }).then(function (response) {
+            if (!response.ok) {
+                // e.g. 503 when the inference queue is full
+                return response.text().then(function (text) {
+                    target.textContent = text;
+                    button.disabled = false;
+                });
+            }
+            var reader = response.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = "";
+
+            function read() {
+                return reader.read().then(function (result) {
+                    if (result.done) {
+                        button.disabled = false;
+                        return;
+                    }
+                    buffer += decoder.decode(result.value, {stream: true});
+                    var events = buffer.split("\n\n");
+                    buffer = events.pop();
+                    events.forEach(function (raw) {
+                        handleEvent(raw, target);
+                    });
+                    return read();
+                });
+            }
+            return read();
+        }).catch(function () {
+            target.textContent = "Sorry, there was an error generating the response.";
+            button.disabled = false;
+        });
+    });
+});
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words the stub replies are made of, one word per streamed token
+STUB_WORDS = (
+    "volunteer task schedule help community project event support team weekend "
+    "organisation skills experience interest availability register profile"
+).split()
+
+
+class StubOllamaServer:
+    """
+    Ollama-compatible HTTP server that streams made-up replies with a configurable timing,
+    for measuring the app without a model.
+
+    Implements the endpoints the app uses: POST /api/chat (streamed NDJSON), POST /api/embed,
+    GET /api/version and GET /api/tags.
+
+    Parameters:
+        host (str), port (int): Address to listen on, port 0 picks a free one.
+        ttft (float): Seconds before the first token.
+        tokens_per_second (float): Decode speed of the following tokens.
+        reply_tokens (int): Tokens per reply.
+        jitter (float): Relative random variation of every delay, e.g. 0.2 for +-20%.
+        error_rate (float): Share of chat requests answered with HTTP 500.
+        seed (int): Seed of the random generator, for repeatable runs.
+    """
+
+    def __init__(self, host="127.0.0.1", port=11434, ttft=0.3, tokens_per_second=30.0, reply_tokens=60,
+                 jitter=0.2, error_rate=0.0, seed=None):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _random_value(self):
+        with self._random_lock:
+            return self._random.random()
+
+    def _delay(self, seconds):
+        if seconds <= 0:
+            return 0
+        return max(0.0, seconds * (1 + self.jitter * (2 * self._random_value() - 1)))
+
+    def fail_next(self):
+        return self._random_value() < self.error_rate
+
+    def reply_words(self, messages):
+        # Same conversation, same reply: makes runs comparable
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+        return [STUB_WORDS[digest[i % len(digest)] % len(STUB_WORDS)] for i in range(self.reply_tokens)]
+
+    def chat_chunks(self, body):
+        """
+        Yield the NDJSON lines of a streamed chat reply, sleeping like a model would.
+        """
+        model = body.get("model", "stub")
+        if body.get("format"):
+            words = [json.dumps(_stub_object(body["format"]))]
+        else:
+            words = self.reply_words(body.get("messages", []))
+        started = time.monotonic()
+        time.sleep(self._delay(self.ttft))
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self._delay(1 / self.tokens_per_second))
+            content = word if index == 0 else f" {word}"
+            yield {"model": model, "message": {"role": "assistant", "content": content}, "done": False}
+        elapsed = time.monotonic() - started
+        yield {
+            "model": model,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int(elapsed * 1e9),
+            "prompt_eval_count": sum(len(m.get("content", "")) // 4 for m in body.get("messages", [])),
+            "prompt_eval_duration": int(self.ttft * 1e9),
+            "eval_count": len(words),
+            "eval_duration": int(max(elapsed - self.ttft, 0) * 1e9),
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status, data):
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._send_json(200, {"version": "0.0.0-stub"})
+                elif self.path == "/api/tags":
+                    self._send_json(200, {"models": [{"name": "stub", "model": "stub"}]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/embed":
+                    inputs = body.get("input", "")
+                    inputs = inputs if isinstance(inputs, list) else [inputs]
+                    self._send_json(200, {"model": body.get("model"), "embeddings": [_stub_vector(text) for text in inputs]})
+                    return
+                if self.path != "/api/chat":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                if server.fail_next():
+                    self._send_json(500, {"error": "stub failure"})
+                    return
+                chunks = server.chat_chunks(body)
+                if body.get("stream") is False:
+                    content = ""
+                    for chunk in chunks:
+                        content += chunk["message"]["content"]
+                    chunk["message"]["content"] = content
+                    self._send_json(200, chunk)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        line = json.dumps(chunk).encode("utf-8") + b"\n"
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading (e.g. the form was complete), like Ollama we stop decoding
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """
+        Serve in a daemon thread and return self, for use from scripts and tests.
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _stub_vector(text, dimensions=64):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 127.5) / 127.5 for i in range(dimensions)]
+
+
+def _stub_object(schema):
+    """
+    Smallest value matching a JSON Schema, for structured output requests.
+    """
+    if not isinstance(schema, dict):
+        return {}
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _stub_object(prop) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return []
+    if kind == "integer":
+        return schema.get("minimum", 0)
+    if kind == "number":
+        return 0
+    if kind == "boolean":
+        return False
+    if schema.get("format") == "date":
+        return "2030-01-01"
+    if schema.get("format") == "email":
+        return "stub@example.com"
+    if "pattern" in schema:
+        return "09:00-10:00"
+    return "stub"
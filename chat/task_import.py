@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+from datetime import date
+
+from django.db import DatabaseError, transaction
+
+from chat.models import Task
+from chat.validators import parse_date, task_date_errors
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# Columns every imported row needs
+TASK_COLUMNS = ("name", "description", "start_date", "end_date")
+
+NAME_MAX_LENGTH = Task._meta.get_field("name").max_length
+
+
+def import_format(filename, requested=None):
+    """
+    Return the format of an import file: the requested one, else the one its extension names.
+    """
+    fmt = (requested or filename.rsplit(".", 1)[-1]).lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format {fmt!r}, expected one of {', '.join(IMPORT_FORMATS)}.")
+    return fmt
+
+
+def read_rows(stream, fmt, columns=TASK_COLUMNS):
+    """
+    Yield (line number, row dict or None, error or None) for every row of a CSV or JSONL text
+    stream, one row at a time so files of any size are never held in memory. A CSV file
+    must have all of `columns`.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = [column for column in columns if column not in (reader.fieldnames or ())]
+        if missing:
+            yield 1, None, f"Missing columns: {', '.join(missing)}."
+            return
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e.msg}."
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Expected a JSON object."
+            continue
+        yield line_number, row, None
+
+
+def text_stream(binary):
+    """
+    Decode an uploaded or opened binary file as UTF-8 (with or without a BOM), line by line.
+    """
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+def clean_task_row(row, today):
+    """
+    Validate one row with the rules of the task form.
+
+    Returns:
+        tuple: (dict of the Task fields, list of error messages). The fields are None if there are errors.
+    """
+    errors = []
+    name = str(row.get("name") or "").strip()
+    description = str(row.get("description") or "").strip()
+    if not name:
+        errors.append("Name is missing.")
+    elif len(name) > NAME_MAX_LENGTH:
+        errors.append(f"Name is longer than {NAME_MAX_LENGTH} characters.")
+    if not description:
+        errors.append("Description is missing.")
+    start_date, end_date = row.get("start_date"), row.get("end_date")
+    if not start_date or not end_date:
+        errors.append("Start and end date are required.")
+    else:
+        start_date, end_date = parse_date(start_date) or start_date, parse_date(end_date) or end_date
+        errors.extend(task_date_errors(start_date, end_date, today))
+    if errors:
+        return None, errors
+    return {"name": name, "description": description, "start_date": start_date, "end_date": end_date}, errors
+
+
+class TaskImporter:
+    """
+    Import tasks for one owner from rows of a CSV or JSONL file.
+
+    Rows are validated as they are read. Valid rows are collected into batches, and every batch
+    is inserted with a single bulk_create inside its own transaction, so a file of 100k tasks
+    costs about a hundred INSERT statements instead of 100k saves. A batch failing in the
+    database is rolled back as a whole and its rows reported as failed; earlier batches stay.
+
+    Every row gets an entry in `report`: {"line", "status": "created" | "invalid" | "failed",
+    "errors"}. With `dry_run` rows are validated only and valid ones reported as "valid".
+    """
+
+    def __init__(self, owner, batch_size=1000, dry_run=False, today=None):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.today = today or date.today()
+        self.report = []
+        self.created = 0
+        self.valid = 0
+        self.invalid = 0
+        self.failed = 0
+        self._batch = []
+
+    def run(self, rows):
+        """
+        Import rows as yielded by read_rows(). Returns self, for the counts and the report.
+        """
+        for line_number, row, error in rows:
+            fields, errors = (None, [error]) if error else clean_task_row(row, self.today)
+            if errors:
+                self.invalid += 1
+                self.report.append({"line": line_number, "status": "invalid", "errors": errors})
+                continue
+            self._batch.append((line_number, fields))
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+        self._flush()
+        self.report.sort(key=lambda entry: entry["line"])
+        return self
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        if self.dry_run:
+            status, errors = "valid", []
+        else:
+            try:
+                tasks = [Task(created_by_id=self.owner.pk, **fields) for _, fields in batch]
+                with transaction.atomic():
+                    Task.objects.bulk_create(tasks, batch_size=self.batch_size)
+                status, errors = "created", []
+            except DatabaseError as e:
+                status, errors = "failed", [f"Database error: {e}"]
+        for line_number, _ in batch:
+            self.report.append({"line": line_number, "status": status, "errors": errors})
+        if status == "created":
+            self.created += len(batch)
+        elif status == "valid":
+            self.valid += len(batch)
+        elif status == "failed":
+            self.failed += len(batch)
+
+    def summary(self):
+        return {
+            "created": self.created,
+            "valid": self.valid,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "dry_run": self.dry_run,
+        }
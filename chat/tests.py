@@ -1,3 +1,1254 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import IntegrityError
+from django.test import (
+    LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from authentification.models import CustomUser, NPOManagerProfile, VolunteerProfile
+from chat.cache import (
+    ResponseCache, SemanticEntries, cacheable_turn, generate_cached_response, normalize_question, response_cache,
+)
+from chat.conversations import SESSION_KEY as CONVERSATIONS_KEY
+from chat.conversations import append_messages, load_history
+from chat.extraction import (
+    FIELDS_MARKER, FINAL_FORM_MARKER, FormExtractor, JSONObjectScanner, form_json_fragments, stop_at_form,
+)
+from chat.field_parsers import parse_field_values
+from chat.form_state import PASSWORD_HASH_KEY, SECRET_PLACEHOLDER, FormState
+from chat.helpers import build_messages, extract_and_create_user
+from chat.history import WINDOW_STEP, estimate_tokens, window_history
+from chat.interests import InterestIndex, bitmap_ids, ids_bitmap, interest_index
+from chat.management.commands.loadtest import percentile
+from chat.matching import AREAS, MatchingEngine, competence_levels, matching_engine, task_days, task_requirements
+from chat.metrics import Histogram, MetricsRegistry, RequestMetrics, metrics_registry, track_metrics
+from chat.models import Conversation, Message, Task
+from chat.ollama_api import BackendPool, OllamaClient
+from chat.pagination import decode_cursor, keyset_page
+from chat.retrieval import CONTEXT_HEADER, VectorIndex, build_index, format_context, vector_index
+from chat.scheduler import InferenceScheduler, SchedulerBusy, inference_scheduler, schedule_inference
+from chat.sessions import DEFLATED, MAX_INFLATED_BYTES, PLAIN, CompactSessionSerializer, SessionStore
+from chat.stub_ollama import StubOllamaServer, _stub_vector
+from chat.task_import import TaskImporter, read_rows
+from chat.views import complete_form
+from chat.write_queue import WriteQueue
+from chat.volunteer_import import VOLUNTEER_COLUMNS, VolunteerImporter
+
+
+class CompactSessionSerializerTests(SimpleTestCase):
+    def test_round_trip(self):
+        serializer = CompactSessionSerializer()
+        session = {"_auth_user_id": "42", CONVERSATIONS_KEY: {"chat": 7, "task": 8}}
+        data = serializer.dumps(session)
+        self.assertEqual(data[:1], DEFLATED)
+        self.assertLess(len(data), len(json.dumps(session)))
+        self.assertEqual(serializer.loads(data), session)
+
+    def test_small_sessions_stay_plain(self):
+        serializer = CompactSessionSerializer()
+        self.assertEqual(serializer.dumps({}), PLAIN + b"{}")
+        self.assertEqual(serializer.loads(PLAIN + b"{}"), {})
+
+    def test_json_serializer_sessions_still_load(self):
+        self.assertEqual(CompactSessionSerializer().loads(b'{"a":1}'), {"a": 1})
+
+    def test_inflating_too_far_is_refused(self):
+        data = CompactSessionSerializer().dumps({"a": "x" * (2 * MAX_INFLATED_BYTES)})
+        with self.assertRaises(ValueError):
+            CompactSessionSerializer().loads(data)
+
+
+class SessionStoreTests(TestCase):
+    def test_conversations_survive_large_sessions(self):
+        with self.settings(SESSION_SERIALIZER="chat.sessions.CompactSessionSerializer"):
+            store = SessionStore()
+            store[CONVERSATIONS_KEY] = {"chat": 1}
+            store["notes"] = ["x" * 100] * 100
+            store.save()
+            loaded = SessionStore(store.session_key)
+            self.assertEqual(loaded[CONVERSATIONS_KEY], {"chat": 1})
+            self.assertEqual(len(loaded["notes"]), 100)
+
+
+class PruneSessionsTests(TestCase):
+    def test_prunes_expired_sessions_and_abandoned_conversations(self):
+        now = timezone.now()
+        store = SessionStore()
+        store.save()
+        Session.objects.filter(pk=store.session_key).update(expire_date=now - timedelta(days=1))
+        live = SessionStore()
+        live.save()
+
+        long_ago = now - timedelta(days=365)
+        abandoned = Conversation.objects.create(flow="chat")
+        Message.objects.create(conversation=abandoned, role="user", content="hi")
+        recent = Conversation.objects.create(flow="chat")
+        Message.objects.create(conversation=recent, role="user", content="hi")
+        Conversation.objects.update(created_at=long_ago)
+        Message.objects.filter(conversation=abandoned).update(created_at=long_ago)
+
+        out = StringIO()
+        call_command("prune_sessions", "--conversations", "--batch-size", "1", stdout=out)
+        self.assertIn("Deleted 1 expired sessions.", out.getvalue())
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), [live.session_key])
+        self.assertEqual(list(Conversation.objects.all()), [recent])
+
+
+class FormStateTests(TestCase):
+    def test_update_accepts_valid_and_records_errors(self):
+        state = FormState("task")
+        start = date.today() + timedelta(days=7)
+        accepted = state.update({
+            "name": "Garden day",
+            "start_date": start.isoformat(),
+            "end_date": "not a date",
+            "unknown": "ignored",
+        })
+        self.assertEqual(accepted, ["name", "start_date"])
+        self.assertEqual(state.values, {"name": "Garden day", "start_date": start.isoformat()})
+        self.assertIn("end_date", state.errors)
+        self.assertIn("description", state.outstanding)
+
+    def test_update_drops_task_dates_breaking_the_rules(self):
+        state = FormState("task")
+        start = date.today() + timedelta(days=7)
+        self.assertEqual(state.update({"start_date": start.isoformat()}), ["start_date"])
+        self.assertEqual(state.update({"end_date": (start - timedelta(days=1)).isoformat()}), [])
+        self.assertNotIn("end_date", state.values)
+        self.assertIn("earlier than the start date", state.errors["end_date"])
+
+    def test_update_from_reply(self):
+        state = FormState("task")
+        reply = f'Thanks! {FIELDS_MARKER} {{"name": "Garden day", "description": "Weeding"}}'
+        self.assertEqual(state.update_from_reply(reply), ["name", "description"])
+        self.assertEqual(state.update_from_reply("No values here."), [])
+
+    def test_instructions_carry_only_what_is_missing(self):
+        state = FormState("task", values={"name": "Garden day"})
+        instructions = state.instructions()
+        self.assertIn("- description:", instructions)
+        self.assertNotIn("- name:", instructions)
+        self.assertIn('name="Garden day"', instructions)
+
+    def test_password_is_kept_as_its_hash(self):
+        state = FormState("user")
+        self.assertEqual(state.update({"password": "Tr1cky-Passw0rd"}), ["password"])
+        self.assertNotIn("Tr1cky-Passw0rd", json.dumps(state.as_dict()))
+        self.assertNotIn("Tr1cky-Passw0rd", state.instructions())
+        form = json.loads(state.final_form()[len(FINAL_FORM_MARKER):])
+        self.assertEqual(form, {PASSWORD_HASH_KEY: state.values["password"]})
+
+    def test_redact(self):
+        state = FormState("user")
+        password = 'Tr1cky"Passw0rd'
+        state.update({"password": password})
+        reply = f"{FIELDS_MARKER} {json.dumps({'password': password})}"
+        self.assertEqual(state.redact(reply), f'{FIELDS_MARKER} {{"password": "{SECRET_PLACEHOLDER}"}}')
+        self.assertEqual(state.redact('It is Tr1cky"Passw0rd'), f"It is {SECRET_PLACEHOLDER}")
+
+
+class FormPasswordTests(TestCase):
+    password = "Tr1cky-Passw0rd"
+
+    def request(self):
+        request = RequestFactory().post("/user-creation/")
+        request._messages = CookieStorage(request)
+        return request
+
+    def test_password_is_not_stored_in_messages(self):
+        conversation = Conversation.objects.create(flow="user")
+        append_messages(conversation, [
+            {"role": "user", "message": f"My password is {self.password}"},
+            {"role": "ai", "message": "Please type it again."},
+        ])
+        chat_history = load_history(conversation)
+        turn_start = len(chat_history)
+        reply = f'Confirmed. {FIELDS_MARKER} {{"password": "{self.password}"}}'
+        chat_history += [{"role": "user", "message": self.password}, {"role": "ai", "message": reply}]
+
+        state = FormState("user")
+        self.assertFalse(complete_form(self.request(), conversation, state, reply, chat_history, mock.Mock()))
+        append_messages(conversation, chat_history[turn_start:])
+
+        stored = list(conversation.messages.values_list("content", flat=True))
+        self.assertEqual(len(stored), 4)
+        self.assertFalse(any(self.password in content for content in stored))
+        self.assertIn(SECRET_PLACEHOLDER, stored[0])
+        self.assertIn("password", state.values)
+
+    def test_user_is_created_with_the_hash(self):
+        state = FormState("user")
+        state.update({"username": "jane_d", "email": "jane@example.com", "password": self.password,
+                      "first_name": "Jane", "last_name": "Doe"})
+        with mock.patch.object(CustomUser, "save", autospec=True, side_effect=CustomUser.save) as save:
+            self.assertTrue(extract_and_create_user(self.request(), state.final_form(), []))
+        self.assertEqual(save.call_count, 1)
+        user = CustomUser.objects.get(username="jane_d")
+        self.assertEqual(user.role, "VOLUNTEER")
+        self.assertTrue(user.check_password(self.password))
+
+
+class ParseFieldValuesTests(SimpleTestCase):
+    def test_dates_in_several_formats(self):
+        for text in ("2030-05-01", "1.5.2030", "1 May 2030", "1. Mai 2030", "May 1st, 2030"):
+            self.assertEqual(parse_field_values(Task, ["start_date"], text), ({"start_date": "2030-05-01"}, False), text)
+
+    def test_dates_fill_the_needed_fields_in_order(self):
+        values, says_more = parse_field_values(Task, ["start_date", "end_date"], "from 1.5.2030 to 3.5.2030")
+        self.assertEqual(values, {"start_date": "2030-05-01", "end_date": "2030-05-03"})
+        self.assertFalse(says_more)
+
+    def test_more_dates_than_fields_say_more(self):
+        _, says_more = parse_field_values(VolunteerProfile, ["date_of_birth", "gender"], "from 1.5.2030 to 3.5.2030")
+        self.assertTrue(says_more)
+
+    def test_schedule_and_competences(self):
+        values, says_more = parse_field_values(
+            VolunteerProfile, ["schedule", "competencies_areas"], "Monday 9-11 and friday 14:00-16:30, arts 2"
+        )
+        self.assertEqual(values["schedule"], {"Monday": ["09:00-11:00"], "Friday": ["14:00-16:30"]})
+        self.assertEqual(values["competencies_areas"], {"ARTS": 2})
+        self.assertFalse(says_more)
+
+    def test_questions_say_more(self):
+        self.assertTrue(parse_field_values(Task, ["start_date"], "Can it start 1.5.2030?")[1])
+
+    def test_username_needs_a_cue_or_to_be_asked_for(self):
+        needed = ["username", "email"]
+        self.assertEqual(parse_field_values(CustomUser, needed, "hi"), ({}, True))
+        self.assertEqual(parse_field_values(CustomUser, needed, "username: jane_d, email jane@example.com"),
+                         ({"email": "jane@example.com", "username": "jane_d"}, False))
+        self.assertEqual(parse_field_values(CustomUser, needed, "jane_d", asked="username"), ({"username": "jane_d"}, False))
+        self.assertEqual(parse_field_values(CustomUser, needed, "yes", asked="username"), ({}, False))
+
+
+class LocalReplyTests(TestCase):
+    def test_values_are_taken_without_the_model(self):
+        state = FormState("task")
+        start = date.today() + timedelta(days=7)
+        end = start + timedelta(days=2)
+        reply = state.local_reply(f"from {start:%d.%m.%Y} to {end:%d.%m.%Y}")
+        self.assertIn("start date, end date", reply)
+        self.assertEqual(state.update_from_reply(reply), ["start_date", "end_date"])
+
+    def test_rejected_value_is_asked_again(self):
+        state = FormState("task")
+        reply = state.local_reply("starting 1.1.2000")
+        self.assertIn("earlier than today", reply)
+        self.assertEqual(state.asked, "start_date")
+        self.assertEqual(state.update_from_reply(reply), [])
+
+    def test_other_messages_go_to_the_model(self):
+        state = FormState("user")
+        self.assertIsNone(state.local_reply("hi"))
+        self.assertIsNone(state.local_reply("What is a username?"))
+        self.assertIsNone(FormState("task").local_reply("from 1.5.2030 to 3.5.2030 or 4.5.2030"))
+
+    def test_bare_username_only_when_asked(self):
+        state = FormState("user")
+        reply = state.local_reply("my username is jane_d")
+        self.assertIn("noted: username", reply)
+        self.assertTrue(reply.rstrip().endswith(f'{FIELDS_MARKER} {{"username": "jane_d"}}'))
+        self.assertEqual(state.asked, "email")
+
+        state = FormState("user", asked="username")
+        self.assertIsNone(state.local_reply("yes"))
+        state.asked = "username"
+        self.assertIn("noted: username", state.local_reply("jane_d"))
+
+    def test_future_date_of_birth_is_rejected(self):
+        state = FormState("volunteer")
+        tomorrow = date.today() + timedelta(days=1)
+        reply = state.local_reply(f"born {tomorrow:%d.%m.%Y}")
+        self.assertIn("in the future", reply)
+        self.assertEqual(state.asked, "date_of_birth")
+
+
+def volunteer(username, **profile):
+    user = CustomUser.objects.create_user(username, f"{username}@example.com", "x", role="VOLUNTEER")
+    return VolunteerProfile.objects.create(user=user, **profile)
+
+
+class InterestIndexTests(SimpleTestCase):
+    def index(self):
+        index = InterestIndex()
+        index.build([(1, "Garden"), (1, "cooking"), (2, "gardening"), (2, "Cooking"), (3, " garden "), (4, "")])
+        return index
+
+    def test_bitmaps(self):
+        self.assertEqual(ids_bitmap([0, 3, 9]), 0b1000001001)
+        self.assertEqual(bitmap_ids(ids_bitmap([70, 2, 9, 2])), [2, 9, 70])
+        self.assertEqual(bitmap_ids(ids_bitmap([])), [])
+
+    def test_search(self):
+        index = self.index()
+        with self.settings(INTEREST_INDEX_RELOAD_SECONDS=3600):
+            self.assertEqual(index.search(["GARDEN", "cooking"]), [1])
+            self.assertEqual(index.search(["garden", "gardening"], match_all=False), [1, 2, 3])
+            self.assertEqual(index.search(["garden", "unknown"]), [])
+            self.assertEqual(index.search([" "]), [])
+
+    def test_autocomplete(self):
+        index = self.index()
+        with self.settings(INTEREST_INDEX_RELOAD_SECONDS=3600):
+            self.assertEqual(index.autocomplete("gar"), [("Garden", 2), ("gardening", 1)])
+            self.assertEqual(index.autocomplete("gar", limit=1), [("Garden", 2)])
+            self.assertEqual(index.autocomplete("x"), [])
+
+    def test_changing_one_profile(self):
+        index = self.index()
+        with self.settings(INTEREST_INDEX_RELOAD_SECONDS=3600):
+            index._set_tags(3, ["Cooking", "Music"])
+            self.assertEqual(index.search(["garden"]), [1])
+            self.assertEqual(index.search(["cooking"]), [1, 2, 3])
+            self.assertEqual(index.autocomplete("mu"), [("Music", 1)])
+            index.remove(2)
+            self.assertEqual(index.autocomplete("gardening"), [])
+            self.assertEqual(index.search(["cooking"]), [1, 3])
+
+
+class InterestIndexDatabaseTests(TestCase):
+    def setUp(self):
+        interest_index._loaded_at = None
+        self.addCleanup(setattr, interest_index, "_loaded_at", None)
+
+    def test_load_and_signals(self):
+        anna = volunteer("anna")
+        anna.interests.add("Garden", "Cooking")
+        self.assertEqual(interest_index.search(["garden"]), [anna.pk])
+
+        ben = volunteer("ben")
+        ben.interests.add("garden")
+        self.assertEqual(interest_index.search(["garden"]), sorted([anna.pk, ben.pk]))
+        anna.interests.remove("Garden")
+        self.assertEqual(interest_index.search(["garden"]), [ben.pk])
+        ben.delete()
+        self.assertEqual(interest_index.search(["garden"], match_all=False), [])
+
+    def test_autocomplete_view(self):
+        volunteer("anna").interests.add("Garden")
+        response = self.client.get("/interests/autocomplete/", {"q": "ga"})
+        self.assertEqual(response.json(), {"tags": [{"name": "Garden", "volunteers": 1}]})
+
+
+def stub_embed_texts(texts):
+    return [_stub_vector(text) for text in texts]
+
+
+@override_settings(RAG_ENABLED=True, RAG_RELOAD_SECONDS=0, RAG_FAQ_PATH=None, RAG_MIN_SIMILARITY=0.5)
+class RetrievalIndexTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch("chat.retrieval.embed_texts", side_effect=stub_embed_texts)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_task(self, name, end_date=date(2030, 1, 10)):
+        owner, _ = CustomUser.objects.get_or_create(username="npo", defaults={"email": "npo@example.com", "role": "NPO_MANAGER"})
+        NPOManagerProfile.objects.get_or_create(user=owner, defaults={"npo_name": "Green Vienna"})
+        return Task.objects.create(name=name, description="Weeding", start_date=date(2030, 1, 1), end_date=end_date,
+                                   created_by=owner)
+
+    def test_build_and_search(self):
+        task = self.create_task("Garden day")
+        self.create_task("Old task", end_date=date(2000, 1, 1))
+        self.assertEqual(build_index(self.directory), 2)
+
+        index = VectorIndex(self.directory)
+        self.assertTrue(index.ready)
+        self.assertEqual(index.vectors.shape, (2, 64))
+        self.assertEqual([document["source"] for document in index.documents], ["task", "npo"])
+        hits = index.search(_stub_vector(index.documents[0]["text"]))
+        self.assertAlmostEqual(hits[0][0], 1.0, places=5)
+        self.assertEqual(hits[0][1]["id"], task.pk)
+        self.assertIn("Garden day", index.documents[1]["text"])
+
+    def test_rebuild_is_picked_up(self):
+        self.create_task("Garden day")
+        build_index(self.directory)
+        index = VectorIndex(self.directory)
+        first = index.current_version()
+        self.create_task("Kitchen day")
+        build_index(self.directory)
+        self.assertNotEqual(index.current_version(), first)
+        self.assertEqual(len(index.documents), 3)
+        build_index(self.directory)
+        # The current and the previous version are kept
+        self.assertEqual(len(os.listdir(self.directory)), 5)
+
+    def test_empty_index(self):
+        self.assertEqual(build_index(self.directory), 0)
+        index = VectorIndex(self.directory)
+        self.assertIsNotNone(index.current_version())
+        self.assertFalse(index.ready)
+        self.assertEqual(index.retrieve("anything"), [])
+
+    def test_index_of_another_embedding_model_is_ignored(self):
+        self.create_task("Garden day")
+        build_index(self.directory)
+        with self.settings(OLLAMA_EMBED_MODEL="other-model"), self.assertLogs("chat.retrieval", "ERROR"):
+            index = VectorIndex(self.directory)
+            self.assertFalse(index.ready)
+
+    def test_cache_key_follows_the_index_version(self):
+        self.create_task("Garden day")
+        build_index(self.directory)
+        with self.settings(RAG_INDEX_DIR=self.directory), mock.patch.object(vector_index, "_checked_at", None), \
+                mock.patch.object(vector_index, "version", None):
+            # Nothing has retrieved yet, the key still names the current index
+            key = response_cache.exact_key("What is an NPO?")
+            self.assertIsNotNone(vector_index.version)
+            build_index(self.directory)
+            self.assertNotEqual(response_cache.exact_key("What is an NPO?"), key)
+
+    def test_no_index(self):
+        index = VectorIndex(self.directory)
+        with mock.patch("chat.retrieval.embed_text") as embed:
+            self.assertEqual(index.retrieve("question"), [])
+        embed.assert_not_called()
+
+    def test_format_context(self):
+        hits = [(0.9, {"text": "first"}), (0.8, {"text": "second " + "x" * 400})]
+        self.assertEqual(format_context(hits, budget=100), f"{CONTEXT_HEADER}\n- first")
+        self.assertEqual(format_context([], budget=100), "")
+
+
+@override_settings(INFERENCE_MAX_CONCURRENCY=1, INFERENCE_MAX_QUEUE=3, INFERENCE_QUEUE_TIMEOUT=5)
+class InferenceSchedulerTests(SimpleTestCase):
+    def test_clients_take_turns(self):
+        scheduler = InferenceScheduler()
+        running = scheduler.admit("busy")
+        self.assertTrue(running.granted)
+        queued = [scheduler.admit(key) for key in ("a", "a", "b")]
+        self.assertEqual((scheduler.active, scheduler.waiting), (1, 3))
+
+        order = []
+        current = running
+        for _ in queued:
+            current.release()
+            current = next(ticket for ticket in queued if ticket.granted and ticket not in order)
+            order.append(current)
+        self.assertEqual([queued.index(ticket) for ticket in order], [0, 2, 1])
+        current.release()
+        self.assertEqual((scheduler.active, scheduler.waiting), (0, 0))
+
+    def test_higher_lane_goes_first(self):
+        scheduler = InferenceScheduler()
+        running = scheduler.admit("busy")
+        low = scheduler.admit("a", lane="low")
+        high = scheduler.admit("b", lane="high")
+        running.release()
+        self.assertTrue(high.granted)
+        self.assertFalse(low.granted)
+
+    def test_full_queue_is_refused(self):
+        scheduler = InferenceScheduler()
+        tickets = [scheduler.admit(f"client{i}") for i in range(4)]
+        with self.assertRaises(SchedulerBusy) as raised:
+            scheduler.admit("late")
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        for ticket in tickets:
+            ticket.release()
+        self.assertEqual((scheduler.active, scheduler.waiting), (0, 0))
+
+    def test_ticket_is_admitted_lazily(self):
+        scheduler = InferenceScheduler()
+        ticket = scheduler.ticket("a")
+        self.assertEqual(scheduler.active, 0)
+        generate = ticket.guard(lambda messages: iter(["one", "two"]))
+        self.assertEqual(list(generate([])), ["one", "two"])
+        self.assertEqual(scheduler.active, 0)
+        ticket.release()
+
+    def test_busy_view_answers_503(self):
+        @schedule_inference("normal")
+        def view(request):
+            generate = request.inference_ticket.guard(lambda messages: iter(["reply"]))
+            return HttpResponse("".join(generate([])))
+
+        factory = RequestFactory()
+        request = factory.post("/chat/")
+        request.user = CustomUser(pk=1)
+        held = [inference_scheduler.admit(f"client{i}") for i in range(4)]
+        try:
+            response = view(request)
+        finally:
+            for ticket in held:
+                ticket.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+        request = factory.post("/chat/")
+        request.user = CustomUser(pk=1)
+        response = view(request)
+        self.assertEqual(response.content, b"reply")
+        self.assertEqual((inference_scheduler.active, inference_scheduler.waiting), (0, 0))
+
+    def test_time_to_first_token_leaves_the_queue_wait_out(self):
+        scheduler = InferenceScheduler()
+        registry = MetricsRegistry()
+        metrics = RequestMetrics("chat", registry=registry)
+        running = scheduler.admit("busy")
+        ticket = scheduler.ticket("a")
+
+        def generate(messages, on_done=None):
+            yield "reply"
+
+        generate = ticket.guard(metrics.timed(generate), on_wait=metrics.queue_wait)
+        threading.Timer(0.2, running.release).start()
+        self.assertEqual(list(generate([])), ["reply"])
+        recorded = registry.snapshot()["chat"]
+        self.assertGreaterEqual(recorded["queue_wait_seconds"]["sum"], 0.2)
+        self.assertLess(recorded["ttft_seconds"]["sum"], 0.1)
+
+
+@override_settings(OLLAMA_MAX_FAILURES=1, OLLAMA_CONNECT_TIMEOUT=2)
+class BackendPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.servers = [
+            StubOllamaServer(port=0, ttft=0, reply_tokens=3, jitter=0).start(),
+            StubOllamaServer(port=0, ttft=0, reply_tokens=3, jitter=0).start(),
+        ]
+        self.pool = BackendPool(hosts=[server.url for server in self.servers], health_interval=0)
+
+    def tearDown(self):
+        self.pool.stop()
+        for server in self.servers:
+            server.stop()
+
+    def test_affinity(self):
+        first = self.pool.choose("conversation")
+        # The other node is now less busy, the conversation still sticks to its node
+        self.assertIs(self.pool.choose("conversation"), first)
+        other = self.pool.choose()
+        self.assertIsNot(other, first)
+        for backend in (first, first, other):
+            self.pool._done(backend)
+
+    def test_failing_node_is_ejected_and_readmitted(self):
+        failing, healthy = self.pool.backends
+        self.servers[0].error_rate = 1.0
+        with self.assertLogs("chat.ollama_api", "WARNING"):
+            for _ in range(2):
+                reply = "".join(self.pool.chat([{"role": "user", "content": "hi"}]))
+                self.assertEqual(len(reply.split()), 3)
+        self.assertFalse(failing.healthy)
+        self.assertTrue(healthy.healthy)
+        self.assertIs(self.pool.choose("conversation"), healthy)
+        self.pool._done(healthy)
+
+        self.servers[0].error_rate = 0.0
+        with self.assertLogs("chat.ollama_api", "INFO"):
+            self.pool.check_health()
+        self.assertTrue(failing.healthy)
+        self.assertEqual([backend.outstanding for backend in self.pool.backends], [0, 0])
+
+    async def test_async_stream_closed_early_gives_its_node_back(self):
+        stream = self.pool.achat([{"role": "user", "content": "hi"}])
+        await anext(stream)
+        await stream.aclose()
+        self.assertEqual([backend.outstanding for backend in self.pool.backends], [0, 0])
+
+
+class OllamaClientTests(SimpleTestCase):
+    async def test_async_stream_is_closed_when_the_consumer_stops(self):
+        closed = []
+
+        async def stream():
+            try:
+                for word in ("one", "two"):
+                    yield {"message": {"content": word}, "done": False}
+            finally:
+                closed.append(True)
+
+        async_client = mock.Mock(chat=mock.AsyncMock(return_value=stream()))
+        with mock.patch.object(OllamaClient, "async_client", mock.PropertyMock(return_value=async_client)):
+            chat = OllamaClient().achat([{"role": "user", "content": "hi"}])
+            self.assertEqual(await anext(chat), "one")
+            await chat.aclose()
+        self.assertEqual(closed, [True])
+
+
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "x", role="NPO_MANAGER")
+        start = date(2030, 1, 1)
+        Task.objects.bulk_create([
+            Task(name=f"Task {i}", description="d", start_date=start + timedelta(days=i // 3),
+                 end_date=start + timedelta(days=10), created_by=owner)
+            for i in range(8)
+        ])
+
+    def test_pages_cover_all_rows_in_order(self):
+        queryset = Task.objects.all()
+        expected = list(queryset.order_by("start_date", "id"))
+        rows, after = [], None
+        while True:
+            page, cursor = keyset_page(queryset, "start_date", after=after, limit=3)
+            self.assertLessEqual(len(page), 3)
+            rows.extend(page)
+            if cursor is None:
+                break
+            after = decode_cursor(cursor)
+        self.assertEqual(rows, expected)
+
+    def test_values_rows(self):
+        page, cursor = keyset_page(Task.objects.values("id", "start_date"), "start_date", limit=8)
+        self.assertEqual(len(page), 8)
+        self.assertIsNone(cursor)
+
+    def test_malformed_cursor(self):
+        self.assertIsNone(decode_cursor("2030-01-01"))
+        self.assertIsNone(decode_cursor("yesterday.1"))
+
+
+class TaskRoutesTests(TestCase):
+    def test_manager_named_import_sees_their_tasks(self):
+        owner = CustomUser.objects.create_user("import", "import@example.com", "x", role="NPO_MANAGER")
+        Task.objects.create(name="Garden", description="d", start_date=date(2030, 1, 1),
+                            end_date=date(2030, 1, 2), created_by=owner)
+        self.client.force_login(owner)
+        response = self.client.get(reverse("chat:user_tasks", args=["import"]), {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task["name"] for task in response.json()["tasks"]], ["Garden"])
+        self.assertNotEqual(reverse("chat:task_import"), reverse("chat:user_tasks", args=["import"]))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class VolunteerImporterTests(TestCase):
+    def rows(self, *rows):
+        text = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+        return read_rows(StringIO(text), "jsonl", VOLUNTEER_COLUMNS)
+
+    def test_jsonl_import(self):
+        CustomUser.objects.create_user("taken", "taken@example.com", "x", role="VOLUNTEER")
+        importer = VolunteerImporter(workers=1).run(self.rows(
+            {"username": "anna", "email": "anna@example.com", "first_name": "Anna", "password": "s3cret-pass",
+             "gender": "F", "date_of_birth": "1990-04-01", "competencies_areas": {"ARTS": 2},
+             "schedule": {"Monday": ["10:00-12:00"]}, "interests": ["garden", "cooking"]},
+            {"username": "ben", "email": "ben@example.com", "first_name": "Ben"},
+            {"username": "anna", "email": "other@example.com", "first_name": "Anna"},
+            {"username": "taken", "email": "new@example.com", "first_name": "Tom"},
+            {"username": "eve", "email": "not-an-email", "first_name": "Eve"},
+        ))
+        self.assertEqual((importer.created, importer.invalid), (2, 4))
+        self.assertEqual([entry["line"] for entry in importer.report if entry["status"] == "created"], [1, 2])
+
+        anna = CustomUser.objects.get(username="anna")
+        self.assertEqual(anna.role, "VOLUNTEER")
+        self.assertTrue(anna.check_password("s3cret-pass"))
+        profile = VolunteerProfile.objects.get(user=anna)
+        self.assertEqual(profile.date_of_birth, date(1990, 4, 1))
+        self.assertEqual(set(profile.interests.names()), {"garden", "cooking"})
+        self.assertFalse(CustomUser.objects.get(username="ben").has_usable_password())
+
+    def test_dry_run(self):
+        importer = VolunteerImporter(workers=1, dry_run=True).run(
+            self.rows({"username": "anna", "email": "anna@example.com", "first_name": "Anna"})
+        )
+        self.assertEqual((importer.valid, importer.invalid), (1, 1))
+        self.assertFalse(CustomUser.objects.filter(username="anna").exists())
+
+    def test_email_is_not_compared_with_usernames(self):
+        CustomUser.objects.create_user("sam@example.com", "other@example.com", "x", role="VOLUNTEER")
+        importer = VolunteerImporter(workers=1).run(self.rows(
+            {"username": "sam@example.com", "email": "sam.b@example.com", "first_name": "Sam"},
+            {"username": "sam", "email": "sam@example.com", "first_name": "Sam"},
+        ))
+        self.assertEqual([entry["status"] for entry in importer.report], ["invalid", "created", "invalid"])
+        self.assertTrue(CustomUser.objects.filter(username="sam").exists())
+
+
+def sse_events(body):
+    """
+    Parse a Server-Sent Events body into [(event, data)].
+    """
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def fake_generate(*chunks, error=None):
+    def generate(messages, **kwargs):
+        yield from chunks
+        if error is not None:
+            raise error
+    return generate
+
+
+@override_settings(CHAT_CACHE_ENABLED=False, RAG_ENABLED=False)
+class StreamingChatViewTests(TestCase):
+    def post(self, **data):
+        return self.client.post(reverse("chat:chat"), {"user_input": "Hello", **data})
+
+    def stored(self):
+        return list(Message.objects.order_by("id").values_list("role", "content"))
+
+    def test_reply_is_streamed_as_events(self):
+        with mock.patch("chat.views.generate_response", fake_generate("Hi ", "there")):
+            response = self.post(stream="1")
+            body = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual(sse_events(body), [
+            ("token", {"content": "Hi "}),
+            ("token", {"content": "there"}),
+            ("done", {"redirect": None}),
+        ])
+        self.assertEqual(self.stored(), [("user", "Hello"), ("ai", "Hi there")])
+
+    def test_accept_header_asks_for_a_stream(self):
+        with mock.patch("chat.views.generate_response", fake_generate("Hi")):
+            response = self.client.post(reverse("chat:chat"), {"user_input": "Hello"},
+                                        headers={"Accept": "text/event-stream"})
+            b"".join(response.streaming_content)
+        self.assertTrue(response.streaming)
+
+    def test_failed_generation_reports_an_error_event(self):
+        with mock.patch("chat.views.generate_response", fake_generate("Hi", error=ConnectionError("down"))):
+            response = self.post(stream="1")
+            events = sse_events(b"".join(response.streaming_content).decode())
+        self.assertEqual([event for event, _ in events], ["token", "error", "done"])
+        self.assertEqual(self.stored()[-1], ("ai", events[1][1]["message"]))
+
+    @override_settings(INFERENCE_MAX_CONCURRENCY=1, INFERENCE_MAX_QUEUE=0)
+    def test_busy_queue_stores_nothing(self):
+        held = inference_scheduler.admit("busy")
+        try:
+            with mock.patch("chat.views.generate_response", fake_generate("Hi")):
+                response = self.post(stream="1")
+                events = sse_events(b"".join(response.streaming_content).decode())
+        finally:
+            held.release()
+        self.assertEqual(events[0][0], "error")
+        self.assertIn("retry_after", events[0][1])
+        self.assertEqual(self.stored(), [])
+
+    def test_without_stream_the_page_is_rendered(self):
+        with mock.patch("chat.views.generate_response", fake_generate("Hi ", "there")):
+            response = self.post()
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "Hi there")
+
+
+def fake_agenerate(*chunks):
+    async def agenerate(messages, **kwargs):
+        for chunk in chunks:
+            yield chunk
+    return agenerate
+
+
+@override_settings(CHAT_CACHE_ENABLED=False, RAG_ENABLED=False)
+class AsyncChatViewTests(TestCase):
+    async def test_reply_is_streamed_as_events(self):
+        with mock.patch("chat.async_views.agenerate_response", fake_agenerate("Hi ", "there")):
+            response = await self.async_client.post(reverse("chat:chat_async"), {"user_input": "Hello", "stream": "1"})
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(sse_events(body)[-1], ("done", {"redirect": None}))
+        self.assertEqual("".join(data["content"] for event, data in sse_events(body) if event == "token"), "Hi there")
+        stored = [message async for message in Message.objects.order_by("id").values_list("role", "content")]
+        self.assertEqual(stored, [("user", "Hello"), ("ai", "Hi there")])
+
+    async def test_without_stream_the_page_is_rendered(self):
+        with mock.patch("chat.async_views.agenerate_response", fake_agenerate("Hi ", "there")):
+            response = await self.async_client.post(reverse("chat:chat_async"), {"user_input": "Hello"})
+        self.assertContains(response, "Hi there")
+
+    @override_settings(INFERENCE_MAX_CONCURRENCY=1, INFERENCE_MAX_QUEUE=0)
+    async def test_busy_queue_answers_503(self):
+        held = inference_scheduler.admit("busy")
+        try:
+            with mock.patch("chat.async_views.agenerate_response", fake_agenerate("Hi")):
+                response = await self.async_client.post(reverse("chat:chat_async"), {"user_input": "Hello"})
+        finally:
+            held.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+
+class WindowHistoryTests(SimpleTestCase):
+    def history(self, count):
+        return [
+            {"role": "user" if i % 2 == 0 else "ai", "message": f"message {i:03d} " + "x" * 40}
+            for i in range(count)
+        ]
+
+    def test_short_history_is_kept(self):
+        history = self.history(4)
+        self.assertEqual(window_history(history, budget=1000), ("", history))
+
+    def test_long_history_is_windowed(self):
+        history = self.history(60)
+        budget = 100
+        summary, recent = window_history(history, budget, summary_budget=50)
+        self.assertLessEqual(sum(estimate_tokens(m["message"]) for m in recent), budget)
+        self.assertEqual(recent, history[-len(recent):])
+        self.assertEqual((len(history) - len(recent)) % WINDOW_STEP, 0)
+        self.assertIn(history[len(history) - len(recent) - 2]["message"], summary)
+        self.assertLessEqual(estimate_tokens(summary), 50 + len(summary.split(" | ")))
+
+    def test_window_start_stays_put(self):
+        history = self.history(60)
+        _, recent = window_history(history, 100, summary_budget=50)
+        start = len(history) - len(recent)
+        _, recent = window_history(history + self.history(1), 100, summary_budget=50)
+        self.assertEqual(len(history) + 1 - len(recent), start)
+
+
+class BuildMessagesTests(SimpleTestCase):
+    history = [{"role": "user", "message": "Hi"}, {"role": "ai", "message": "Hello!"},
+               {"role": "system", "message": "Form saved."}]
+
+    def test_instructions_first_and_roles_tagged(self):
+        messages = build_messages("Be brief.", self.history, "Thanks")
+        self.assertEqual(messages, [
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello!"},
+            {"role": "user", "content": "Thanks"},
+        ])
+
+    def test_context_goes_before_the_new_message(self):
+        messages = build_messages("", self.history, "Thanks", context="Portal content")
+        self.assertEqual(messages[0], {"role": "user", "content": "Hi"})
+        self.assertEqual(messages[-2:], [{"role": "system", "content": "Portal content"},
+                                         {"role": "user", "content": "Thanks"}])
+
+    def test_first_turn_without_instructions_never_opens_with_system(self):
+        messages = build_messages("", [], "Thanks", context="Portal content")
+        self.assertEqual(messages, [{"role": "user", "content": "Portal content\n\nThanks"}])
+
+    @override_settings(CHAT_PROMPT_TOKEN_BUDGET=200, CHAT_HISTORY_SUMMARY_TOKENS=50)
+    def test_long_history_is_summarized(self):
+        history = [{"role": "user" if i % 2 == 0 else "ai", "message": f"message {i:03d} " + "x" * 40}
+                   for i in range(60)]
+        messages = build_messages("Be brief.", history, "Thanks")
+        self.assertEqual(messages[1]["role"], "system")
+        self.assertTrue(messages[1]["content"].startswith("Summary of earlier messages"))
+        self.assertLess(len(messages), len(history))
+        self.assertEqual(messages[-1], {"role": "user", "content": "Thanks"})
+
+
+LOCAL_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "chat_responses": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "chat-tests"},
+}
+
+
+def question_vector(text):
+    # Questions about NPOs point one way, everything else another
+    return [1.0, 0.1] if "npo" in text else [0.0, 1.0]
+
+
+@override_settings(CACHES=LOCAL_CACHES, CHAT_CACHE_ENABLED=True, CHAT_CACHE_SEMANTIC=False, RAG_ENABLED=False)
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.cache.cache.clear()
+        self.calls = 0
+
+    def generate(self, *chunks):
+        def generate(messages):
+            self.calls += 1
+            yield from chunks
+        return generate
+
+    def answer(self, question, *chunks):
+        with mock.patch("chat.cache.response_cache", self.cache):
+            return "".join(generate_cached_response(question, [], generate=self.generate(*chunks)))
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  What is   an NPO?! "), "what is an npo")
+
+    def test_only_first_questions_are_cacheable(self):
+        self.assertTrue(cacheable_turn([]))
+        self.assertTrue(cacheable_turn([{"role": "system", "message": "Welcome"}]))
+        self.assertFalse(cacheable_turn([{"role": "user", "message": "Hi"}, {"role": "ai", "message": "Hello"}]))
+
+    def test_exact_hit_skips_the_model(self):
+        self.assertEqual(self.answer("What is an NPO?", "A non-", "profit."), "A non-profit.")
+        self.assertEqual(self.answer("what is an npo", "Other"), "A non-profit.")
+        self.assertEqual(self.calls, 1)
+
+    def test_empty_and_failed_answers_are_not_cached(self):
+        self.assertEqual(self.answer("What is an NPO?"), "")
+        with self.assertRaises(ConnectionError), mock.patch("chat.cache.response_cache", self.cache):
+            list(generate_cached_response("What is an NPO?", [], generate=fake_generate("A", error=ConnectionError())))
+        self.assertIsNone(self.cache.get("What is an NPO?"))
+
+    @override_settings(CHAT_CACHE_ENABLED=False)
+    def test_disabled_cache_always_generates(self):
+        self.answer("What is an NPO?", "A")
+        self.answer("What is an NPO?", "A")
+        self.assertEqual(self.calls, 2)
+
+    @override_settings(CHAT_CACHE_SEMANTIC=True, CHAT_CACHE_SIMILARITY_THRESHOLD=0.9)
+    def test_similar_question_hits_the_semantic_tier(self):
+        with mock.patch("chat.cache.embed_text", question_vector):
+            self.cache.set("What is an NPO?", "A non-profit.")
+            self.assertEqual(self.cache.get("Explain npo please"), "A non-profit.")
+            self.assertIsNone(self.cache.get("How do I sign up?"))
+            # The hit is copied to the exact tier
+            self.assertEqual(self.cache.get_exact("Explain npo please"), "A non-profit.")
+
+    @override_settings(CHAT_CACHE_SEMANTIC=True)
+    def test_embedding_failure_is_a_miss(self):
+        with mock.patch("chat.cache.embed_text", side_effect=ConnectionError("down")), \
+                self.assertLogs("chat.cache", "WARNING"):
+            self.assertIsNone(self.cache.get("What is an NPO?"))
+
+    def test_semantic_entries_keep_the_newest(self):
+        entries = SemanticEntries()
+        for number in range(4):
+            entries = entries.added([1.0, 0.0], f"key{number}", float("inf"), limit=3)
+        self.assertEqual(entries.keys, ["key1", "key2", "key3"])
+        self.assertEqual(entries.best_match([1.0, 0.0]), ("key1", 1.0))
+        self.assertEqual(SemanticEntries.from_entry(["old", "format"]).keys, [])
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class JSONObjectScannerTests(SimpleTestCase):
+    text = 'Sure {"a": {"b": "}{"}, "c": "say \\"hi\\""} and {"d": 1} {"open": '
+
+    def test_objects_split_over_chunks(self):
+        for size in (1, 2, 3, 7, len(self.text)):
+            scanner = JSONObjectScanner()
+            found = [obj for chunk in chunked(self.text, size) for _, obj in scanner.feed(chunk)]
+            self.assertEqual(
+                [json.loads(obj) for obj in found], [{"a": {"b": "}{"}, "c": 'say "hi"'}, {"d": 1}], size
+            )
+
+
+class FormExtractorTests(SimpleTestCase):
+    form = {"name": "Garden {day}", "schedule": {"Monday": ["10:00-12:00"]}}
+
+    def reply(self):
+        return f"All set.\n{FINAL_FORM_MARKER} {json.dumps(self.form)}\nAnything else?"
+
+    def test_form_split_over_chunks(self):
+        reply = self.reply()
+        for size in (1, 4, 11, len(reply)):
+            extractor = FormExtractor()
+            kept = ""
+            for chunk in chunked(reply, size):
+                kept += extractor.feed(chunk)
+            self.assertTrue(extractor.complete, size)
+            self.assertEqual(extractor.form, self.form)
+            self.assertEqual(kept, reply[:reply.rindex("}") + 1])
+
+    def test_stop_at_marker(self):
+        reply = self.reply()
+        extractor = FormExtractor(stop_at_marker=True)
+        kept = "".join(extractor.feed(chunk) for chunk in chunked(reply, 5))
+        self.assertTrue(extractor.marker_seen)
+        self.assertEqual(kept, reply[:reply.index(FINAL_FORM_MARKER) + len(FINAL_FORM_MARKER)])
+
+    def test_no_marker(self):
+        extractor = FormExtractor()
+        kept = "".join(extractor.feed(chunk) for chunk in chunked('Example: {"a": 1}', 3))
+        self.assertEqual(kept, 'Example: {"a": 1}')
+        self.assertFalse(extractor.complete)
+
+    def test_stop_at_form_closes_the_stream(self):
+        closed = []
+
+        def generate(messages):
+            try:
+                yield from chunked(self.reply(), 4)
+            finally:
+                closed.append(True)
+
+        kept = "".join(stop_at_form(generate)([]))
+        reply = self.reply()
+        self.assertEqual(kept, reply[:reply.rindex("}") + 1])
+        self.assertEqual(closed, [True])
+
+    def test_fragments_after_the_marker_come_first(self):
+        reply = f'Like {{"a": 1}}? {FINAL_FORM_MARKER} {{"b": 2}}'
+        self.assertEqual(form_json_fragments(reply), ['{"b": 2}', '{"a": 1}'])
+
+
+class StubOllamaServerTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubOllamaServer(port=0, ttft=0, reply_tokens=5, jitter=0).start()
+        self.client = OllamaClient(host=self.server.url, model="stub")
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_streamed_reply_is_repeatable(self):
+        messages = [{"role": "user", "content": "hi"}]
+        stats = []
+        reply = "".join(self.client.chat(messages, on_done=stats.append))
+        self.assertEqual(len(reply.split()), 5)
+        self.assertEqual(reply, "".join(self.client.chat(messages)))
+        self.assertEqual(stats[0]["eval_count"], 5)
+
+    def test_structured_output_matches_the_schema(self):
+        schema = {"type": "object", "properties": {"name": {"type": "string"}, "level": {"type": "integer", "minimum": 1}}}
+        reply = "".join(self.client.chat([{"role": "user", "content": "hi"}], format=schema))
+        self.assertEqual(set(json.loads(reply)), {"name", "level"})
+        self.assertEqual(json.loads(reply)["level"], 1)
+
+    def test_embeddings(self):
+        self.assertEqual(self.client.embed("hi"), _stub_vector("hi"))
+
+
+class LoadTestCommandTests(SimpleTestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([3, 1, 2, 4], 0.5), 2)
+        self.assertEqual(percentile([3, 1, 2, 4], 0.99), 4)
+
+    def test_unknown_endpoint(self):
+        with self.assertRaises(CommandError):
+            call_command("loadtest", endpoints="chat,nope", stdout=StringIO())
+
+
+@override_settings(CHAT_CACHE_ENABLED=False, RAG_ENABLED=False)
+class LoadTestRunTests(LiveServerTestCase):
+    def test_chat_sessions(self):
+        output = os.path.join(tempfile.mkdtemp(), "results.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        with mock.patch("chat.views.generate_response", fake_generate("Hi ", "there")):
+            call_command("loadtest", base_url=self.live_server_url, concurrency="2", sessions=2, turns=2,
+                         endpoints="chat", output=output, stdout=StringIO())
+        with open(output) as f:
+            results = json.load(f)["2"]["endpoints"]["chat"]
+        self.assertEqual((results["requests"], results["ok"], results["errors"]), (4, 4, {}))
+        self.assertIsNotNone(results["ttft"]["p50"])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 2), (5, 3), (float("inf"), 4)])
+        self.assertEqual((histogram.count, histogram.sum), (4, 14.5))
+
+    def test_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry.observe("chat", "eval_tokens", 20)
+        text = registry.render_prometheus()
+        self.assertIn("# TYPE chat_eval_tokens histogram", text)
+        self.assertIn('chat_eval_tokens_bucket{view="chat",le="32"} 1', text)
+        self.assertIn('chat_eval_tokens_bucket{view="chat",le="+Inf"} 1', text)
+        self.assertIn('chat_eval_tokens_count{view="chat"} 1', text)
+        self.assertNotIn("ttft", text)
+
+    def test_model_stats(self):
+        registry = MetricsRegistry()
+        metrics = RequestMetrics("form", registry=registry)
+
+        def generate(messages, on_done=None):
+            yield "Hi"
+            on_done({"prompt_eval_count": 10, "prompt_eval_duration": 2e8, "eval_count": 50, "eval_duration": 2e9,
+                     "load_duration": None})
+
+        self.assertEqual(list(metrics.timed(generate)([])), ["Hi"])
+        recorded = registry.snapshot()["form"]
+        self.assertEqual(recorded["tokens_per_second"]["sum"], 25)
+        self.assertEqual(recorded["prompt_eval_tokens"]["sum"], 10)
+        self.assertEqual(recorded["ttft_seconds"]["count"], 1)
+        self.assertNotIn("load_seconds", recorded)
+
+    def test_follow_up_calls_are_timed_apart(self):
+        registry = MetricsRegistry()
+        metrics = RequestMetrics("form", registry=registry)
+        list(metrics.timed(fake_generate("a"))([]))
+        list(metrics.timed(fake_generate("b"))([]))
+        list(metrics.duration("finalize_seconds", fake_generate("{}"))([]))
+        recorded = registry.snapshot()["form"]
+        self.assertEqual(recorded["ttft_seconds"]["count"], 1)
+        self.assertEqual(recorded["finalize_seconds"]["count"], 1)
+
+    def test_request_time_is_recorded_once_the_stream_ends(self):
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+
+        @track_metrics("chat")
+        def view(request):
+            return StreamingHttpResponse(iter(["a", "b"]))
+
+        response = view(RequestFactory().post("/chat/"))
+        self.assertNotIn("chat", metrics_registry.snapshot())
+        b"".join(response.streaming_content)
+        response.close()
+        self.assertEqual(metrics_registry.snapshot()["chat"]["request_seconds"]["count"], 1)
+
+        view(RequestFactory().get("/chat/")).close()
+        self.assertEqual(metrics_registry.snapshot()["chat"]["request_seconds"]["count"], 1)
+
+
+class MetricsViewTests(TestCase):
+    @override_settings(CHAT_METRICS_ALLOWED_IPS=[])
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(reverse("chat:metrics")).status_code, 403)
+        staff = CustomUser.objects.create_user("staff", "staff@example.com", "x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("chat:metrics"), {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), dict)
+
+    @override_settings(CHAT_METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_allowed_address(self):
+        response = self.client.get(reverse("chat:metrics"))
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+
+
+class MatchingEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user("owner", "owner@example.com", "x", role="NPO_MANAGER")
+        # 2030-06-01 is a Saturday
+        cls.task = Task.objects.create(name="Park clean-up", description="Litter picking in the park",
+                                       start_date=date(2030, 6, 1), end_date=date(2030, 6, 1), created_by=cls.owner)
+        cls.gardener = volunteer("gardener", competencies_areas={"ENVIRONMENT": 3},
+                                 schedule={"Saturday": ["09:00-12:00"]})
+        cls.weekday_gardener = volunteer("weekday_gardener", competencies_areas={"ENVIRONMENT": 3},
+                                         schedule={"Monday": ["09:00-12:00"]})
+        cls.teacher = volunteer("teacher", competencies_areas={"EDUCATION": 3}, schedule={"Saturday": ["09:00-12:00"]})
+
+    def test_task_vectors(self):
+        requirements = task_requirements(self.task)
+        self.assertEqual(requirements[AREAS.index("ENVIRONMENT")], 1.0)
+        self.assertEqual(task_days(self.task), [False] * 5 + [True, False])
+        self.assertEqual(competence_levels({"ARTS": 7, "TECH": "x", "HEALTH": -1})[AREAS.index("ARTS")], 3)
+        self.assertEqual(task_requirements(Task(name="Help", description="")), [1 / len(AREAS)] * len(AREAS))
+
+    def test_ranking(self):
+        engine = MatchingEngine()
+        ranking = [user_id for user_id, _ in engine.top_k(self.task, k=3)]
+        self.assertEqual(ranking, [self.gardener.user_id, self.weekday_gardener.user_id, self.teacher.user_id])
+        self.assertEqual(len(engine.top_k(self.task, k=1)), 1)
+
+    def test_hours_narrow_the_availability(self):
+        engine = MatchingEngine()
+        user_ids, scores = engine.scores(task_requirements(self.task), task_days(self.task), hours=1 << 15)
+        score = dict(zip(user_ids.tolist(), scores.tolist()))
+        self.assertAlmostEqual(score[self.gardener.user_id], score[self.weekday_gardener.user_id])
+
+    def test_saved_and_deleted_profiles_update_the_arrays(self):
+        matching_engine.load()
+        self.addCleanup(setattr, matching_engine, "_loaded_at", None)
+        self.teacher.competencies_areas = {"ENVIRONMENT": 3, "EDUCATION": 3}
+        self.teacher.save()
+        self.gardener.delete()
+        ranking = [user_id for user_id, _ in matching_engine.top_k(self.task)]
+        self.assertEqual(ranking[0], self.teacher.user_id)
+        self.assertNotIn(self.gardener.user_id, ranking)
+
+    def test_matches_view(self):
+        matching_engine._loaded_at = None
+        self.addCleanup(setattr, matching_engine, "_loaded_at", None)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("chat:task_matches", args=[self.task.pk]), {"k": 2})
+        self.assertEqual([match["username"] for match in response.json()["matches"]], ["gardener", "weekday_gardener"])
+
+
+class TaskImporterTests(TestCase):
+    def test_csv_import(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "x", role="NPO_MANAGER")
+        csv_text = (
+            "name,description,start_date,end_date\n"
+            "Garden,Weeding,2030-05-01,2030-05-03\n"
+            "Past,Too late,2000-01-01,2000-01-02\n"
+            ",No name,2030-05-01,2030-05-03\n"
+            "Kitchen,Cooking,2030-06-01,2030-06-01\n"
+        )
+        importer = TaskImporter(owner, batch_size=1, today=date(2030, 1, 1)).run(read_rows(StringIO(csv_text), "csv"))
+        self.assertEqual(importer.summary(), {"created": 2, "valid": 0, "invalid": 2, "failed": 0, "dry_run": False})
+        self.assertEqual([entry["status"] for entry in importer.report], ["created", "invalid", "invalid", "created"])
+        self.assertEqual(set(owner.tasks.values_list("name", flat=True)), {"Garden", "Kitchen"})
+
+    def test_missing_columns(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "x", role="NPO_MANAGER")
+        importer = TaskImporter(owner).run(read_rows(StringIO("name,description\nA,B\n"), "csv"))
+        self.assertEqual(importer.invalid, 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_dry_run_creates_nothing(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "x", role="NPO_MANAGER")
+        rows = '{"name": "Garden", "description": "Weeding", "start_date": "2030-05-01", "end_date": "2030-05-03"}\n'
+        importer = TaskImporter(owner, dry_run=True, today=date(2030, 1, 1)).run(read_rows(StringIO(rows), "jsonl"))
+        self.assertEqual(importer.summary()["valid"], 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_upload(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "x", role="NPO_MANAGER")
+        self.client.force_login(owner)
+        start = date.today() + timedelta(days=30)
+        upload = SimpleUploadedFile("tasks.csv", (
+            "name,description,start_date,end_date\n"
+            f"Garden,Weeding,{start},{start + timedelta(days=2)}\n"
+            f"Kitchen,Cooking,{start},{start - timedelta(days=1)}\n"
+        ).encode("utf-8"))
+        response = self.client.post(reverse("chat:task_import"), {"file": upload})
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual([row["line"] for row in response.json()["rows"]], [3])
+        self.assertEqual(list(owner.tasks.values_list("name", flat=True)), ["Garden"])
+
+
+def create_volunteer(username):
+    return CustomUser.objects.create_user(username, f"{username}@example.com", "x", role="VOLUNTEER").username
+
+
+@override_settings(SQLITE_WRITE_QUEUE=True, SQLITE_WRITE_BATCH_SIZE=10)
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.queue = WriteQueue()
+        self.addCleanup(self.queue.stop)
+
+    def test_queued_writes_commit_together(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocking_write():
+            started.set()
+            release.wait(5)
+            return threading.current_thread().name
+
+        first = self.queue.submit(blocking_write)
+        started.wait(5)
+        # Queued while the writer is busy, so committed as one group
+        futures = [self.queue.submit(create_volunteer, name) for name in ("anna", "ben", "anna")]
+        release.set()
+        self.assertEqual(first.result(5), "sqlite-writer")
+        self.assertEqual([future.result(5) for future in futures[:2]], ["anna", "ben"])
+        with self.assertRaises(IntegrityError):
+            futures[2].result(5)
+        self.assertEqual(sorted(CustomUser.objects.values_list("username", flat=True)), ["anna", "ben"])
+
+    def test_run_waits_for_the_commit(self):
+        self.assertEqual(self.queue.run(create_volunteer, "anna"), "anna")
+        self.assertTrue(CustomUser.objects.filter(username="anna").exists())
+
+    async def test_arun(self):
+        self.assertEqual(await self.queue.arun(create_volunteer, "anna"), "anna")
+        self.assertTrue(await CustomUser.objects.filter(username="anna").aexists())
+
+    @override_settings(SQLITE_WRITE_QUEUE=False)
+    def test_disabled_queue_writes_in_the_calling_thread(self):
+        self.assertEqual(self.queue.run(lambda: threading.current_thread()), threading.current_thread())
+        self.assertIsNone(self.queue._thread)
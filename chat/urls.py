@@ -2,13 +2,22 @@ from django.contrib import admin
 from django.urls import include, path
 
 
-from . import views
+from . import async_views, views
 app_name = 'chat'
 urlpatterns = [
     path('chat/', views.chat_view, name='chat'),
     path('form-creation/', views.form_view, name='form'),
     path('user-creation/', views.register_view, name='user'),
     path('vonboard/', views.volunteer_onboard_view, name='volunteer_onboard'),
+    path('async/chat/', async_views.chat_view, name='chat_async'),
+    path('async/form-creation/', async_views.form_view, name='form_async'),
+    path('async/user-creation/', async_views.register_view, name='user_async'),
+    path('async/vonboard/', async_views.volunteer_onboard_view, name='volunteer_onboard_async'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('import/tasks/', views.task_import_view, name='task_import'),
+    path('tasks/<int:task_id>/matches/', views.task_matches_view, name='task_matches'),
+    path('interests/autocomplete/', views.interest_autocomplete_view, name='interest_autocomplete'),
+    path('volunteers/by-interests/', views.volunteers_by_interests_view, name='volunteers_by_interests'),
     path('tasks/<str:username>/', views.user_tasks_view, name='user_tasks'),
     path('show-user/', views.create_and_show_user, name='show_user'),
     path('show-task/', views.create_and_show_task, name='show_task'),
@@ -0,0 +1,55 @@
+from datetime import date
+
+# A task ends at most this many years after it starts
+MAX_TASK_YEARS = 5
+
+
+def parse_date(value):
+    """
+    Return the date of a 'YYYY-MM-DD' string (a date is returned as is), None if it is not one.
+    """
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+
+def add_years(value, years):
+    try:
+        return value.replace(year=value.year + years)
+    except ValueError:  # 29 February
+        return value.replace(year=value.year + years, day=28)
+
+
+def task_date_errors(start_date, end_date, today=None):
+    """
+    Check the dates of a task: the start not before today, the end not before the start and at
+    most MAX_TASK_YEARS after it.
+
+    Parameters:
+        start_date (date | str): Start date, a date or 'YYYY-MM-DD'.
+        end_date (date | str): End date, a date or 'YYYY-MM-DD'.
+        today (date): Day the start date may not be earlier than, the current day if not given.
+
+    Returns:
+        list: One message per broken rule, empty if the dates are valid.
+    """
+    start, end = parse_date(start_date), parse_date(end_date)
+    errors = []
+    if start is None:
+        errors.append(f"Start date {start_date!r} is not a date in YYYY-MM-DD format.")
+    if end is None:
+        errors.append(f"End date {end_date!r} is not a date in YYYY-MM-DD format.")
+    if errors:
+        return errors
+
+    today = today or date.today()
+    if start < today:
+        errors.append(f"Start date {start} is earlier than today ({today}).")
+    if end < start:
+        errors.append(f"End date {end} is earlier than the start date {start}.")
+    elif end > add_years(start, MAX_TASK_YEARS):
+        errors.append(f"End date {end} is more than {MAX_TASK_YEARS} years after the start date {start}.")
+    return errors
@@ -1,121 +1,455 @@
 import json
-from django.shortcuts import redirect, render
-from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from datetime import date
+from functools import partial
+from django.conf import settings
+from django.shortcuts import get_object_or_404, redirect, render
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 
 from authentification.models import CustomUser, VolunteerProfile
+from chat.cache import cacheable_turn, cached_answer, generate_cached_response
+from chat.conversations import append_messages, get_conversation, load_history, redact_messages, save_form_state
 from chat.decorators import role_required, unauthenticated_user
+from chat.extraction import FIELDS_MARKER, stop_at_form, structured_form
+from chat.form_state import FormState
 from chat.helpers import *
+from chat.interests import interest_index
+from chat.matching import matching_engine
+from chat.metrics import metrics_registry, track_metrics
 from chat.models import Task
+from chat.pagination import decode_cursor, keyset_page
+from chat.task_import import TaskImporter, import_format, read_rows, text_stream
+from chat.prompts import prompt_registry
+from chat.retrieval import retrieve_context
+from chat.scheduler import BUSY_MESSAGE, SchedulerBusy, schedule_inference
 from .ollama_api import generate_response
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.urls import reverse
+
+
+def wants_stream(request):
+    """
+    The chat pages ask for a streamed reply either with a `stream` form field
+    (sent by chat-stream.js) or with an `Accept: text/event-stream` header.
+    """
+    return (
+        request.POST.get("stream") == "1"
+        or "text/event-stream" in request.headers.get("Accept", "")
+    )
+
+
+def scheduled_generate(request, conversation):
+    """
+    generate_response, waiting for the request's inference slot before the model is called.
+    Turns of one conversation go to the same Ollama node while it is healthy, and the wait for
+    the slot and the model timings are recorded in the request's metrics.
+    """
+    metrics = request.metrics
+    return request.inference_ticket.guard(
+        metrics.timed(partial(generate_response, affinity_key=conversation.pk)), on_wait=metrics.queue_wait
+    )
+
+
+def form_generate(request, conversation, state):
+    """
+    Generate function of the form flows: the generation stops once the collected field values
+    are complete, and with settings.CHAT_STRUCTURED_OUTPUT they are constrained to the JSON
+    Schema of the fields still needed.
+    """
+    generate = scheduled_generate(request, conversation)
+    if settings.CHAT_STRUCTURED_OUTPUT:
+        finalize = request.inference_ticket.guard(
+            request.metrics.duration("finalize_seconds", partial(generate_response, affinity_key=conversation.pk)),
+            on_wait=request.metrics.queue_wait,
+        )
+        return structured_form(generate, state.json_schema(), marker=FIELDS_MARKER, finalize=finalize)
+    return stop_at_form(generate, marker=FIELDS_MARKER)
+
+
+def complete_form(request, conversation, state, ai_response, chat_history, create):
+    """
+    Take the field values of a form reply into the form state and, once every field is filled,
+    create the object with `create` (one of the extract_and_create_* helpers). The state is
+    stored again, emptied if the object was created. Secret values the reply reported (see
+    FormState.redact) are taken out of `chat_history` and the stored messages.
+
+    Returns:
+        bool: True if the object was created.
+    """
+    created = False
+    accepted = state.update_from_reply(ai_response)
+    if state.secrets:
+        # Passwords stay out of the stored messages, this turn's and the earlier one giving them
+        for entry in chat_history:
+            entry["message"] = state.redact(entry["message"])
+        redact_messages(conversation, state.secrets, state.redact)
+    if accepted and state.complete:
+        with request.metrics.timer("extract_seconds"):
+            result = create(request, state.final_form(), chat_history)
+        created = result.get("success", False) if isinstance(result, dict) else bool(result)
+        if created:
+            state.reset()
+        else:
+            error = result.get("error_message") if isinstance(result, dict) else None
+            state.fail(error or "the portal rejected it.")
+    save_form_state(conversation, state.as_dict())
+    return created
+
+
+def local_generate(reply):
+    """
+    Generate function answering with a reply made without the model: a cached answer, or a
+    form turn answered by FormState.local_reply.
+    """
+    def generate(prompt_messages):
+        yield reply
+    return generate
+
+
+def prepare_form_turn(request, conversation, state, chat_history, user_input):
+    """
+    Return the prompt messages and the generate function of a form turn. A message made only
+    of field values is answered locally, without a prompt, an inference slot or the model.
+    """
+    reply = state.local_reply(user_input)
+    if reply is not None:
+        return [], local_generate(reply)
+    with request.metrics.timer("prompt_build_seconds"):
+        prompt_messages = state.build_messages(chat_history, user_input)
+    return prompt_messages, form_generate(request, conversation, state)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_chat_response(request, conversation, chat_history, prompt_messages, user_input, on_complete=None,
+                         error_message="Sorry, there was an error generating the response.", generate=None):
+    """
+    Forward the model output to the browser as Server-Sent Events while it is generated.
+
+    Parameters:
+        request: The Django HTTP request object.
+        conversation (Conversation): Conversation the turn is appended to.
+        chat_history (list): Recent chat history of the conversation.
+        prompt_messages (list): Role-tagged messages sent to the model.
+        user_input (str): The message typed by the user in this turn.
+        on_complete (callable): Called with the finished AI response and the chat history once
+            the stream ends, may return a URL the page should redirect to.
+        error_message (str): Text stored in the history if generation fails.
+        generate (callable): Produces the reply chunks from the prompt messages,
+            scheduled_generate(request, conversation) by default.
+
+    Returns:
+        StreamingHttpResponse: `token` events for every chunk, followed by one `done` event.
+    """
+    generate = generate or scheduled_generate(request, conversation)
+
+    def event_stream():
+        chunks = []
+        try:
+            for chunk in generate(prompt_messages):
+                chunks.append(chunk)
+                yield sse_event("token", {"content": chunk})
+            ai_response = "".join(chunks)
+        except SchedulerBusy as e:
+            # The queue was full when the model was reached; nothing happened, so nothing is stored
+            yield sse_event("error", {"message": BUSY_MESSAGE, "retry_after": e.retry_after})
+            yield sse_event("done", {"redirect": None})
+            return
+        except Exception as e:
+            ai_response = error_message
+            yield sse_event("error", {"message": ai_response})
+
+        # Add the user message and AI response to the chat history
+        turn_start = len(chat_history)
+        chat_history.append({"role": "user", "message": user_input})
+        chat_history.append({"role": "ai", "message": ai_response})
+
+        redirect_url = on_complete(ai_response, chat_history) if on_complete else None
+
+        # Store the turn, including any system messages added by on_complete
+        with request.metrics.timer("history_save_seconds"):
+            append_messages(conversation, chat_history[turn_start:])
+        yield sse_event("done", {"redirect": redirect_url})
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 # Create your views here.
 
 @csrf_exempt
+@track_metrics('chat')
+@schedule_inference('low')
 def chat_view(request):
     if request.method == "POST":
         user_input = request.POST.get("user_input")
-        # Retrieve the chat history from the session
-        chat_history = request.session.get("chat_history", [])
+        # Retrieve the recent chat history of the conversation
+        with request.metrics.timer("history_load_seconds"):
+            conversation = get_conversation(request, "chat")
+            chat_history = load_history(conversation)
+
+        # A question asked before is answered from the response cache, follow-ups never are
+        cacheable = cacheable_turn(chat_history)
+        answer = cached_answer(user_input) if cacheable else None
+        if answer is not None:
+            prompt_messages, generate = [], local_generate(answer)
+        else:
+            # Look up the portal content related to the question
+            with request.metrics.timer("retrieval_seconds"):
+                context = retrieve_context(user_input)
 
-        # Build the full prompt for the AI model using the chat history
-        prompt = ""
-        for message in chat_history:
-            if message['role'] == 'user':
-                prompt += f"User: {message['message']}\n"
-            elif message['role'] == 'ai':
-                prompt += f"AI: {message['message']}\n"
+            # Build the role-tagged messages for the AI model using the chat history
+            with request.metrics.timer("prompt_build_seconds"):
+                prompt_messages = build_messages(prompt_registry.get("chat"), chat_history, user_input, context)
 
-        prompt += f"User: {user_input}\nAI:"
+            generate = scheduled_generate(request, conversation)
+            if cacheable:
+                # Similar questions are still answered from the semantic tier, new answers are cached
+                generate = partial(generate_cached_response, user_input, generate=generate, exact=False)
+
+        if wants_stream(request):
+            return stream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                        generate=generate)
 
         # Generate the AI response
         ai_response = ""
         try:
             # Get AI response from the generate_response function (assuming it's a generator)
-            for chunk in generate_response(prompt):
+            for chunk in generate(prompt_messages):
                 ai_response += chunk
+        except SchedulerBusy:
+            raise  # Answered with 503 by schedule_inference
         except Exception as e:
             ai_response = "Sorry, there was an error generating the response."
 
         # Add the user message and AI response to the chat history
+        turn_start = len(chat_history)
         chat_history.append({"role": "user", "message": user_input})
         chat_history.append({"role": "ai", "message": ai_response})
 
-        # Store the updated chat history in the session
-        request.session["chat_history"] = chat_history
-        
+        # Store the new turn in the conversation
+        with request.metrics.timer("history_save_seconds"):
+            append_messages(conversation, chat_history[turn_start:])
+
         # Return the updated page with the chat history and the AI response
         return render(request, "chat.html", {"chat_history": chat_history})
     return render(request, "chat.html", {"chat_history": []})
 
 @role_required('NPO_MANAGER')
 @csrf_exempt
+@track_metrics('form')
+@schedule_inference('high')
 def form_view(request):
-    chat_history = request.session.get("chat_history", [])
-    response = render(request, "form-creation.html", {"chat_history": chat_history})
+    with request.metrics.timer("history_load_seconds"):
+        conversation = get_conversation(request, "task")
+        chat_history = load_history(conversation)
     if request.method == "POST":
         user_input = request.POST.get("user_input")
-        task_schema = extract_task_schema(Task) 
-        chat_history = request.session.get("chat_history", [])
-
-        # Build the full prompt for the AI model using the chat history
-        prompt = f'''In this chat your goal is help User to create task in Austrian voluntering portal. 
-        Your role is to assist the user in providing and validating the following information:
-        - **User Information**: {json.dumps(task_schema, indent=2)} 
-        Note:
-        1. Name and description should be correlated.
-        2. Start date should not be earlier than {get_current_time()}.
-        3. Start date should not be later than end date.
-        4. End date should not be earlier than the start date.
-        5. End date should not be later than the start date plus 5 years.
-        6. Convert date for convenient format yourself if user send it other order
-        7. When all fields are complete, output the finalized form in JSON format with the following phrasing:
-        "There is final version of JSON form:" followed by the JSON data.
-
-        Use the following chat history to guide your responses:
-        '''
-        for message in chat_history:
-            if message['role'] == 'user':
-                prompt += f"User: {message['message']}\n"
-            elif message['role'] == 'ai':
-                prompt += f"AI: {message['message']}\n"
-
-        prompt += f"User: {user_input}\nAI:"
+        state = FormState.load(conversation)
+
+        # Messages made only of field values are answered locally, the others by the model
+        prompt_messages, generate = prepare_form_turn(request, conversation, state, chat_history, user_input)
+
+        if wants_stream(request):
+            def create_task(ai_response, chat_history):
+                if complete_form(request, conversation, state, ai_response, chat_history, extract_and_create_task):
+                    return reverse('chat:user_tasks', kwargs={'username': request.user.username})
+                return None
+
+            return stream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                        on_complete=create_task,
+                                        generate=generate)
 
         # Generate the AI response
         ai_response = ""
         try:
             # Get AI response from the generate_response function (assuming it's a generator)
-            for chunk in generate_response(prompt):
+            for chunk in generate(prompt_messages):
                 ai_response += chunk
+        except SchedulerBusy:
+            raise  # Answered with 503 by schedule_inference
         except Exception as e:
             ai_response = "Sorry, there was an error generating the response."
 
         # Add the user message and AI response to the chat history
+        turn_start = len(chat_history)
         chat_history.append({"role": "user", "message": user_input})
         chat_history.append({"role": "ai", "message": ai_response})
 
-        # Store the updated chat history in the session
-        request.session["chat_history"] = chat_history
+        # Take the collected fields, creating the task once the form is complete
+        created = complete_form(request, conversation, state, ai_response, chat_history, extract_and_create_task)
+
+        # Store the new turn in the conversation
+        with request.metrics.timer("history_save_seconds"):
+            append_messages(conversation, chat_history[turn_start:])
 
-        if "There is final version of JSON form:" in ai_response:
-            result = extract_and_create_task(request, ai_response, chat_history)
-            if result.get("success"):
-                return redirect('chat:user_tasks', username=request.user.username)
+        if created:
+            return redirect('chat:user_tasks', username=request.user.username)
 
         # Return the updated page with the chat history and the AI response
         return render(request, "form-creation.html", {"chat_history": chat_history})
 
     # Render the initial page with an chat history
-    return response
+    return render(request, "form-creation.html", {"chat_history": chat_history})
+
+def metrics_view(request):
+    """
+    Histograms of the chat views' timings and Ollama's token counts, in the Prometheus text
+    format or as JSON with ?format=json. Open to staff users and to the addresses in
+    settings.CHAT_METRICS_ALLOWED_IPS (e.g. the Prometheus server). The numbers are per
+    worker process.
+    """
+    if not (request.user.is_staff or request.META.get("REMOTE_ADDR") in settings.CHAT_METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden("Metrics are only available to staff users.")
+    if request.GET.get("format") == "json":
+        return JsonResponse(metrics_registry.snapshot())
+    return HttpResponse(metrics_registry.render_prometheus(), content_type="text/plain; version=0.0.4")
 
 @role_required('NPO_MANAGER')
 def user_tasks_view(request, username):
-    # Filter tasks by the CustomUser instance
-    tasks = Task.objects.filter(created_by__username=username)
-    return render(request, 'user_tasks.html', {'tasks': tasks, 'username': username})
+    """
+    List the tasks of a user by start date, a page at a time.
+
+    Query parameters:
+        from, to: Only tasks starting on or after / on or before these dates (YYYY-MM-DD).
+        after: Cursor of the next page, as given in the previous page.
+        limit: Tasks per page (default 24, at most 100).
+        format: 'json' for a JSON listing instead of the page.
+    """
+    owner = get_object_or_404(CustomUser, username=username)
+    tasks = Task.objects.filter(created_by=owner)
+
+    filters = {}
+    for param, lookup in (("from", "start_date__gte"), ("to", "start_date__lte")):
+        if request.GET.get(param):
+            try:
+                filters[param] = date.fromisoformat(request.GET[param])
+            except ValueError:
+                return HttpResponseBadRequest(f"Invalid '{param}' date, expected YYYY-MM-DD.")
+            tasks = tasks.filter(**{lookup: filters[param]})
+
+    after = None
+    if request.GET.get("after"):
+        after = decode_cursor(request.GET["after"])
+        if after is None:
+            return HttpResponseBadRequest("Invalid 'after' cursor.")
+    try:
+        limit = min(max(int(request.GET.get("limit", 24)), 1), 100)
+    except ValueError:
+        limit = 24
+
+    if request.GET.get("format") == "json":
+        rows, next_cursor = keyset_page(
+            tasks.values("id", "name", "start_date", "end_date"), "start_date", after, limit
+        )
+        return JsonResponse({"username": owner.username, "tasks": rows, "next": next_cursor})
+
+    page, next_cursor = keyset_page(tasks.defer("created_at", "updated_at"), "start_date", after, limit)
+    params = request.GET.copy()
+    params.pop("after", None)
+    first_query = None if after is None else params.urlencode()
+    next_query = None
+    if next_cursor:
+        params["after"] = next_cursor
+        next_query = params.urlencode()
+    return render(request, 'user_tasks.html', {
+        'tasks': page,
+        'owner': owner,
+        'username': owner.username,
+        'filters': filters,
+        'first_query': first_query,
+        'next_query': next_query,
+    })
+
+@role_required('NPO_MANAGER')
+def task_import_view(request):
+    """
+    Import the manager's tasks from an uploaded CSV or JSONL file (the `file` field).
+
+    The file is read row by row from the upload, validated with the date rules of the task
+    form and inserted in batches (see chat/task_import.py). Answers with JSON: the counts and
+    the report of every row that was not imported. A `dry_run` field only validates.
+    """
+    if request.method != "POST":
+        return render(request, 'task_import.html')
+    upload = request.FILES.get("file")
+    if upload is None:
+        return JsonResponse({"error": "No file uploaded."}, status=400)
+    try:
+        fmt = import_format(upload.name, request.POST.get("format"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    importer = TaskImporter(request.user, dry_run=request.POST.get("dry_run") in ("1", "true", "on"))
+    try:
+        importer.run(read_rows(text_stream(upload.file), fmt))
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "The file is not UTF-8 encoded.", **importer.summary()}, status=400)
+    return JsonResponse({
+        **importer.summary(),
+        "rows": [entry for entry in importer.report if entry["errors"]],
+    })
+
+@role_required('NPO_MANAGER')
+def task_matches_view(request, task_id):
+    """
+    Return the volunteers best matching one of the manager's tasks as JSON, best first.
+    The number of matches is set with ?k= (default 10, at most 100).
+    """
+    task = get_object_or_404(Task, pk=task_id, created_by=request.user)
+    try:
+        k = min(max(int(request.GET.get("k", 10)), 1), 100)
+    except ValueError:
+        k = 10
+    matches = matching_engine.top_k(task, k)
+    users = CustomUser.objects.in_bulk([user_id for user_id, _ in matches])
+    return JsonResponse({
+        "task": task.pk,
+        "matches": [
+            {"username": users[user_id].username, "score": round(score, 4)}
+            for user_id, score in matches if user_id in users
+        ],
+    })
+
+def interest_autocomplete_view(request):
+    """
+    Return the interest tags starting with ?q= as JSON, the most used first, for tag entry.
+    The number of tags is set with ?limit= (default 10, at most 50).
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    tags = interest_index.autocomplete(request.GET.get("q", ""), limit)
+    return JsonResponse({"tags": [{"name": name, "volunteers": count} for name, count in tags]})
+
+@role_required('NPO_MANAGER')
+def volunteers_by_interests_view(request):
+    """
+    Return the volunteers with the interests given as ?tags=a,b,c as JSON.
+    ?match=all (the default) wants every tag, ?match=any at least one of them.
+    At most ?limit= volunteers are listed (default 100, at most 1000), `count` has them all.
+    """
+    tags = [tag.strip() for tag in request.GET.get("tags", "").split(",") if tag.strip()]
+    match_all = request.GET.get("match", "all") != "any"
+    try:
+        limit = min(max(int(request.GET.get("limit", 100)), 1), 1000)
+    except ValueError:
+        limit = 100
+    profile_ids = interest_index.search(tags, match_all=match_all)
+    usernames = dict(
+        VolunteerProfile.objects.filter(pk__in=profile_ids[:limit]).values_list("pk", "user__username")
+    )
+    return JsonResponse({
+        "tags": tags,
+        "match": "all" if match_all else "any",
+        "count": len(profile_ids),
+        "volunteers": [usernames[pk] for pk in profile_ids[:limit] if pk in usernames],
+    })
 
 
 
@@ -123,119 +457,112 @@ def user_tasks_view(request, username):
 
 @csrf_exempt
 @unauthenticated_user
+@track_metrics('user')
+@schedule_inference('normal')
 def register_view(request):
-    chat_history = request.session.get("chat_history", [])
-    response = render(request, "user-registration.html", {"chat_history": chat_history})
+    with request.metrics.timer("history_load_seconds"):
+        conversation = get_conversation(request, "user")
+        chat_history = load_history(conversation)
 
     if request.method == "POST":
         user_input = request.POST.get("user_input")
-        user_schema = extract_user_schema(CustomUser)
-        chat_history = request.session.get("chat_history", [])
-
-        # Refined prompt to guide AI behavior
-        prompt = f'''In this chat, your goal is to help the visitor create a user profile in the Austrian volunteering portal.
-        Your role is to assist the user in providing and validating the following information:
-        - **User Information**: {json.dumps(user_schema, indent=2)}
-        Note:
-        1. The user's role is fixed as 'Volunteer' and cannot be changed.
-        2. Collect all fields from the user, validate their input for each field, and request corrections if needed. 
-        The user needs to confirm their password twice (in two separate messages).
-        3. When all fields are complete, output the finalized form in JSON format with the following phrasing:
-           "There is final version of JSON form:" followed by the JSON data.
-        4. If the system returns an error (e.g., duplicate username or email), provide suggestions to the user for resolving the issue.
-
-        Use the following chat history to guide your responses:
-        '''
-
-        for message in chat_history:
-            if message['role'] == 'user':
-                prompt += f"User: {message['message']}\n"
-            elif message['role'] == 'ai':
-                prompt += f"AI: {message['message']}\n"
-
-        prompt += f"User: {user_input}\nAI:"
+        state = FormState.load(conversation)
+
+        # Messages made only of field values are answered locally, the others by the model
+        prompt_messages, generate = prepare_form_turn(request, conversation, state, chat_history, user_input)
+
+        if wants_stream(request):
+            def create_user(ai_response, chat_history):
+                if complete_form(request, conversation, state, ai_response, chat_history, extract_and_create_user):
+                    return reverse('authentification:signin')
+                return None
+
+            return stream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                        on_complete=create_user, error_message="Error generating response.",
+                                        generate=generate)
 
         # Generate the AI response
         ai_response = ""
         try:
-            for chunk in generate_response(prompt):
+            for chunk in generate(prompt_messages):
                 ai_response += chunk
+        except SchedulerBusy:
+            raise  # Answered with 503 by schedule_inference
         except Exception as e:
             ai_response = f"Error generating response: {e}"
 
         # Add the user message and AI response to the chat history
+        turn_start = len(chat_history)
         chat_history.append({"role": "user", "message": user_input})
         chat_history.append({"role": "ai", "message": ai_response})
 
-        # Store the updated chat history in the session
-        request.session["chat_history"] = chat_history
+        # Take the collected fields, creating the user once the form is complete
+        success = complete_form(request, conversation, state, ai_response, chat_history, extract_and_create_user)
+
+        # Store the new turn in the conversation
+        with request.metrics.timer("history_save_seconds"):
+            append_messages(conversation, chat_history[turn_start:])
 
-        # Detect and process the finalized JSON response
-        if "There is final version of JSON form:" in ai_response:
-            success = extract_and_create_user(request, ai_response, chat_history)
-            if success:
-                return redirect('authentification:signin')
+        if success:
+            return redirect('authentification:signin')
 
         return render(request, "user-registration.html", {"chat_history": chat_history})
 
     # Render the initial page with chat history
-    return response
+    return render(request, "user-registration.html", {"chat_history": chat_history})
 
 @role_required('VOLUNTEER')
+@track_metrics('volunteer_onboard')
+@schedule_inference('normal')
 def volunteer_onboard_view(request):
-    chat_history = request.session.get("chat_history", [])
-    response = render(request, "vonboard.html", {"chat_history": chat_history})
+    with request.metrics.timer("history_load_seconds"):
+        conversation = get_conversation(request, "volunteer")
+        chat_history = load_history(conversation)
     if request.method == "POST":
         user_input = request.POST.get("user_input")
-        volunteer_schema = extract_volunteer_profile_schema(VolunteerProfile)
-        chat_history = request.session.get("chat_history", [])
-        prompt = f'''In this chat, your goal is to assist the user in creating their volunteer profile for the Austrian volunteering portal.
-        Your role is to help the user provide and validate the following information:
-        - **Volunteer Profile Schema**: {json.dumps(volunteer_schema, indent=2)}
-        Note:
-        1. The volunteer's user account is already linked, so you don't need to request user information. 
-        You need to help to create Volunteer Profile for existing user
-        2. Collect all fields from the user, validate their input for each field, and request corrections if needed. 
-        Field of interests (also called competences) is restricted by provided schema choices. Ask user to select one or more options from them 
-        and indicate level of competence(interest) from 0 to 3.
-        3. When all fields are complete, output the finalized form in JSON format with the following phrasing:
-           "There is final version of JSON form:" followed by the JSON data.
-        4. If the system encounters an error (e.g., invalid data), provide actionable suggestions for resolving the issue.
-
-        Use the following chat history to guide your responses:
-        '''
-
-        for message in chat_history:
-            if message['role'] == 'user':
-                prompt += f"User: {message['message']}\n"
-            elif message['role'] == 'ai':
-                prompt += f"AI: {message['message']}\n"
-
-        prompt += f"User: {user_input}\nAI:"
+        state = FormState.load(conversation)
+
+        # Messages made only of field values are answered locally, the others by the model
+        prompt_messages, generate = prepare_form_turn(request, conversation, state, chat_history, user_input)
+
+        if wants_stream(request):
+            def create_profile(ai_response, chat_history):
+                if complete_form(request, conversation, state, ai_response, chat_history,
+                                 extract_and_create_volunteer_profile):
+                    return reverse('authentification:index')
+                return None
+
+            return stream_chat_response(request, conversation, chat_history, prompt_messages, user_input,
+                                        on_complete=create_profile, error_message="Error generating response.",
+                                        generate=generate)
 
          # Generate the AI response
         ai_response = ""
         try:
-            for chunk in generate_response(prompt):
+            for chunk in generate(prompt_messages):
                 ai_response += chunk
+        except SchedulerBusy:
+            raise  # Answered with 503 by schedule_inference
         except Exception as e:
             ai_response = f"Error generating response: {e}"
 
         # Add the user message and AI response to the chat history
+        turn_start = len(chat_history)
         chat_history.append({"role": "user", "message": user_input})
         chat_history.append({"role": "ai", "message": ai_response})
 
-        # Store the updated chat history in the session
-        request.session["chat_history"] = chat_history
+        success = complete_form(request, conversation, state, ai_response, chat_history,
+                                extract_and_create_volunteer_profile)
 
-        if "There is final version of JSON form:" in ai_response:
-            success = extract_and_create_volunteer_profile(request, ai_response, chat_history)
-            if success:
-                return redirect('authentification:index')  # Redirect to the main page after successful onboarding
+        # Store the new turn in the conversation
+        with request.metrics.timer("history_save_seconds"):
+            append_messages(conversation, chat_history[turn_start:])
 
-        return render(request, "vonboard.html", {"chat_history": chat_history})
-    return render(request, "vonboard.html")
+        if success:
+            return redirect('authentification:index')  # Redirect to the main page after successful onboarding
 
+        return render(request, "vonboard.html", {"chat_history": chat_history})
+    return render(request, "vonboard.html", {"chat_history": chat_history})
 
 
 
@@ -243,11 +570,11 @@ def volunteer_onboard_view(request):
 
 
 def show_schema(request):
-    user_schema = extract_user_schema(CustomUser)
+    user_schema = prompt_registry.schema("user")
     user_schema_str = f"{user_schema}"
-    task_schema = extract_task_schema(Task) 
+    task_schema = prompt_registry.schema("task")
     task_schema_str =  f'''{task_schema}'''
-    volunteer_schema = extract_volunteer_profile_schema(VolunteerProfile)
+    volunteer_schema = prompt_registry.schema("volunteer")
     volunteer_schema_str = f'''{volunteer_schema}'''
     return HttpResponse(user_schema_str+task_schema_str+volunteer_schema_str)
 
@@ -0,0 +1,325 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+from taggit.utils import parse_tags
+
+from authentification.models import CustomUser, VolunteerProfile
+from chat.validators import parse_date
+
+# Columns every imported CSV file needs; the profile columns are optional
+VOLUNTEER_COLUMNS = ("username", "email", "first_name")
+
+PROFILE_FIELDS = ("gender", "short_description", "date_of_birth", "goal_statement", "competencies_areas", "schedule")
+
+GENDERS = {key for key, _ in VolunteerProfile._meta.get_field("gender").choices}
+AREAS = {key for key, _ in VolunteerProfile.FIELD_CHOICES}
+DAYS = {key for key, _ in VolunteerProfile.DAYS_OF_WEEK}
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def _json_value(value, kind):
+    """
+    A dict given as is (JSONL) or as JSON text (a CSV cell). Empty values give an empty dict.
+    """
+    if value in (None, ""):
+        return {}
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError(f"{kind} is not valid JSON.")
+    if not isinstance(value, dict):
+        raise ValueError(f"{kind} must be a JSON object.")
+    return value
+
+
+def clean_volunteer_row(row):
+    """
+    Validate one row: the account fields and the optional volunteer profile fields.
+
+    Returns:
+        tuple: (dict with "user", "profile", "interests" and "password", list of error messages).
+    """
+    errors = []
+    username = CustomUser.normalize_username(str(row.get("username") or "").strip())
+    email = CustomUser.objects.normalize_email(str(row.get("email") or "").strip())
+    first_name = str(row.get("first_name") or "").strip()
+    last_name = str(row.get("last_name") or "").strip()
+
+    if not username:
+        errors.append("Username is missing.")
+    else:
+        try:
+            CustomUser.username_validator(username)
+        except ValidationError as e:
+            errors.extend(e.messages)
+        if len(username) > _max_length(CustomUser, "username"):
+            errors.append("Username is too long.")
+    try:
+        validate_email(email)
+    except ValidationError:
+        errors.append(f"Email {email!r} is not a valid email address.")
+    if not first_name:
+        errors.append("First name is missing.")
+    elif len(first_name) > _max_length(CustomUser, "first_name"):
+        errors.append("First name is too long.")
+    if len(last_name) > _max_length(CustomUser, "last_name"):
+        errors.append("Last name is too long.")
+
+    profile = {field: row.get(field) for field in PROFILE_FIELDS}
+    if profile["gender"] in (None, ""):
+        profile["gender"] = None
+    elif profile["gender"] not in GENDERS:
+        errors.append(f"Gender must be one of {', '.join(sorted(GENDERS))}.")
+    if profile["date_of_birth"] in (None, ""):
+        profile["date_of_birth"] = None
+    elif parse_date(profile["date_of_birth"]) is None:
+        errors.append("Date of birth is not a date in YYYY-MM-DD format.")
+    else:
+        profile["date_of_birth"] = parse_date(profile["date_of_birth"])
+    profile["short_description"] = str(profile["short_description"] or "")
+    profile["goal_statement"] = str(profile["goal_statement"] or "")
+
+    try:
+        profile["competencies_areas"] = areas = _json_value(profile["competencies_areas"], "Competencies areas")
+        for area, level in areas.items():
+            if area not in AREAS:
+                errors.append(f"Invalid competence area: {area}.")
+            elif not isinstance(level, int) or isinstance(level, bool) or not 0 <= level <= 3:
+                errors.append(f"Competence level of {area} must be a whole number from 0 to 3.")
+    except ValueError as e:
+        errors.append(str(e))
+    try:
+        profile["schedule"] = schedule = _json_value(profile["schedule"], "Schedule")
+        for day, time_ranges in schedule.items():
+            if day not in DAYS:
+                errors.append(f"Invalid day: {day}.")
+            # The model's time range check does not use the instance
+            elif not isinstance(time_ranges, list) or not all(
+                VolunteerProfile._is_valid_time_range(None, time_range) for time_range in time_ranges
+            ):
+                errors.append(f"Time ranges of {day} must be a list of 'HH:MM-HH:MM'.")
+    except ValueError as e:
+        errors.append(str(e))
+
+    interests = row.get("interests") or []
+    if isinstance(interests, str):
+        interests = parse_tags(interests)
+    elif not isinstance(interests, list) or not all(isinstance(tag, str) for tag in interests):
+        errors.append("Interests must be a list of tag names.")
+        interests = []
+
+    if errors:
+        return None, errors
+    user = {"username": username, "email": email, "first_name": first_name, "last_name": last_name}
+    password = row.get("password") or None
+    return {"user": user, "profile": profile, "interests": interests, "password": password}, errors
+
+
+def hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+class VolunteerImporter:
+    """
+    Create volunteer accounts with their profiles and interest tags from rows of a CSV or JSONL file.
+
+    Password hashing (PBKDF2, a large part of a second per password) is what makes creating
+    accounts one by one slow, so the pipeline spreads it over a pool of `workers` processes:
+    while the pool hashes the passwords of one batch, the previous batch is written to the
+    database. Every batch is written in one transaction with a bulk_create each for the users,
+    the profiles (availability compiled from the schedule first), new tags and the tag links.
+    Rows without a password get an unusable one and need a password reset to sign in.
+
+    bulk_create sends no post_save or m2m_changed signals, so the matching engine and the
+    interest index of running servers only see the new volunteers after their next reload.
+
+    Every row gets an entry in `report` as in TaskImporter.
+    """
+
+    def __init__(self, batch_size=500, workers=None, dry_run=False):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.dry_run = dry_run
+        self.report = []
+        self.created = 0
+        self.valid = 0
+        self.invalid = 0
+        self.failed = 0
+        self._usernames = set()
+        self._emails = set()
+
+    @contextmanager
+    def _hasher(self):
+        """
+        Yield a function starting to hash a list of passwords and returning an iterator of the hashes.
+        """
+        if self.dry_run:
+            yield lambda passwords: iter(())
+            return
+        if self.workers <= 1:
+            yield lambda passwords: iter(hash_passwords(passwords))
+            return
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup) as pool:
+            def start(passwords):
+                chunk = max(1, len(passwords) // (self.workers * 4))
+                chunks = [passwords[i:i + chunk] for i in range(0, len(passwords), chunk)]
+                return (digest for digests in pool.map(hash_passwords, chunks) for digest in digests)
+            yield start
+
+    def run(self, rows):
+        """
+        Import rows as yielded by read_rows(). Returns self, for the counts and the report.
+        """
+        with self._hasher() as start_hashing:
+            pending = None
+            for batch in self._batches(rows):
+                hashes = start_hashing([entry["password"] for _, entry in batch if entry["password"]])
+                if pending:
+                    self._write(*pending)
+                pending = (batch, hashes)
+            if pending:
+                self._write(*pending)
+        self.report.sort(key=lambda entry: entry["line"])
+        return self
+
+    def _invalid(self, line_number, errors):
+        self.invalid += 1
+        self.report.append({"line": line_number, "status": "invalid", "errors": errors})
+
+    def _batches(self, rows):
+        """
+        Yield batches of valid rows as [(line number, cleaned row)], unique within the file and the database.
+        """
+        batch = []
+        for line_number, row, error in rows:
+            entry, errors = (None, [error]) if error else clean_volunteer_row(row)
+            if errors:
+                self._invalid(line_number, errors)
+                continue
+            username, email = entry["user"]["username"], entry["user"]["email"]
+            if username in self._usernames or email in self._emails:
+                self._invalid(line_number, ["Username or email appears earlier in the file."])
+                continue
+            self._usernames.add(username)
+            self._emails.add(email)
+            batch.append((line_number, entry))
+            if len(batch) >= self.batch_size:
+                yield self._drop_existing(batch)
+                batch = []
+        if batch:
+            yield self._drop_existing(batch)
+
+    def _drop_existing(self, batch):
+        usernames = {entry["user"]["username"] for _, entry in batch}
+        emails = {entry["user"]["email"] for _, entry in batch}
+        taken_usernames = set(CustomUser.objects.filter(username__in=usernames).values_list("username", flat=True))
+        taken_emails = set(CustomUser.objects.filter(email__in=emails).values_list("email", flat=True))
+        kept = []
+        for line_number, entry in batch:
+            if entry["user"]["username"] in taken_usernames or entry["user"]["email"] in taken_emails:
+                self._invalid(line_number, ["A user with this username or email already exists."])
+            else:
+                kept.append((line_number, entry))
+        return kept
+
+    def _write(self, batch, hashes):
+        if not batch:
+            return
+        if self.dry_run:
+            status, errors = "valid", []
+        else:
+            hashes = iter(list(hashes))
+            users = [
+                CustomUser(
+                    role="VOLUNTEER",
+                    password=next(hashes) if entry["password"] else make_password(None),
+                    **entry["user"],
+                )
+                for _, entry in batch
+            ]
+            try:
+                with transaction.atomic():
+                    self._insert(users, [entry for _, entry in batch])
+                status, errors = "created", []
+            except DatabaseError as e:
+                status, errors = "failed", [f"Database error: {e}"]
+        for line_number, _ in batch:
+            self.report.append({"line": line_number, "status": status, "errors": errors})
+        if status == "created":
+            self.created += len(batch)
+        elif status == "valid":
+            self.valid += len(batch)
+        else:
+            self.failed += len(batch)
+
+    def _insert(self, users, entries):
+        CustomUser.objects.bulk_create(users)
+        if any(user.pk is None for user in users):
+            # Databases that cannot return the ids of inserted rows
+            ids = dict(CustomUser.objects.filter(username__in=[user.username for user in users])
+                       .values_list("username", "pk"))
+            for user in users:
+                user.pk = ids[user.username]
+
+        profiles = []
+        for user, entry in zip(users, entries):
+            profile = VolunteerProfile(user_id=user.pk, **entry["profile"])
+            profile.sync_availability()
+            profiles.append(profile)
+        VolunteerProfile.objects.bulk_create(profiles)
+        if any(profile.pk is None for profile in profiles):
+            ids = dict(VolunteerProfile.objects.filter(user_id__in=[user.pk for user in users])
+                       .values_list("user_id", "pk"))
+            for profile in profiles:
+                profile.pk = ids[profile.user_id]
+
+        self._tag(profiles, [entry["interests"] for entry in entries])
+
+    def _tag(self, profiles, interests):
+        """
+        Link the profiles to their interest tags, creating the missing tags, with a bulk_create each.
+        """
+        through = VolunteerProfile.interests.through
+        tag_model = through.tag_model()
+        names = {name for tags in interests for name in tags}
+        if not names:
+            return
+        tag_ids = dict(tag_model.objects.filter(name__in=names).values_list("name", "pk"))
+        missing = names - tag_ids.keys()
+        if missing:
+            tag_model.objects.bulk_create(
+                [tag_model(name=name, slug=tag_model(name=name).slugify(name)) for name in missing],
+                ignore_conflicts=True,
+            )
+            tag_ids.update(tag_model.objects.filter(name__in=missing).values_list("name", "pk"))
+            for name in names - tag_ids.keys():
+                # Slug taken by a differently written tag; taggit's save() finds a free one
+                tag_ids[name] = tag_model.objects.create(name=name).pk
+
+        content_type = ContentType.objects.get_for_model(VolunteerProfile)
+        through.objects.bulk_create([
+            through(content_type=content_type, object_id=profile.pk, tag_id=tag_ids[name])
+            for profile, tags in zip(profiles, interests)
+            for name in set(tags)
+        ])
+
+    def summary(self):
+        return {
+            "created": self.created,
+            "valid": self.valid,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "dry_run": self.dry_run,
+        }
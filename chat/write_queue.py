@@ -0,0 +1,126 @@
+import asyncio
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+
+class WriteQueue:
+    """
+    A single writer thread per process that commits small writes in groups.
+
+    SQLite has one writer at a time. When every request thread opens its own write
+    transaction, they queue up on the database lock (and give up with "database is locked"
+    after the busy timeout), and every transaction pays its own commit. Here the writes are
+    handed to one thread instead: it takes whatever has queued up while the last commit ran,
+    runs each write in a savepoint of one shared transaction, and commits them together.
+    A failing write only rolls back its own savepoint and the caller gets its exception; if
+    the commit itself fails the writes are retried each in its own transaction.
+
+    Callers wait for their write to be committed, so the queue changes when writes happen,
+    not what a request sees afterwards. With settings.SQLITE_WRITE_QUEUE off the writes run
+    directly in the calling thread.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a write and return a Future of its result.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """
+        Run a write in the writer thread and return its result once it is committed.
+        """
+        if not settings.SQLITE_WRITE_QUEUE or threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    async def arun(self, func, *args, **kwargs):
+        """
+        Async counterpart of run().
+        """
+        if not settings.SQLITE_WRITE_QUEUE:
+            return await sync_to_async(func)(*args, **kwargs)
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stopping = False
+            while len(batch) < settings.SQLITE_WRITE_BATCH_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                break
+        connection.close()
+
+    def _commit(self, batch):
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # The thread's connection lives on between batches; replace it once it is broken or past CONN_MAX_AGE
+        connection.close_if_unusable_or_obsolete()
+        try:
+            with transaction.atomic():
+                outcomes = [self._run(item) for item in batch]
+        except Exception:
+            # The commit failed, typically a foreign key that SQLite only checks at COMMIT, and
+            # took every write with it: commit them one by one to fail only the culprit
+            outcomes = [self._run(item) for item in batch]
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    @staticmethod
+    def _run(item):
+        """
+        Run one write in a savepoint (or its own transaction), returning (future, result, exception).
+        """
+        future, func, args, kwargs = item
+        try:
+            with transaction.atomic():
+                return future, func(*args, **kwargs), None
+        except Exception as e:
+            return future, None, e
+
+
+write_queue = WriteQueue()
+atexit.register(write_queue.stop)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -85,6 +88,78 @@ DATABASES = {
     }
 }
 
+# Database profile, DATABASE_PROFILE=production for a server under concurrent traffic.
+# The production profile puts SQLite in WAL mode (readers never wait for the writer), keeps
+# connections open between requests and commits session and chat message writes in groups
+# from one writer thread per process, see chat/sqlite.py and chat/write_queue.py.
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+
+# PRAGMAs run on every new SQLite connection
+
+SQLITE_PRAGMAS = {}
+
+# Send session and chat message writes through the writer thread, at most this many per transaction
+
+SQLITE_WRITE_QUEUE = False
+
+SQLITE_WRITE_BATCH_SIZE = 100
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        # Seconds a connection waits for the write lock before "database is locked"
+        'OPTIONS': {'timeout': 20},
+    })
+    if django.VERSION >= (5, 1):
+        # Take the write lock when a transaction starts; upgrading a read transaction later
+        # fails at once in WAL mode if another connection wrote in between
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        # Safe with WAL: a power loss can drop the last commits but never corrupts the database
+        'synchronous': 'NORMAL',
+        # 64 MB page cache per connection (negative values are KiB)
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    SQLITE_WRITE_QUEUE = True
+
+
+# Sessions, see chat/sessions.py
+# The production profile stores them compressed and writes them through the write queue.
+# Expired sessions are deleted by `manage.py prune_sessions` (run it from cron).
+
+if DATABASE_PROFILE == 'production':
+    SESSION_ENGINE = 'chat.sessions'
+    SESSION_SERIALIZER = 'chat.sessions.CompactSessionSerializer'
+
+# Rows deleted per statement when pruning
+
+SESSION_PRUNE_BATCH_SIZE = 1000
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The chat response cache lives on disk so every worker process on the host shares it.
+# Point it at a Redis or Memcached server when the workers run on several machines.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'chat_responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'chat_responses',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -122,6 +197,148 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Ollama server
+# Connections are pooled per worker process; size the pool for the number of threads
+# (or concurrent async requests) one worker serves.
+
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://127.0.0.1:11434')
+
+# Inference nodes the requests are balanced over, e.g. OLLAMA_HOSTS="http://gpu1:11434,http://gpu2:11434"
+OLLAMA_HOSTS = [host for host in os.environ.get('OLLAMA_HOSTS', OLLAMA_HOST).split(',') if host]
+
+# Seconds between health probes of every node, and failures before a node is ejected
+OLLAMA_HEALTH_INTERVAL = 10
+
+OLLAMA_MAX_FAILURES = 3
+
+OLLAMA_MODEL = 'test-npo'
+
+OLLAMA_CONNECT_TIMEOUT = 5
+
+# Longest silence allowed between two streamed chunks before the request is aborted
+OLLAMA_READ_TIMEOUT = 120
+
+OLLAMA_POOL_SIZE = 16
+
+OLLAMA_KEEPALIVE_EXPIRY = 60
+
+OLLAMA_EMBED_MODEL = 'nomic-embed-text'
+
+
+# Inference scheduling, see chat/scheduler.py
+# Generations running at once per worker process: Ollama's OLLAMA_NUM_PARALLEL divided by
+# the number of worker processes. Requests beyond the queue length get a 503 with Retry-After.
+
+INFERENCE_MAX_CONCURRENCY = 4
+
+INFERENCE_MAX_QUEUE = 32
+
+# Seconds a queued request waits for a slot before giving up
+INFERENCE_QUEUE_TIMEOUT = 60
+
+
+# Chat prompt size
+# The prompt (instructions, history and the new message) is kept under this many estimated
+# tokens, leaving room for the reply inside Ollama's default 2048-token context window.
+
+CHAT_PROMPT_TOKEN_BUDGET = 1536
+
+# Part of the budget reserved for the summary of turns that were dropped from the prompt
+
+CHAT_HISTORY_SUMMARY_TOKENS = 256
+
+# Number of most recent messages loaded from a conversation for the page and the prompt
+
+CHAT_HISTORY_LOAD_LIMIT = 100
+
+# Most recent messages in the prompts of the form flows; the fields collected before them are
+# carried by the form state instead, see chat/form_state.py
+
+FORM_PROMPT_HISTORY_MESSAGES = 2
+
+# Generate the final form of the task, user and volunteer flows with Ollama structured
+# output constrained to a JSON Schema of the model, see chat/extraction.py
+
+CHAT_STRUCTURED_OUTPUT = False
+
+
+# Cache of answers to /chat/ questions, see chat/cache.py
+# The semantic tier needs the embedding model: `ollama pull nomic-embed-text`
+
+CHAT_CACHE_ENABLED = True
+
+CHAT_CACHE_SEMANTIC = False
+
+CHAT_CACHE_SIMILARITY_THRESHOLD = 0.92
+
+CHAT_CACHE_SEMANTIC_MAX_ENTRIES = 500
+
+
+# Volunteer matching, see chat/matching.py
+# Seconds before the matching arrays are reloaded to pick up profiles changed by other workers
+
+MATCHING_RELOAD_SECONDS = 300
+
+
+# Interest tag index, see chat/interests.py
+# Seconds before the index is reloaded to pick up tags changed by other workers
+
+INTEREST_INDEX_RELOAD_SECONDS = 300
+
+
+# Retrieval of portal content for /chat/ answers, see chat/retrieval.py
+# The index is built with `python manage.py build_rag_index` and needs the embedding model
+# (`ollama pull nomic-embed-text`); without an index /chat/ answers from the prompt alone.
+
+RAG_ENABLED = True
+
+RAG_INDEX_DIR = BASE_DIR / 'rag_index'
+
+RAG_FAQ_PATH = BASE_DIR / 'chat' / 'faq.json'
+
+# Seconds between checks for a rebuilt index
+
+RAG_RELOAD_SECONDS = 60
+
+# Documents added to the prompt at most, and the cosine similarity they need to reach
+
+RAG_TOP_K = 4
+
+RAG_MIN_SIMILARITY = 0.35
+
+# Estimated tokens the retrieved content may take out of CHAT_PROMPT_TOKEN_BUDGET
+
+RAG_CONTEXT_TOKENS = 384
+
+
+# Metrics of the chat views, see chat/metrics.py
+# Addresses allowed to read /metrics/ without signing in as staff (e.g. the Prometheus server)
+
+CHAT_METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.0/topics/logging/
+# The chat app logs ejected and re-admitted Ollama nodes, failed embeddings and unreadable
+# retrieval indexes under the `chat` logger; CHAT_LOG_LEVEL=WARNING keeps only the problems.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'chat': {
+            'handlers': ['console'],
+            'level': os.environ.get('CHAT_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 